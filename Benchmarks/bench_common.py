@@ -0,0 +1,78 @@
+# Helpers shared by the benchmark scripts in Benchmarks/ - timing, run
+# metadata, and comparing against a previous run's JSON results.
+import os, re, json, gc, time, platform, argparse, subprocess, datetime
+
+def time_best(func, repeat):
+    # Returns the best wall time over repeat runs, with GC paused so a
+    # collection in the middle of a run doesn't skew things
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def repeat_for(size, repeat, medium, large):
+    # Keep the huge inputs to a single pass - and medium ones to 3
+    if size >= large:
+        return 1
+    if size >= medium:
+        return min(repeat, 3)
+    return repeat
+
+def git_commit():
+    try:
+        p = subprocess.Popen(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        return p.communicate()[0].decode().strip() or None
+    except Exception:
+        return None
+
+def meta(repeat, **extra):
+    # What a run's results were measured on
+    out = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "repeat": repeat
+    }
+    out.update(extra)
+    return out
+
+def compare(current, previous_path, columns):
+    # Prints the ratio of each matching result against a previous run -
+    # results are matched on the passed [(key, width)] columns, and peak
+    # memory is compared too where both runs measured it
+    with open(previous_path) as f:
+        previous = json.load(f)
+    key = lambda r: tuple(r.get(k) for k, w in columns)
+    old = dict((key(r), r) for r in previous.get("results", []))
+    row = " ".join("{:<" + str(w) + "}" for k, w in columns)
+    print("")
+    print("Compared to {} ({}):".format(previous_path, previous.get("meta", {}).get("commit") or "unknown commit"))
+    for r in current["results"]:
+        o = old.get(key(r))
+        if not o or not o.get("seconds"):
+            continue
+        line = "{} {:>6.2f}x".format(row.format(*key(r)), o["seconds"] / r["seconds"])
+        if o.get("peak_bytes") and r.get("peak_bytes"):
+            line += " time, {:>6.2f}x memory".format(o["peak_bytes"] / float(r["peak_bytes"]))
+        print(line)
+
+def parse_size(text):
+    # "100KB" -> 102400
+    m = re.match(r"^\s*(\d+)\s*([KMG]?)B?\s*$", text, re.I)
+    if not m:
+        raise argparse.ArgumentTypeError("Invalid size: {}".format(text))
+    return int(m.group(1)) << {"": 0, "K": 10, "M": 20, "G": 30}[m.group(2).upper()]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Benchmarks parsing ioreg -lw0 output in Scripts/ioreg.py - decoding the
+# whole capture and splitting it into lines first ("split"), against handing
+# the raw bytes to the parser ("bytes") - over synthetic captures and any
+# recorded captures dropped in Benchmarks/corpus.  Passing -w times
+# get_all_devices() alone sharded across each number of worker processes.
+#
+# Results are written as JSON so runs can be compared across commits:
+#
+#   python Benchmarks/ioreg_bench.py -o before.json
+#   python Benchmarks/ioreg_bench.py -o after.json -c before.json
+import os, sys, json, platform, argparse, subprocess, multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import ioreg, ioquery
+import bench_common, ioreg_gen
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "corpus")
+SIZES = (
+    ("100KB", 100 << 10),
+    ("1MB",   1 << 20),
+    ("10MB",  10 << 20),
+    ("100MB", 100 << 20)
+)
+MODES = ("split", "bytes")
+
+###                 ###
+# Synthetic Captures #
+###                 ###
+
+def build_capture(target):
+    # Scale the entry count from a small sample, then rescale a couple of
+    # times as the fixed entries skew small captures - see ioreg_gen.py for
+    # what the captures hold
+    count = 1000
+    data = ioreg_gen.make_registry(count)[0]
+    for _ in range(3):
+        if abs(len(data) - target) <= target // 10:
+            break
+        count = max(1, int(count * target / float(len(data))))
+        data = ioreg_gen.make_registry(count)[0]
+    return data
+
+###           ###
+# Timing Helpers #
+###           ###
+
+def _parse(data, mode):
+    # What the report does with a fresh capture - resolve every device and
+    # the codecs hanging off of them
+    i = ioreg.IOReg()
+    if mode == "split":
+        i.ioreg["IOService"] = data.decode("utf-8", "ignore").split("\n")
+    else:
+        i.ioreg["IOService"] = ioquery.BufferLines(data)
+    devices = i.get_all_devices(plane="IOService")
+    codecs = i.get_codecs(plane="IOService")
+    return devices, codecs
+
+def _parse_sharded(data, workers):
+    # Just the device walk - one worker parses serially
+    i = ioreg.IOReg()
+    i.shard_threshold = 0
+    i.ioreg["IOService"] = ioquery.BufferLines(data)
+    return i.get_all_devices(plane="IOService", workers=workers)
+
+def bench_capture(name, data, repeat, modes, workers=(), **extra):
+    results = []
+    runs = bench_common.repeat_for(len(data), repeat, 1 << 20, 10 << 20)
+    timings = [(mode, lambda mode=mode: _parse(data, mode)) for mode in modes]
+    timings += [("w{}".format(w), lambda w=w: _parse_sharded(data, w)) for w in workers]
+    for mode, func in timings:
+        seconds = bench_common.time_best(func, runs)
+        result = {
+            "name": name,
+            "mode": mode,
+            "bytes": len(data),
+            "seconds": seconds,
+            "mb_per_sec": len(data) / seconds / (1 << 20) if seconds else None,
+            "runs": runs
+        }
+        result.update(extra)
+        results.append(result)
+    return results
+
+###             ###
+# Corpus Handling #
+###             ###
+
+def record_corpus():
+    # Captures the current machine's IOService plane to the corpus
+    if not sys.platform.startswith("darwin"):
+        print("Recording requires macOS")
+        return []
+    if not os.path.isdir(CORPUS_DIR):
+        os.makedirs(CORPUS_DIR)
+    out = subprocess.Popen(
+        ["ioreg", "-lw0", "-p", "IOService"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    ).communicate()[0]
+    if not out:
+        return []
+    path = os.path.join(CORPUS_DIR, "IOService-{}.ioreg".format(platform.node() or "local"))
+    with open(path, "wb") as f:
+        f.write(out)
+    return [path]
+
+def iter_corpus(corpus_dir):
+    if not os.path.isdir(corpus_dir):
+        return
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith(".ioreg"):
+            continue
+        path = os.path.join(corpus_dir, name)
+        with open(path, "rb") as f:
+            yield name, f.read()
+
+###   ###
+# Runs #
+###   ###
+
+def run(sizes, modes, corpus_dir, repeat, workers=(), quiet=False):
+    results = []
+    def report(entries):
+        results.extend(entries)
+        if quiet:
+            return
+        for r in entries:
+            print("{:<28} {:<6} {:>12,} B {:>10.2f} ms {:>8.1f} MB/s".format(
+                r["name"], r["mode"], r["bytes"], r["seconds"] * 1000, r["mb_per_sec"] or 0
+            ))
+    for label, target in sizes:
+        report(bench_capture("synthetic-{}".format(label), build_capture(target), repeat, modes, workers, size=label))
+    for name, data in iter_corpus(corpus_dir):
+        report(bench_capture(name, data, repeat, modes, workers, size="recorded"))
+    return {
+        "meta": bench_common.meta(repeat, cpus=multiprocessing.cpu_count()),
+        "results": results
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks ioreg parsing in Scripts/ioreg.py")
+    parser.add_argument("-o", "--output", help="write results as JSON to this path")
+    parser.add_argument("-c", "--compare", help="a previous JSON result to compare against")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated modes to run (default: {})".format(",".join(MODES)))
+    parser.add_argument("-m", "--max-size", type=bench_common.parse_size, default=SIZES[-1][1], help="largest synthetic capture to build (default: 100MB)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per measurement for small captures (default: 5)")
+    parser.add_argument("-w", "--workers", default="", help="comma separated worker counts to time sharded device parsing with (e.g. 1,2,4,8)")
+    parser.add_argument("-d", "--corpus", default=CORPUS_DIR, help="directory of recorded .ioreg captures (default: Benchmarks/corpus)")
+    parser.add_argument("--record", action="store_true", help="capture this Mac's IOService plane to the corpus first")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the comparison (if any)")
+    args = parser.parse_args()
+
+    if args.record:
+        for path in record_corpus():
+            print("Recorded {}".format(path))
+    modes = [m.strip() for m in args.modes.split(",") if m.strip() in MODES]
+    sizes = [s for s in SIZES if s[1] <= args.max_size]
+    workers = [int(w) for w in args.workers.split(",") if w.strip().isdigit() and int(w) > 0]
+    out = run(sizes, modes, args.corpus, max(1, args.repeat), workers, quiet=args.quiet)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    if args.compare:
+        bench_common.compare(out, args.compare, [("name", 28), ("mode", 6)])
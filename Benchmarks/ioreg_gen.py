@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# Generates synthetic ioreg -lw0 -p IOService captures of a given number of
+# registry entries (1k to 1M and beyond) - shaped like a real machine's:
+# PciRoots with their _UIDs, root ports and Thunderbolt style bridges
+# chained below them, HDEF with its codecs, a discrete GPU with HDAU, LPCB
+# with its ACPI devices, CPUs, and full property blocks on every entry.
+#
+#   python Benchmarks/ioreg_gen.py 100k -o IOService-100k.ioreg
+#
+# Captures are deterministic - the same size always gives the same bytes.
+import sys, io, re, argparse
+
+# Endpoints hung off of the bridges - (name, vendor, device, class code,
+# driver class, child entries below the driver, model)
+ENDPOINTS = (
+    ("XHC@0", 0x8086, 0x15f0, 0x0c0330, "AppleUSBXHCITR", ("AppleUSB30XHCIPort", "SS", 2), "JHL7540 Thunderbolt 3 USB Controller"),
+    ("pci14e4,1686@0", 0x14e4, 0x1686, 0x020000, "AppleBCM5701Ethernet", ("IOEthernetInterface", "en", 1), "BCM57766 Gigabit Ethernet"),
+    ("pci144d,a808@0", 0x144d, 0xa808, 0x010802, "IONVMeController", ("IONVMeBlockStorageDevice", "NVMe", 1), "SM981/PM981"),
+    ("pci1b4b,9235@0", 0x1b4b, 0x9235, 0x010601, "AppleAHCI", ("AppleAHCIPort", "PRT", 2), "88SE9235 SATA Controller"),
+    ("ARPT@0", 0x14e4, 0x43a0, 0x028000, "AirPort_BrcmNIC", ("IO80211Interface", "en", 1), "BCM4360 802.11ac")
+)
+# The device at the very end of the capture - unique, so looking it up
+# always walks the whole registry
+TAIL = ("SSD0@0", 0x144d, 0xa80a, 0x010802, "IONVMeController", ("IONVMeBlockStorageDevice", "NVMe", 1), "980 PRO")
+# ACPI devices below LPCB
+LPC_DEVICES = ("EC@0", "PS2K@0", "HPET@0", "RTC@70", "TIMR@40", "PMCR@0", "FWHD@0", "DMAC@0")
+SIZES = (
+    ("1k",   1000),
+    ("10k",  10000),
+    ("100k", 100000),
+    ("1M",   1000000)
+)
+POWER = '{"DevicePowerState"=2,"CurrentPowerState"=2,"CapabilityFlags"=32768,"MaxPowerState"=2,"DriverPowerState"=2}'
+
+###              ###
+# Registry Entries #
+###              ###
+
+def _node(name, clss, props=(), children=()):
+    # children is a list of nodes - or a function returning one, so the
+    # tree below an entry is only built as it's written out
+    return (name, clss, props, children)
+
+def _le32(value):
+    # Property data the way ioreg shows a 32-bit little endian int
+    return "<{}>".format("".join("{:02x}".format((value >> (8 * x)) & 0xFF) for x in range(4)))
+
+def _addr(name):
+    # "RP01@1C,4" -> (0x1C, 4)
+    addr = name.split("@")[-1].split(",")
+    return int(addr[0], 16), int(addr[1], 16) if len(addr) > 1 else 0
+
+def _acpi_addr(name):
+    # "RP01@1C,4" -> "RP01@1c0004", as in an acpi-path
+    dev, fn = _addr(name)
+    return "{}@{:x}".format(name.split("@")[0], (dev << 16) + fn)
+
+class _Builder:
+    def __init__(self):
+        self.bus = 0
+        self.paths = {}
+
+    def pci(self, name, vendor, device, class_code, acpi, pci_path, model=None, children=(), extra=()):
+        # An IOPCIDevice with the properties AppleACPIPCI publishes
+        self.bus += 1
+        dev, fn = _addr(name)
+        ids = "pci{:x},{:x}".format(vendor, device)
+        props = [
+            ("assigned-addresses", "<{:08x}{:08x}0000000000000000{:08x}>".format(0x82000010 + (dev << 11) + (fn << 8), self.bus << 20, 0x4000)),
+            ("IOInterruptSpecifiers", "(<{:08x}00000000>)".format(16 + self.bus % 8)),
+            ("class-code", _le32(class_code)),
+            ("vendor-id", _le32(vendor)),
+            ("device-id", _le32(device)),
+            ("revision-id", _le32(0x10)),
+            ("subsystem-vendor-id", _le32(0x106b)),
+            ("subsystem-id", _le32(0x0180 + self.bus % 64)),
+            ("compatible", '<"pci106b,{:x}","{}","pciclass,{:06x}">'.format(0x0180 + self.bus % 64, ids, class_code)),
+            ("IOName", '"{}"'.format(name.split("@")[0] if not name.startswith("pci") else ids)),
+            ("name", '<"{}">'.format(ids)),
+            ("reg", "<{:08x}000000000000000000000000>".format((self.bus << 16) + (dev << 11) + (fn << 8))),
+            ("pcidebug", '"{}:{}:{}"'.format(self.bus, dev, fn)),
+            ("acpi-path", '"IOACPIPlane:{}"'.format(acpi)),
+            ("IOPCIExpressLinkCapabilities", "{}".format(0x7a4c43)),
+            ("IOPCIExpressLinkStatus", "{}".format(0x7043)),
+            ("IOPowerManagement", POWER)
+        ]
+        if model:
+            props.append(("model", '<"{}">'.format(model)))
+        props.extend(extra)
+        self.paths[name] = "/".join(pci_path)
+        return _node(name, "IOPCIDevice", props, children)
+
+    def endpoint(self, spec, acpi, pci_path, budget=0):
+        # An endpoint, its driver and whatever the driver publishes - as
+        # many ports/interfaces as fit in budget
+        name, vendor, device, class_code, driver, (child_class, prefix, count), model = spec
+        count = max(count, min(15, budget - 2))
+        acpi += "/" + _acpi_addr(name)
+        pci_path = pci_path + ["Pci(0x0,0x0)"]
+        children = [_node("{}{}@{}".format(prefix, x + 1, x + 1), child_class, [
+            ("IOClass", '"{}"'.format(child_class)),
+            ("port", _le32(x + 1)),
+            ("UsbPowerSinkCapability", "0"),
+            ("locationID", "{}".format((self.bus << 24) + ((x + 1) << 20))),
+            ("IOReportLegend", "(" + ",".join('{{"IOReportChannels"=(({},"Port {}","Count"))}}'.format(0x7374617465000000 + c, c) for c in range(4)) + ")"),
+            ("IOPowerManagement", POWER)
+        ]) for x in range(count)]
+        return self.pci(name, vendor, device, class_code, acpi, pci_path, model, [
+            _node(driver, driver, [("IOClass", '"{}"'.format(driver)), ("IOProviderClass", '"IOPCIDevice"'), ("IOProbeScore", "0")], children)
+        ])
+
+    def bridge(self, name, device, acpi, pci_path, build):
+        # A PCI-PCI bridge - build(acpi, pci_path) returns what's below it
+        acpi += "/" + _acpi_addr(name)
+        dev, fn = _addr(name)
+        pci_path = pci_path + ["Pci(0x{:X},0x{:X})".format(dev, fn)]
+        return self.pci(name, 0x8086, device, 0x060400, acpi, pci_path, None, [
+            _node("IOPP", "IOPCI2PCIBridge", [("IOClass", '"IOPCI2PCIBridge"'), ("IOPCIConfigured", "Yes")], lambda: build(acpi, pci_path))
+        ], extra=[("PCI-Thunderbolt", "<01000000>")] if name.startswith(("UPSB", "DSB")) else ())
+
+    def subtree(self, budget, acpi, pci_path, index, tail=False):
+        # Fills about budget entries below a bridge - a single endpoint if
+        # that's all that fits, or a Thunderbolt switch whose downstream
+        # ports each get a share (chained as deep as it takes)
+        if budget < 16:
+            spec = TAIL if tail else ENDPOINTS[index % len(ENDPOINTS)]
+            return [self.endpoint(spec, acpi, pci_path, budget)]
+        ports = min(8, max(2, (budget - 2) // 8))
+        share = (budget - 2) // ports - 2
+        def downstream(acpi, pci_path):
+            return [self.bridge("DSB{}@{:X}".format(x, x), 0x15ef, acpi, pci_path, lambda acpi, pci_path, x=x: self.subtree(
+                share, acpi, pci_path, index + x, tail and x == ports - 1
+            )) for x in range(ports)]
+        return [self.bridge("UPSB@0", 0x15ef, acpi, pci_path, downstream)]
+
+###            ###
+# Whole Captures #
+###            ###
+
+def _fixed(roots, cpus):
+    # Entries that don't scale with the size
+    return 6 + 2 * cpus + 2 * roots + 29
+
+def build_tree(nodes):
+    # Returns (root node, info) for a registry of about the passed number of
+    # entries - info has the names of the PciRoots and the device path of
+    # each PCI device by name ("HDEF@1F,3", "HDAU@0,1", the last one, etc -
+    # repeated names keep the last path)
+    b = _Builder()
+    roots = max(1, min(8, nodes // 100000))
+    cpus = 16
+    budget = max(0, nodes - _fixed(roots, cpus))
+    per_root = budget // roots
+    ports = max(1, min(24, per_root // 32))
+    per_port = max(1, per_root // ports - 3)
+
+    def root(r):
+        name = "PC{:02X}@0".format(r)
+        acpi = "/_SB/" + name
+        pci_path = ["PciRoot(0x{:X})".format(r)]
+        children = []
+        if r == 0:
+            children.append(b.bridge("PEG0@1", 0x1901, acpi, pci_path, lambda acpi, pci_path: [
+                b.pci("GFX0@0", 0x1002, 0x67df, 0x030000, acpi + "/GFX0@0", pci_path + ["Pci(0x0,0x0)"], "Radeon RX 580", [
+                    _node("AMDRadeonX4000_AMDBaffinGraphicsAccelerator", "AMDRadeonX4000_AMDBaffinGraphicsAccelerator", [("IOClass", '"AMDRadeonX4000_AMDBaffinGraphicsAccelerator"')])
+                ], extra=[("hda-gfx", '<"onboard-2">')]),
+                b.pci("HDAU@0,1", 0x1002, 0xaaf0, 0x040300, acpi + "/HDAU@1", pci_path + ["Pci(0x0,0x1)"], "Ellesmere HDMI Audio", [
+                    _node("AppleHDAController@0,1", "AppleHDAController", [("IOClass", '"AppleHDAController"')], [
+                        _node("IOHDACodecDevice@0", "IOHDACodecDevice", [
+                            ("IOHDACodecVendorID", "{}".format(0x1002aa01)),
+                            ("IOHDACodecAddress", "0"),
+                            ("IOHDACodecRevisionID", "{}".format(0x100200))
+                        ])
+                    ])
+                ], extra=[("hda-gfx", '<"onboard-2">')])
+            ]))
+        rp = ["RP{:02}@{:X},{:X}".format(x + 1, 0x1C + x // 8, x % 8) for x in range(ports)]
+        for x, port in enumerate(rp):
+            last = r == roots - 1 and x == ports - 1
+            children.append(b.bridge(port, 0xa338 + x, acpi, pci_path, lambda acpi, pci_path, x=x, last=last: b.subtree(per_port, acpi, pci_path, x, last)))
+        if r == 0:
+            children.append(b.pci("LPCB@1F", 0x8086, 0xa305, 0x060100, acpi + "/LPCB@1f0000", pci_path + ["Pci(0x1F,0x0)"], "Z390 LPC", [
+                _node("AppleLPC", "AppleLPC", [("IOClass", '"AppleLPC"')], [
+                    _node(d, "IOACPIPlatformDevice", [
+                        ("name", '<"PNP0C{:02X}">'.format(9 + x)),
+                        ("_STA", "15"),
+                        ("IOName", '"PNP0C{:02X}"'.format(9 + x))
+                    ]) for x, d in enumerate(LPC_DEVICES)
+                ])
+            ]))
+            children.append(b.pci("HDEF@1F,3", 0x8086, 0xa348, 0x040300, acpi + "/HDEF@1f0003", pci_path + ["Pci(0x1F,0x3)"], "Cannon Lake PCH cAVS", [
+                _node("AppleHDAController@1F,3", "AppleHDAController", [("IOClass", '"AppleHDAController"')], [
+                    _node("IOHDACodecDevice@{}".format(addr), "IOHDACodecDevice", [
+                        ("IOHDACodecVendorID", "{}".format(vendor - (1 << 32) if vendor >> 31 else vendor)),
+                        ("IOHDACodecAddress", "{}".format(addr)),
+                        ("IOHDACodecRevisionID", "{}".format(0x100003))
+                    ]) for addr, vendor in ((0, 0x10ec0b00), (2, 0x80862812))
+                ])
+            ], extra=[("layout-id", _le32(11)), ("built-in", "<00>")]))
+        return _node(name, "IOACPIPlatformDevice", [
+            ("name", '<"PNP0A08">'),
+            ("compatible", '<"PNP0A03">'),
+            ("_UID", '"{}"'.format(r)),
+            ("_ADR", "0"),
+            ("IOPCIConfigured", "Yes")
+        ], [_node("AppleACPIPCI", "AppleACPIPCI", [("IOClass", '"AppleACPIPCI"')], children)])
+
+    acpi_devices = [root(r) for r in range(roots)]
+    acpi_devices += [_node("CP{:02X}@{}".format(x, x), "IOACPIPlatformDevice", [("name", '<"ACPI0007">'), ("_UID", '"{}"'.format(x))], [
+        _node("AppleACPICPU", "AppleACPICPU", [("IOClass", '"AppleACPICPU"'), ("cpu-id", "{}".format(x))])
+    ]) for x in range(cpus)]
+    acpi_devices += [_node("PWRB@0", "IOACPIPlatformDevice", [("name", '<"PNP0C0C">')])]
+    tree = _node("Root", "IORegistryEntry", [("IOKitBuildVersion", '"Darwin Kernel Version 19.6.0"')], [
+        _node("Mac-Synthetic", "IOPlatformExpertDevice", [("compatible", '<"Mac-Synthetic">'), ("model", '<"MacPro7,1">')], [
+            _node("AppleACPIPlatformExpert", "AppleACPIPlatformExpert", [("IOClass", '"AppleACPIPlatformExpert"')], acpi_devices),
+            _node("IOResources", "IOResources", [("IOKit", '"IOService"')])
+        ])
+    ])
+    return tree, {"roots": ["PC{:02X}@0".format(r) for r in range(roots)], "paths": b.paths, "tail": TAIL[0]}
+
+def write_tree(f, tree):
+    # Writes the tree to a binary file as ioreg -lw0 does - returns how
+    # many entries were written
+    count = [0]
+    def write(node, pad, last):
+        name, clss, props, children = node
+        if callable(children):
+            children = children()
+        count[0] += 1
+        out = ["{}+-o {}  <class {}, id 0x{:x}, registered, matched, active, busy 0 (0 ms), retain {}>\n".format(
+            pad, name, clss, 0x100000100 + count[0], 6 + count[0] % 32
+        )]
+        below = pad + ("  " if last else "| ")
+        if props:
+            inner = below + ("| " if children else "  ")
+            out.append(inner + "{\n")
+            out.extend('{}  "{}" = {}\n'.format(inner, k, v) for k, v in props)
+            out.extend((inner + "}\n", inner + "\n"))
+        # Each entry goes out in one write
+        f.write("".join(out).encode("utf-8"))
+        for x, child in enumerate(children):
+            write(child, below, x == len(children) - 1)
+    write(tree, "", True)
+    return count[0]
+
+def make_registry(nodes):
+    # Returns (capture bytes, info) for about the passed number of entries -
+    # info is build_tree()'s, with the actual count added
+    tree, info = build_tree(nodes)
+    f = io.BytesIO()
+    info["nodes"] = write_tree(f, tree)
+    return f.getvalue(), info
+
+def _parse_count(text):
+    m = re.match(r"^\s*(\d+)\s*([KM]?)\s*$", text, re.I)
+    if not m:
+        raise argparse.ArgumentTypeError("Invalid size: {}".format(text))
+    return int(m.group(1)) * {"": 1, "K": 1000, "M": 1000000}[m.group(2).upper()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates synthetic ioreg -lw0 captures")
+    parser.add_argument("nodes", type=_parse_count, help="about how many registry entries to generate (e.g. 1000, 10k, 1M)")
+    parser.add_argument("-o", "--output", help="where to write the capture (default: stdout)")
+    args = parser.parse_args()
+
+    tree, info = build_tree(args.nodes)
+    if args.output:
+        with open(args.output, "wb") as f:
+            count = write_tree(f, tree)
+            size = f.tell()
+        print("Wrote {:,} entries ({:,} bytes) to {}".format(count, size, args.output))
+    else:
+        write_tree(getattr(sys.stdout, "buffer", sys.stdout), tree)
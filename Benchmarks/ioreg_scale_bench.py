@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# Benchmarks how the device lookups in Scripts/ioreg.py scale with the size
+# of the registry - over synthetic captures from Benchmarks/ioreg_gen.py of
+# 1k to 1M entries.  Each lookup is timed against an already built index
+# (which is timed on its own as "index"), and then run once more under
+# tracemalloc for its peak memory.
+#
+# Results are written as JSON so runs can be compared across commits:
+#
+#   python Benchmarks/ioreg_scale_bench.py -m 100k -o before.json
+#   python Benchmarks/ioreg_scale_bench.py -m 100k -o after.json -c before.json
+import os, sys, json, gc, argparse, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import ioreg, ioquery
+import bench_common, ioreg_gen
+
+PLANE = "IOService"
+
+###           ###
+# Lookups Timed #
+###           ###
+
+def _fresh(data):
+    i = ioreg.IOReg()
+    i.ioreg[PLANE] = ioquery.BufferLines(data)
+    return i
+
+def _index(i, info):
+    # Parsing the capture into nodes - everything else starts from this
+    i.indexes = {}
+    return i.get_index(plane=PLANE)
+
+def _get_all_devices(i, info):
+    # Drop the cached result, but keep the index
+    i.devices = {}
+    return i.get_all_devices(plane=PLANE)
+
+def _get_device_path(i, info):
+    # The last device in the capture - so the whole registry is searched
+    return i.get_device_path(info["tail"], plane=PLANE)
+
+def _get_device_info(i, info):
+    # Every PCI device below the first root - each one's path is walked
+    # to check for the parent
+    return i.get_device_info("IOPCIDevice", isclass=True, parent="PC00@0", plane=PLANE)
+
+def _get_devices(i, info):
+    return i.get_devices(["HDEF", "HDAU", info["tail"].split("@")[0]], plane=PLANE)
+
+def _get_pcix_uid(i, info):
+    # The last PciRoot's _UID
+    return i._get_pcix_uid(info["roots"][-1], plane=PLANE)
+
+OPS = (
+    ("index", _index),
+    ("get_all_devices", _get_all_devices),
+    ("get_device_path", _get_device_path),
+    ("get_device_info", _get_device_info),
+    ("get_devices", _get_devices),
+    ("_get_pcix_uid", _get_pcix_uid)
+)
+
+###           ###
+# Timing Helpers #
+###           ###
+
+def _peak(func):
+    # Returns the most memory allocated at once over a run, on top of what
+    # was already allocated when it started
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+def bench_size(label, nodes, repeat, ops, memory=True):
+    data, info = ioreg_gen.make_registry(nodes)
+    i = _fresh(data)
+    _index(i, info)
+    runs = bench_common.repeat_for(info["nodes"], repeat, 10000, 100000)
+    results = []
+    for name, func in ops:
+        call = lambda func=func: func(i, info)
+        seconds = bench_common.time_best(call, runs)
+        results.append({
+            "name": name,
+            "size": label,
+            "nodes": info["nodes"],
+            "bytes": len(data),
+            "seconds": seconds,
+            "us_per_node": seconds * 1e6 / info["nodes"],
+            "peak_bytes": _peak(call) if memory else None,
+            "runs": runs
+        })
+    return results
+
+###   ###
+# Runs #
+###   ###
+
+def run(sizes, ops, repeat, memory=True, quiet=False):
+    results = []
+    for label, nodes in sizes:
+        entries = bench_size(label, nodes, repeat, ops, memory)
+        results.extend(entries)
+        if quiet:
+            continue
+        for r in entries:
+            print("{:<6} {:<16} {:>9,} nodes {:>12.3f} ms {:>8.3f} us/node {:>12}".format(
+                r["size"], r["name"], r["nodes"], r["seconds"] * 1000, r["us_per_node"],
+                "" if r["peak_bytes"] is None else "{:,.1f} MB".format(r["peak_bytes"] / float(1 << 20))
+            ))
+    return {
+        "meta": bench_common.meta(repeat),
+        "results": results
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks how the device lookups in Scripts/ioreg.py scale")
+    parser.add_argument("-o", "--output", help="write results as JSON to this path")
+    parser.add_argument("-c", "--compare", help="a previous JSON result to compare against")
+    parser.add_argument("--ops", default=",".join(o[0] for o in OPS), help="comma separated lookups to run (default: all)")
+    parser.add_argument("-m", "--max-nodes", type=ioreg_gen._parse_count, default=ioreg_gen.SIZES[-1][1], help="largest synthetic capture to build (default: 1M)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per measurement for small captures (default: 5)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the comparison (if any)")
+    args = parser.parse_args()
+
+    wanted = [o.strip() for o in args.ops.split(",")]
+    ops = [o for o in OPS if o[0] in wanted]
+    sizes = [s for s in ioreg_gen.SIZES if s[1] <= args.max_nodes]
+    out = run(sizes, ops, max(1, args.repeat), memory=not args.no_memory, quiet=args.quiet)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    if args.compare:
+        bench_common.compare(out, args.compare, [("size", 6), ("name", 16)])
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# Benchmarks load/dump in Scripts/plist.py over synthetic documents and any
+# recorded system_profiler/ioreg plists dropped in Benchmarks/corpus.
+#
+# Results are written as JSON so runs can be compared across commits:
+#
+#   python Benchmarks/plist_bench.py -o before.json
+#   python Benchmarks/plist_bench.py -o after.json -c before.json
+import os, sys, json, platform, argparse, subprocess
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import plist
+import bench_common
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "corpus")
+SIZES = (
+    ("1KB",   1 << 10),
+    ("10KB",  10 << 10),
+    ("100KB", 100 << 10),
+    ("1MB",   1 << 20),
+    ("10MB",  10 << 20),
+    ("100MB", 100 << 20)
+)
+SHAPES = ("wide", "deep", "hexint")
+# The data types recorded with --record
+RECORD_TYPES = ("SPAudioDataType", "SPPCIDataType")
+
+###                ###
+# Synthetic Corpus #
+###                ###
+
+def _wide_record(i):
+    # Roughly the shape of an SPAudioDataType/SPPCIDataType item
+    return {
+        "_name": "Device {}".format(i % 64),
+        "coreaudio_device_transport": "coreaudio_device_type_builtin",
+        "coreaudio_device_input": 2,
+        "coreaudio_device_output": 2,
+        "coreaudio_input_source": "spaudio_default",
+        "coreaudio_output_source": "spaudio_default",
+        "sppci_vendor-id": "0x8086",
+        "sppci_device-id": "0x{:04x}".format(i & 0xFFFF),
+        "sppci_bus": "spbus_pci",
+        "sppci_slot_name": "Internal@0,31,{}".format(i % 8),
+        "IOClass": "IOPCIDevice",
+        "layout-id": plist.wrap_data(b"\x0b\x00\x00\x00")
+    }
+
+def make_wide(count):
+    return [{"_dataType": "SPAudioDataType", "_items": [_wide_record(i) for i in range(count)]}]
+
+def make_deep(count):
+    # A registry-like chain of nested children, capped so plistlib's
+    # recursive writer can still serialize it - wider once the cap is hit
+    depth = min(count, 200)
+    root = node = {}
+    for i in range(count):
+        child = {"IOClass": "IOService", "name": "node{}".format(i), "depth": i % depth}
+        node.setdefault("IORegistryEntryChildren", []).append(child)
+        if (i + 1) % depth:
+            node = child
+        else:
+            node = root
+    return root
+
+def make_hexint(count):
+    # plistlib won't emit hex integers - build the XML by hand, as ioreg -a
+    # and some kexts' Info.plist files do
+    items = "".join(
+        "\t<dict>\n\t\t<key>vendor-id</key>\n\t\t<integer>0x{:x}</integer>\n"
+        "\t\t<key>device-id</key>\n\t\t<integer>0x{:x}</integer>\n"
+        "\t\t<key>class-code</key>\n\t\t<integer>0x{:x}</integer>\n\t</dict>\n".format(
+            0x8086 + i % 16, i & 0xFFFF, 0x40300
+        ) for i in range(count)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n'
+        '<plist version="1.0">\n<array>\n' + items + '</array>\n</plist>\n'
+    ).encode("utf-8")
+
+_makers = {"wide": make_wide, "deep": make_deep, "hexint": make_hexint}
+
+def _serialize(shape, count, fmt):
+    made = _makers[shape](count)
+    if shape == "hexint":
+        if fmt == plist.FMT_XML:
+            return made
+        # Re-encode the parsed value as a binary plist
+        made = plist.loads(made)
+    out = BytesIO()
+    plist.dump(made, out, fmt=fmt)
+    return out.getvalue()
+
+def build_document(shape, target, fmt):
+    # Estimate bytes per record from a small sample, then rescale a couple of
+    # times as sizes don't grow linearly (indentation, deduped binary objects)
+    count = 256
+    data = _serialize(shape, count, fmt)
+    for _ in range(3):
+        if abs(len(data) - target) <= target // 5:
+            break
+        count = max(1, int(count * target / float(len(data))))
+        data = _serialize(shape, count, fmt)
+    return data
+
+###           ###
+# Timing Helpers #
+###           ###
+
+def bench_document(name, data, fmt, repeat, **extra):
+    results = []
+    value = plist.loads(data)
+    runs = bench_common.repeat_for(len(data), repeat, 1 << 20, 10 << 20)
+    load_time = bench_common.time_best(lambda: plist.loads(data), runs)
+    dump_time = bench_common.time_best(lambda: plist.dump(value, BytesIO(), fmt=fmt), runs)
+    for op, seconds in (("load", load_time), ("dump", dump_time)):
+        result = {
+            "name": name,
+            "fmt": "binary" if fmt == plist.FMT_BINARY else "xml",
+            "op": op,
+            "bytes": len(data),
+            "seconds": seconds,
+            "mb_per_sec": len(data) / seconds / (1 << 20) if seconds else None,
+            "runs": runs
+        }
+        result.update(extra)
+        results.append(result)
+    return results
+
+###             ###
+# Corpus Handling #
+###             ###
+
+def record_corpus():
+    # Captures the current machine's system_profiler output to the corpus
+    if not sys.platform.startswith("darwin"):
+        print("Recording requires macOS")
+        return []
+    if not os.path.isdir(CORPUS_DIR):
+        os.makedirs(CORPUS_DIR)
+    saved = []
+    for data_type in RECORD_TYPES:
+        out = subprocess.Popen(
+            ["system_profiler", "-xml", data_type],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        ).communicate()[0]
+        if not out:
+            continue
+        path = os.path.join(CORPUS_DIR, "{}-{}.plist".format(data_type, platform.node() or "local"))
+        with open(path, "wb") as f:
+            f.write(out)
+        saved.append(path)
+    return saved
+
+def iter_corpus(corpus_dir):
+    if not os.path.isdir(corpus_dir):
+        return
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith((".plist", ".xml")):
+            continue
+        path = os.path.join(corpus_dir, name)
+        with open(path, "rb") as f:
+            yield name, f.read()
+
+###   ###
+# Runs #
+###   ###
+
+def run(sizes, shapes, corpus_dir, repeat, quiet=False):
+    results = []
+    def report(entries):
+        results.extend(entries)
+        if quiet:
+            return
+        for r in entries:
+            print("{:<28} {:<6} {:<4} {:>12,} B {:>10.2f} ms {:>8.1f} MB/s".format(
+                r["name"], r["fmt"], r["op"], r["bytes"], r["seconds"] * 1000, r["mb_per_sec"] or 0
+            ))
+    for fmt in (plist.FMT_XML, plist.FMT_BINARY):
+        for shape in shapes:
+            for label, target in sizes:
+                data = build_document(shape, target, fmt)
+                report(bench_document("{}-{}".format(shape, label), data, fmt, repeat, shape=shape, size=label))
+    for name, data in iter_corpus(corpus_dir):
+        fmt = plist.FMT_BINARY if data.startswith(b"bplist00") else plist.FMT_XML
+        try:
+            report(bench_document(name, data, fmt, repeat, shape="recorded"))
+        except Exception as e:
+            print("Skipping {}: {}".format(name, e))
+    return {
+        "meta": bench_common.meta(repeat),
+        "results": results
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks Scripts/plist.py load/dump")
+    parser.add_argument("-o", "--output", help="write results as JSON to this path")
+    parser.add_argument("-c", "--compare", help="a previous JSON result to compare against")
+    parser.add_argument("-s", "--shapes", default=",".join(SHAPES), help="comma separated shapes to run (default: {})".format(",".join(SHAPES)))
+    parser.add_argument("-m", "--max-size", type=bench_common.parse_size, default=SIZES[-1][1], help="largest synthetic document to build (default: 100MB)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per measurement for small documents (default: 5)")
+    parser.add_argument("-d", "--corpus", default=CORPUS_DIR, help="directory of recorded plists (default: Benchmarks/corpus)")
+    parser.add_argument("--record", action="store_true", help="capture this Mac's system_profiler output to the corpus first")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the comparison (if any)")
+    args = parser.parse_args()
+
+    if args.record:
+        for path in record_corpus():
+            print("Recorded {}".format(path))
+    shapes = [s.strip() for s in args.shapes.split(",") if s.strip() in _makers]
+    sizes = [s for s in SIZES if s[1] <= args.max_size]
+    out = run(sizes, shapes, args.corpus, max(1, args.repeat), quiet=args.quiet)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    if args.compare:
+        bench_common.compare(out, args.compare, [("name", 28), ("fmt", 6), ("op", 4)])
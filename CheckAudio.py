@@ -1,12 +1,12 @@
 #!/usr/bin/env python
-import os, sys
-from Scripts import ioreg, plist, run, utils
+import os, sys, json, datetime, argparse, atexit
+from Scripts import archive, diff, fleet, ioreg, logger, metrics, plist, run, sources, utils
 
 class CheckAudio:
-    def __init__(self):
+    def __init__(self, log_path = None, ndjson_path = None, root = None):
         self.u = utils.Utils("CheckAudio")
-        # Verify running OS
-        if not sys.platform.lower() == "darwin":
+        # Verify running OS - a fixture root can be read from anywhere
+        if not root and not sys.platform.lower() == "darwin":
             self.u.head("Wrong OS!")
             print("")
             print("This script can only be run on macOS!")
@@ -15,8 +15,12 @@ class CheckAudio:
             exit(1)
         self.r = run.Run()
         self.i = ioreg.IOReg()
+        self.sources = sources.DataSources(root=root, r=self.r)
         self.kextstat = None
-        self.log = ""
+        self.kext_index = None
+        self.log = logger.Logger()
+        self.log_path = log_path or os.path.join(os.path.dirname(os.path.realpath(__file__)),"Audio.log")
+        self.ndjson_path = ndjson_path
         self.vendors = {
             "1002":"AMD",
             "1022":"AMD Zen",
@@ -31,114 +35,223 @@ class CheckAudio:
             "8384":"SigmaTel",
             "1106":"VIA"
         }
+        # The kexts, devices, and device properties we report on
+        self.check_kexts = ("Lilu","AppleALC","WhateverGreen","AppleHDAController","AppleHDA")
+        self.check_devices = ("HDEF","HDAU")
+        self.check_properties = ioreg.DEVICE_PROPERTIES
+        # The report sections - and what each one costs to collect:
+        # codecs:    ioreg (IOService)
+        # kexts:     kextstat/kmutil
+        # os:        sw_vers
+        # boot_args: nvram
+        # devices:   ioreg, plus system_profiler SPPCIDataType for names
+        # io:        system_profiler SPAudioDataType
+        self.sections = ("codecs","kexts","os","boot_args","devices","io")
         self.ioreg = None
 
     def get_codecs(self):
-        # Get our audio codec list
-        ioreg = self.r.run({"args":["ioreg","-d1","-rn","IOHDACodecDevice"]})[0].split("\n")
-        # Iterate the list looking for devices
-        codecs = []
-        codec = None
-        for x in ioreg:
-            if "iohdacodecvendorid" in x.lower():
-                try:
-                    codec = hex(int(x.split(" = ")[1]) & 0xFFFFFFFF).lower()
-                except:
-                    # Reset on failure
-                    codec = None
-            if codec and "iohdacodecrevisionid" in x.lower():
-                try:
-                    codecs.append({
-                        "codec":codec,
-                        "revision":hex(int(x.split(" = ")[1])).lower()
-                    })
-                finally:
-                    # Clear the codec var
-                    codec = None
-        return codecs
+        # Pull our audio codecs from the IOService snapshot - this is the
+        # same capture get_all_devices() walks, so we don't fork ioreg again
+        return self.i.get_codecs()
 
     def get_inputs_outputs(self):
-        # Runs system_profiler SPAudioDataType and parses data
-        n_head = "        " # Sets the pad for the name header
-        n_foot = ":"        # Sets the last char for the header
-        devs = self.r.run({"args":["system_profiler","-xml","SPAudioDataType"]})[0]
-        dev_list = []
-        try:
-            xml = plist.loads(devs)
-        except:
-            xml = []
-        if not len(xml):
-            return []
-        audio_devices = []
-        if not "_items" in xml[0] or not len(xml[0]["_items"]):
-            return []
-        for x in xml[0]["_items"]:
-            if not "_items" in x:
-                continue
-            audio_devices.extend(x["_items"])
-        # Walk the list
-        for x in audio_devices:
-            try:
-                new_item = {
-                    "name": x.get("_name","Unknown"),
-                    "out_source": x.get("coreaudio_output_source",None),
-                    "out_count": x.get("coreaudio_device_output",None),
-                    "in_source": x.get("coreaudio_input_source",None),
-                    "in_count": x.get("coreaudio_device_input",None),
-                    "type": x.get("coreaudio_device_transport",None)
-                }
-                dev_list.append(new_item)
-            except:
-                continue
-        return dev_list
+        # Parses system_profiler SPAudioDataType
+        return self.sources.get_audio_devices()
 
     def get_kextstat(self, force = False):
         # Gets the kextstat list if needed
         if not self.kextstat or force:
-            self.kextstat = self.r.run({"args":"kextstat"})[0]
+            self.kextstat = self.sources.get_kextstat()
+            self.kext_index = None
         return self.kextstat
 
+    def parse_loaded_kexts(self, text):
+        return self.sources.parse_loaded_kexts(text)
+
+    def get_kext_index(self, force = False):
+        # Parses the loaded kext list once and retains it
+        if self.kext_index is None or force:
+            self.kext_index = self.parse_loaded_kexts(self.get_kextstat(force=force))
+        return self.kext_index
+
     def get_boot_args(self):
-        # Attempts to pull the boot-args from nvram
-        out = self.r.run({"args":["nvram","-p"]})
-        for l in out[0].split("\n"):
-            if "boot-args" in l:
-                return "\t".join(l.split("\t")[1:])
-        return None
+        # Asks nvram for just the boot-args variable
+        return self.sources.get_boot_args()
 
     def get_os_version(self):
-        # Scrape sw_vers
-        prod_name  = self.r.run({"args":["sw_vers","-productName"]})[0].strip()
-        prod_vers  = self.r.run({"args":["sw_vers","-productVersion"]})[0].strip()
-        build_vers = self.r.run({"args":["sw_vers","-buildVersion"]})[0].strip()
-        if build_vers: build_vers = "({})".format(build_vers)
-        return " ".join([x for x in (prod_name,prod_vers,build_vers) if x])
+        # Reads SystemVersion.plist
+        return self.sources.get_os_version()
 
     def locate(self, kext):
-        # Gathers the kextstat list - then parses for loaded kexts
-        ks = self.get_kextstat()
-        # Verifies that our name ends with a space
-        if not kext[-1] == " ":
-            kext += " "
-        for x in ks.split("\n")[1:]:
-            if kext.lower() in x.lower():
-                # We got the kext - return the version
-                try:
-                    v = x.split("(")[1].split(")")[0]
-                except:
-                    return "?.?"
-                return v
-        return None
+        # Returns the version of the passed kext (by bundle id or short name)
+        # if loaded - or None if not
+        kext = self.get_kext_index().get(kext.strip().lower())
+        if not kext:
+            return None
+        return kext["version"] or "?.?"
 
     def lprint(self, message):
-        print(message)
-        self.log += message + "\n"
+        self.log.lprint(message)
 
-    def main(self):
-        self.u.head()
-        self.lprint("")
+    def get_device_record(self, dev):
+        # Reduces a get_all_devices() entry to what the report needs
+        return self.i.get_device_record(dev,properties=self.check_properties)
+
+    def resolve_sections(self, only=None, skip=None):
+        # Returns the sections to collect in report order - raises a
+        # ValueError if any unknown sections are passed
+        only = [x.strip().lower() for x in only or [] if x.strip()]
+        skip = [x.strip().lower() for x in skip or [] if x.strip()]
+        unknown = [x for x in only+skip if not x in self.sections]
+        if unknown:
+            raise ValueError("Unknown section{}: {} (valid: {})".format(
+                "" if len(unknown)==1 else "s",
+                ", ".join(unknown),
+                ", ".join(self.sections)
+            ))
+        return tuple(x for x in self.sections if (not only or x in only) and not x in skip)
+
+    def gather(self, sections=None, on_section=None):
+        # Collects everything into one structured report - the text output,
+        # and the JSON/NDJSON/plist outputs are all rendered from this.
+        # Only the passed sections are collected (and only their keys are
+        # present) - so we never shell out for data we won't show.  If
+        # on_section is passed, it's called with ("meta", report) once the
+        # header is built, then with (section, report) as each one finishes.
+        sections = self.sections if sections is None else sections
+        on_section = on_section or (lambda section, report: None)
+        report = {
+            "generated":datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "sections":list(sections)
+        }
+        on_section("meta",report)
+        if "codecs" in sections:
+            with metrics.timer("phase_seconds",phase="codecs"):
+                report["codecs"] = []
+                for c in self.get_codecs():
+                    codec = dict((k,v) for k,v in c.items() if k != "controller_line")
+                    codec["vendor_name"] = self.vendors.get("{:04x}".format(c["vendor_id"]))
+                    report["codecs"].append(codec)
+            on_section("codecs",report)
+        if "kexts" in sections:
+            with metrics.timer("phase_seconds",phase="kexts"):
+                report["kexts"] = {}
+                for name in self.check_kexts:
+                    kext = self.get_kext_index().get(name.lower())
+                    report["kexts"][name] = dict(kext) if kext else None
+            on_section("kexts",report)
+        if "os" in sections:
+            with metrics.timer("phase_seconds",phase="os"):
+                report["os_version"] = self.get_os_version() or None
+            on_section("os",report)
+        if "boot_args" in sections:
+            with metrics.timer("phase_seconds",phase="boot_args"):
+                report["boot_args"] = self.get_boot_args()
+            on_section("boot_args",report)
+        if "devices" in sections:
+            with metrics.timer("phase_seconds",phase="devices"):
+                report["devices"] = {}
+                # Match by name via the registry index, then join on the entry id
+                # to pick up the device/acpi paths
+                dev_ids = dict((x["id"],x) for x in self.i.get_all_devices(plane="IOService").values() if x["id"] is not None)
+                for dev in self.check_devices:
+                    nodes = self.i.query("name={}".format(dev),plane="IOService")
+                    report["devices"][dev] = [self.get_device_record(dev_ids[x["id"]]) for x in nodes if x["id"] in dev_ids]
+            on_section("devices",report)
+        if "io" in sections:
+            with metrics.timer("phase_seconds",phase="io"):
+                report["io_devices"] = self.get_inputs_outputs()
+            on_section("io",report)
+        return report
+
+    def get_report_records(self, report):
+        # Flattens the report into (kind, data) records for NDJSON output
+        yield ("meta",dict((k,report[k]) for k in ("generated","sections","os_version","boot_args") if k in report))
+        for section in ("codecs","kexts","devices","io"):
+            for record in self.get_section_records(section,report):
+                yield record
+
+    def get_section_records(self, section, report):
+        # The (kind, data) records for a single gathered section
+        if section == "meta":
+            yield ("meta",dict((k,report[k]) for k in ("generated","sections")))
+        elif section == "codecs":
+            for codec in report.get("codecs",[]):
+                yield ("codec",codec)
+        elif section == "kexts":
+            for name,kext in sorted(report.get("kexts",{}).items()):
+                yield ("kext",dict(kext or {},check=name,loaded=bool(kext)))
+        elif section == "os":
+            yield ("os_version",{"value":report.get("os_version")})
+        elif section == "boot_args":
+            yield ("boot_args",{"value":report.get("boot_args")})
+        elif section == "devices":
+            for dev,devices in sorted(report.get("devices",{}).items()):
+                for d in devices:
+                    yield ("device",dict(d,match=dev))
+        elif section == "io":
+            for io in report.get("io_devices",[]):
+                yield ("io_device",io)
+
+    def _strip_none(self, value):
+        # Plists have no null - drop any None values.  Kexts that aren't
+        # loaded are None too, so the plist report spells those out as
+        # {"loaded":False} before this runs (see get_plist_report())
+        if isinstance(value,dict):
+            return dict((k,self._strip_none(v)) for k,v in value.items() if v is not None)
+        if isinstance(value,(list,tuple)):
+            return [self._strip_none(v) for v in value if v is not None]
+        return value
+
+    def get_plist_report(self, report):
+        # Marks each kext as loaded or not - so "not loaded" survives
+        # dropping None values
+        if "kexts" in report:
+            report = dict(report,kexts=dict(
+                (name,dict(kext,loaded=True) if kext else {"loaded":False}) for name,kext in report["kexts"].items()
+            ))
+        return self._strip_none(report)
+
+    def serialize_report(self, report, fmt="json"):
+        # Returns the report as bytes in the passed format
+        if fmt == "json":
+            return (json.dumps(report,indent=2,sort_keys=True)+"\n").encode("utf-8")
+        elif fmt == "ndjson":
+            return "".join(
+                json.dumps({"kind":k,"data":d},sort_keys=True)+"\n" for k,d in self.get_report_records(report)
+            ).encode("utf-8")
+        elif fmt == "plist":
+            return plist.dumps(self.get_plist_report(report),fmt=plist.FMT_BINARY)
+        raise ValueError("Unsupported format: {}".format(fmt))
+
+    def render(self, report):
+        # Prints the human readable report via lprint - skipping any sections
+        # that weren't gathered
+        self.render_section("meta",report)
+        for section in report.get("sections",[]):
+            self.render_section(section,report)
+
+    def render_section(self, section, report):
+        # Prints a single gathered section
+        if section == "meta":
+            self.lprint("")
+        elif section == "codecs":
+            self.render_codecs(report["codecs"])
+        elif section == "kexts":
+            self.render_kexts(report["kexts"])
+        elif section == "os":
+            self.lprint("Current OS Version: {}".format(report["os_version"] or "Unknown!"))
+            self.lprint("")
+        elif section == "boot_args":
+            self.lprint("Current boot-args: {}".format(report["boot_args"] or "None set!"))
+            self.lprint("")
+        elif section == "devices":
+            self.render_devices(report["devices"])
+        elif section == "io":
+            self.render_io_devices(report["io_devices"])
+
+    def render_codecs(self, codecs):
         self.lprint("Finding Codecs...")
-        codecs = self.get_codecs()
         if not len(codecs):
             self.lprint(" - None found!")
         else:
@@ -148,56 +261,60 @@ class CheckAudio:
             self.lprint("")
             for x in codecs:
                 # Resolve the manufacturer name
-                ven = x["codec"][2:6]
-                name = self.vendors.get(ven.lower(),x["codec"][:6])
-                self.lprint(" - {} 0x{}".format(name, x["codec"][6:]))
-                self.lprint(" --> ID:       {}".format(x["codec"]))
-                self.lprint(" --> Revision: {}".format(x["revision"]))
+                name = x.get("vendor_name") or "0x{:04x}".format(x["vendor_id"])
+                self.lprint(" - {} 0x{:04x}".format(name, x["device_id"]))
+                self.lprint(" --> ID:       0x{:08x}".format(x["codec_id"]))
+                if x.get("revision_id") is not None:
+                    self.lprint(" --> Revision: {}".format(hex(x["revision_id"])))
+                if x.get("address") is not None:
+                    self.lprint(" --> Address:  {}".format(x["address"]))
+                if x.get("controller"):
+                    self.lprint(" --> Device:   {} - {}".format(x["controller"], x.get("device_path") or "Could Not Resolve Device Path"))
                 self.lprint("")
+
+    def render_kexts(self, kexts):
+        def kext_vers(name):
+            kext = kexts.get(name)
+            return (kext.get("version") or "?.?") if kext else None
         self.lprint("Checking kexts:")
         self.lprint("")
         self.lprint("Locating Lilu...")
-        lilu_vers = self.locate("Lilu")
+        lilu_vers = kext_vers("Lilu")
         if not lilu_vers:
             self.lprint(" - Not loaded! AppleALC and WhateverGreen need this!")
         else:
             self.lprint(" - Found v{}".format(lilu_vers))
             self.lprint("Checking for Lilu plugins...")
             self.lprint(" - Locating AppleALC...")
-            alc_vers = self.locate("AppleALC")
+            alc_vers = kext_vers("AppleALC")
             if not alc_vers:
                 self.lprint(" --> Not loaded! Onboard and HDMI/DP audio may not work!")
             else:
                 self.lprint(" --> Found v{}".format(alc_vers))
             self.lprint(" - Locating WhateverGreen...")
-            weg_vers = self.locate("WhateverGreen")
+            weg_vers = kext_vers("WhateverGreen")
             if not weg_vers:
                 self.lprint(" --> Not loaded! HDMI/DP audio may not work!")
             else:
                 self.lprint(" --> Found v{}".format(weg_vers))
         self.lprint("Locating AppleHDAController...")
-        hda_c_vers = self.locate("AppleHDAController")
+        hda_c_vers = kext_vers("AppleHDAController")
         if not hda_c_vers:
             self.lprint(" - Not loaded!")
         else:
             self.lprint(" - Found v{}".format(hda_c_vers))
         self.lprint("Locating AppleHDA...")
-        hda_vers = self.locate("AppleHDA")
+        hda_vers = kext_vers("AppleHDA")
         if not hda_vers:
             self.lprint(" - Not loaded!")
         else:
             self.lprint(" - Found v{}".format(hda_vers))
         self.lprint("")
-        os_vers = self.get_os_version()
-        self.lprint("Current OS Version: {}".format(os_vers or "Unknown!"))
-        self.lprint("")
-        boot_args = self.get_boot_args()
-        self.lprint("Current boot-args: {}".format(boot_args or "None set!"))
-        self.lprint("")
-        all_devs = self.i.get_all_devices()
-        for dev in ["HDEF","HDAU"]:
+
+    def render_devices(self, devices):
+        for dev in self.check_devices:
             self.lprint("Locating {} devices...".format(dev))
-            hdef_list = [x for x in all_devs.values() if x.get("name_no_addr") == dev]
+            hdef_list = devices.get(dev,[])
             if not len(hdef_list):
                 self.lprint(" - None found!")
                 self.lprint("")
@@ -207,28 +324,21 @@ class CheckAudio:
                 self.lprint("Iterating {} devices:".format(dev))
                 self.lprint("")
                 for h in hdef_list:
-                    h_dict = h.get("info",{})
-                    loc = h.get("device_path")
-                    self.lprint(" - {} - {}".format(h["name"], loc or "Could Not Resolve Device Path"))
+                    self.lprint(" - {} - {}".format(h["name"], h["device_path"] or "Could Not Resolve Device Path"))
                     max_len = len("no-controller-patch:")
-                    name = self.i.get_pci_device_name(h_dict,use_unknown=False)
-                    if name:
-                        self.lprint(" --> {} {}".format("name:".ljust(max_len),name))
-                    for x in ["built-in","alc-layout-id","layout-id","hda-gfx","no-controller-patch","acpi-path"]:
-                        val = h_dict.get(x,"Not Present")
-                        if val[0]=="<" and val[-1]==">" and val[1]!='"' and val[-1]!='"':
-                            # Got some likely little endian hex data - try to get a number
-                            try:
-                                val_hex = list("0"*(len(val[1:-1])%2)+val[1:-1])
-                                val_rev = "".join(["".join(val_hex[i:i+2]) for i in range(0,len(val_hex),2)][::-1])
-                                val = "{} ({})".format(val,int(val_rev,16))
-                            except Exception:
-                                pass
+                    if h.get("pci_name"):
+                        self.lprint(" --> {} {}".format("name:".ljust(max_len),h["pci_name"]))
+                    self.lprint(" --> {} {}".format("drivers:".ljust(max_len),", ".join(h.get("drivers") or []) or "None attached"))
+                    for x in self.check_properties:
+                        val = h["properties"].get(x,"Not Present")
+                        if x in h["decoded"]:
+                            val = "{} ({})".format(val,h["decoded"][x])
                         self.lprint(" --> {} {}".format((x+":").ljust(max_len), val))
                     self.lprint("")
+
+    def render_io_devices(self, outs):
         # Show all available outputs
         self.lprint("Gathering inputs/outputs...")
-        outs = self.get_inputs_outputs()
         if not len(outs):
             self.lprint(" - None found!")
             self.lprint("")
@@ -248,16 +358,156 @@ class CheckAudio:
                     self.lprint(" --> Outputs:         {}".format(out["out_count"]))
                     self.lprint(" ----> Output Source: {}".format(out["out_source"]))
                 self.lprint("")
-        print("Saving log...")
-        print("")
-        os.chdir(os.path.dirname(os.path.realpath(__file__)))
-        with open("Audio.log","w") as f:
-            f.write(self.log)
-        print("Done.")
+
+    def main(self, fmt="text", output=None, sections=None, interactive=True):
+        if fmt != "text":
+            # Machine readable - just gather and write the report out
+            data = self.serialize_report(self.gather(sections=sections),fmt=fmt)
+            if output:
+                with open(output,"wb") as f:
+                    f.write(data)
+            else:
+                out = getattr(sys.stdout,"buffer",sys.stdout)
+                out.write(data)
+                out.flush()
+            return
+        if interactive:
+            self.u.head()
+        # Open the log before anything is collected - and write each section
+        # out as soon as it's gathered, so a crash part way still leaves
+        # everything up to that point on disk
+        self.log.open(self.log_path, self.ndjson_path)
+        def on_section(section, report):
+            for kind,data in self.get_section_records(section,report):
+                self.log.record(kind, **data)
+            self.render_section(section,report)
+            self.log.flush()
+        self.gather(sections=sections,on_section=on_section)
+        self.log.close()
+        if not interactive:
+            return
+        print("Log saved to {}".format(self.log_path))
+        if self.ndjson_path:
+            print("Records saved to {}".format(self.ndjson_path))
         print("")
         
 
 if __name__ == '__main__':
-    # os.chdir(os.path.dirname(os.path.realpath(__file__)))
-    a = CheckAudio()
-    a.main()
+    parser = argparse.ArgumentParser(prog="CheckAudio.py", description="Offers some debugging info on HDEF/HDAU devices and current outputs.")
+    parser.add_argument("command", nargs="?", choices=("report","analyze","query","diff","archive","extract"), default="report", help="report on this machine (default), analyze captured reports/ioreg snapshots from many machines, query the IORegistry, diff two captures/reports, or archive/extract captures")
+    parser.add_argument("paths", nargs="*", help="analyze: the directory (or file) of captures - query: the selector, and optionally a saved ioreg -lw0 capture to search - diff: the two captures/reports to compare - archive: the archive directory, then captures (files, or a directory per machine) to add - extract: the archive directory, snapshot, and optionally the file to extract")
+    parser.add_argument("-f", "--format", choices=("text","json","ndjson","plist"), default="text", help="report format (default: text) - plist is a binary plist")
+    parser.add_argument("-o", "--output", help="where to save a json/ndjson/plist report (default: stdout)")
+    parser.add_argument("-n", "--ndjson-log", help="also write NDJSON records to this path alongside Audio.log")
+    parser.add_argument("--only", help="comma delimited report sections to collect (codecs, kexts, os, boot_args, devices, io)")
+    parser.add_argument("--skip", help="comma delimited report sections to leave out")
+    parser.add_argument("-b", "--batch", action="store_true", help="non-interactive - don't clear the screen or print progress/summary lines")
+    parser.add_argument("-p", "--plane", default="IOService", help="the IORegistry plane to query (default: IOService)")
+    parser.add_argument("-r", "--root", help="read file based sources from this directory instead of / - System/Library/CoreServices/SystemVersion.plist (os), nvram.plist (boot_args), kextstat.txt (kexts), and SPAudioDataType.xml (io).  codecs and devices still come from the live ioreg, so for fixtures pair with --only os,boot_args,kexts,io")
+    parser.add_argument("-e", "--explain", action="store_true", help="print how each query was captured (targeted or full ioreg dump) and how long it took to stderr")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes to use when analyzing (default: one per CPU)")
+    parser.add_argument("-m", "--metrics", help="write what the run cost (commands, bytes/lines/nodes parsed, timings) to this path on exit - JSON for .json paths, otherwise a Prometheus textfile")
+    args = parser.parse_args()
+    if args.metrics:
+        atexit.register(metrics.REGISTRY.write, args.metrics)
+    if args.command == "analyze":
+        if len(args.paths) != 1:
+            parser.error("analyze takes exactly one directory")
+        results = fleet.analyze(args.paths[0], workers=args.jobs)
+        out = json.dumps(results, indent=2, sort_keys=True) if args.format in ("json","ndjson") else fleet.render(results)
+        if args.output:
+            with open(args.output,"w") as f:
+                f.write(out+"\n")
+        else:
+            print(out)
+        exit(1 if results["errors"] else 0)
+    if args.command == "diff":
+        if len(args.paths) != 2:
+            parser.error("diff takes exactly two captures or reports")
+        # Name the devices in raw captures the way a report from this machine
+        # would - so a capture isn't flagged against a live report for that
+        pci_devices = None
+        if not all(p.lower().endswith(fleet.REPORT_EXTENSIONS) for p in args.paths):
+            pci_devices = ioreg.IOReg().get_pci_devices()
+        try:
+            results = diff.diff_paths(*args.paths, pci_devices=pci_devices)
+        except Exception as e:
+            parser.error("Could not compare: {}".format(e))
+        out = json.dumps(results, indent=2, sort_keys=True, default=str) if args.format in ("json","ndjson") else diff.render(results)
+        if args.output:
+            with open(args.output,"w") as f:
+                f.write(out+"\n")
+        else:
+            print(out)
+        # Like diff(1) - 1 when there are differences
+        exit(0 if results["identical"] else 1)
+    if args.command == "archive":
+        if not args.paths:
+            parser.error("archive takes an archive directory, and optionally captures to add")
+        arc = archive.SnapshotArchive(args.paths[0])
+        if len(args.paths) == 1:
+            for name in arc.snapshots():
+                print(name)
+            exit(0)
+        for path in args.paths[1:]:
+            if os.path.isdir(path):
+                name = os.path.basename(os.path.normpath(path))
+                files = [os.path.join(path,x) for x in sorted(os.listdir(path)) if os.path.isfile(os.path.join(path,x))]
+            else:
+                name = os.path.splitext(os.path.basename(path))[0]
+                files = [path]
+            stats = arc.add_paths(name,files)["stats"]
+            print("{}: {:,} bytes in {:,} chunks - {:,} new ({:,} bytes stored)".format(
+                name,stats["bytes"],stats["chunks"],stats["new_chunks"],stats["stored_bytes"]
+            ))
+        exit(0)
+    if args.command == "extract":
+        if not 2 <= len(args.paths) <= 3:
+            parser.error("extract takes an archive directory, a snapshot, and optionally a file in it")
+        arc = archive.SnapshotArchive(args.paths[0])
+        try:
+            data = arc.extract(args.paths[1],args.paths[2] if len(args.paths) == 3 else None)
+        except (IOError,OSError,KeyError,ValueError) as e:
+            parser.error("Could not extract {}: {}".format(args.paths[1],e))
+        if args.output:
+            with open(args.output,"wb") as f:
+                f.write(data)
+        else:
+            getattr(sys.stdout,"buffer",sys.stdout).write(data)
+        exit(0)
+    if args.command == "query":
+        if not 1 <= len(args.paths) <= 2:
+            parser.error("query takes a selector, and optionally an ioreg capture")
+        i = ioreg.IOReg()
+        if len(args.paths) == 2:
+            i.load_ioreg(args.paths[1],plane=args.plane)
+        try:
+            # Paths are printed - so targeted captures are out
+            nodes = i.query(args.paths[0],plane=args.plane,paths=True)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.explain:
+            for p in i.plan_log:
+                sys.stderr.write("{} plan for {}: {} ({:.3f}s)\n".format(p["strategy"],p["plane"],p["reason"],p["seconds"]))
+                for c in p["commands"]:
+                    sys.stderr.write(" - {} -> {:,} bytes in {:.3f}s\n".format(" ".join(c["args"]),c["bytes"],c["seconds"]))
+        if args.format in ("json","ndjson"):
+            nodes = [{"name":n["name"],"class":n["class"],"path":n["path"],"id":n["id"],"info":dict(n["info"])} for n in nodes]
+            if args.format == "json":
+                print(json.dumps(nodes,indent=2,sort_keys=True))
+            else:
+                for n in nodes:
+                    print(json.dumps(n,sort_keys=True))
+        else:
+            for n in nodes:
+                print("{} <{}> {}".format(n["name"],n["class"],n["path"]))
+        exit(0 if nodes else 1)
+    a = CheckAudio(ndjson_path=args.ndjson_log, root=args.root)
+    try:
+        sections = a.resolve_sections(
+            only=args.only.split(",") if args.only else None,
+            skip=args.skip.split(",") if args.skip else None
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    a.main(fmt=args.format, output=args.output, sections=sections, interactive=not args.batch)
@@ -0,0 +1,268 @@
+import os, re, json, gzip, hashlib, binascii, datetime
+try:
+    import lzma
+except ImportError:
+    # Python 2 - objects are stored with gzip instead
+    lzma = None
+from . import ioquery
+
+# Matches a class line - the part after the class name (entry id, state,
+# retain count) changes from boot to boot, so it's kept with the snapshot
+# rather than in the shared chunks
+CLASS_STATE = re.compile(br"(\+-o [^\n]*?<class [^,>\n]+)([^\n]*)>(?=\r?$)", re.M)
+CLASS_BARE = re.compile(br"(\+-o [^\n]*?<class [^,>\n]+)>(?=\r?$)", re.M)
+MAGIC = {b"\xfd7zXZ\x00":"lzma", b"\x1f\x8b":"gzip"}
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def is_ioreg(data):
+    # ioreg -lw0 output starts with the Root entry's class line
+    return b"+-o " in data[:4096]
+
+def split_ioreg(data, max_chunk=64<<10):
+    # Splits ioreg output (with the class line states already stripped) into
+    # [prefix, bytes] chunks along subtree boundaries - each chunk is either
+    # a whole subtree no bigger than max_chunk, or a single entry whose
+    # subtree is bigger.  The columns every line in a chunk shares with its
+    # ancestors are split off as the prefix, so the same subtree hashes the
+    # same wherever it sits in the tree.
+    size = len(data)
+    starts,depths,_ = ioquery.scan_class_lines(data)
+    # Where each entry's subtree ends - as the index of the next entry
+    # that isn't below it
+    ends = [len(starts)]*len(starts)
+    stack = []
+    for x,d in enumerate(depths):
+        while stack and depths[stack[-1]] >= d:
+            ends[stack.pop()] = x
+        stack.append(x)
+    offset = lambda x: starts[x] if x < len(starts) else size
+    chunks = []
+    if not starts or starts[0]:
+        # Anything ahead of the first entry
+        chunks.append([b"",data[:offset(0)]])
+    x = 0
+    while x < len(starts):
+        if offset(ends[x])-starts[x] <= max_chunk:
+            chunk,nxt = data[starts[x]:offset(ends[x])],ends[x]
+        else:
+            chunk,nxt = data[starts[x]:offset(x+1)],x+1
+        prefix = data[starts[x]:data.find(b"+-o ",starts[x])]
+        chunks.append(_strip_prefix(chunk,prefix))
+        x = nxt
+    return chunks
+
+def _strip_prefix(chunk, prefix):
+    # Returns [prefix, chunk without it] - or [b"", chunk] if any line
+    # doesn't start with the prefix
+    if not prefix:
+        return [b"",chunk]
+    trailing = chunk.endswith(b"\n")
+    lines = (chunk[:-1] if trailing else chunk).split(b"\n")
+    if not all(line.startswith(prefix) for line in lines):
+        return [b"",chunk]
+    return [prefix,b"\n".join(line[len(prefix):] for line in lines)+(b"\n" if trailing else b"")]
+
+def _add_prefix(chunk, prefix):
+    if not prefix or not chunk:
+        return chunk
+    if chunk.endswith(b"\n"):
+        return prefix+chunk[:-1].replace(b"\n",b"\n"+prefix)+b"\n"
+    return prefix+chunk.replace(b"\n",b"\n"+prefix)
+
+class SnapshotArchive:
+    def __init__(self, path, compression=None, max_chunk=64<<10):
+        # A directory of raw captures (ioreg -lw0 output, system_profiler
+        # plists, reports) from many machines.  Each ioreg capture is split
+        # into subtrees stored once by the hash of their contents, so the same
+        # hardware across snapshots costs one copy.  The objects each snapshot
+        # adds go in one pack (with an index of where each one starts) under
+        # packs/, and its manifest under snapshots/ lists its chunks in order.
+        # By default chunks are gzipped (lzma only pulls ahead on objects
+        # much bigger than a chunk) and anything bigger uses lzma.
+        self.path = path
+        self.compression = compression
+        if self.compression == "lzma" and not lzma:
+            raise ValueError("lzma is not available - use gzip")
+        if self.compression and not self.compression in ("lzma","gzip"):
+            raise ValueError("Unknown compression: {}".format(self.compression))
+        self.max_chunk = max_chunk
+        self.packs_dir = os.path.join(path,"packs")
+        self.snapshots_dir = os.path.join(path,"snapshots")
+        self._index = None
+
+    def _compress(self, data):
+        compression = self.compression or ("lzma" if lzma and len(data) > self.max_chunk else "gzip")
+        if compression == "lzma":
+            return lzma.compress(data)
+        return gzip.compress(data) if hasattr(gzip,"compress") else _gzip_compress(data)
+
+    def _decompress(self, data):
+        for magic,kind in MAGIC.items():
+            if data.startswith(magic):
+                if kind == "lzma":
+                    if not lzma:
+                        raise ValueError("This archive needs lzma to read")
+                    return lzma.decompress(data)
+                return gzip.decompress(data) if hasattr(gzip,"decompress") else _gzip_decompress(data)
+        raise ValueError("Unknown object format")
+
+    def get_index(self, force=False):
+        # Maps each object's hash to (pack, offset, length) - a pack's index
+        # is only written once the pack itself is complete
+        if self._index is None or force:
+            self._index = {}
+            if os.path.isdir(self.packs_dir):
+                for name in sorted(os.listdir(self.packs_dir)):
+                    if not name.endswith(".idx"):
+                        continue
+                    with open(os.path.join(self.packs_dir,name)) as f:
+                        for digest,(offset,length) in json.load(f).items():
+                            self._index.setdefault(digest,(name[:-4],offset,length))
+        return self._index
+
+    def get(self, digest, packs=None):
+        # Returns an object's bytes - packs is an optional dict of open pack
+        # files to reuse across calls
+        pack,offset,length = self.get_index()[digest]
+        f = packs.get(pack) if packs is not None else None
+        if f is None:
+            f = open(os.path.join(self.packs_dir,pack+".pack"),"rb")
+            if packs is not None:
+                packs[pack] = f
+        try:
+            f.seek(offset)
+            return self._decompress(f.read(length))
+        finally:
+            if packs is None:
+                f.close()
+
+    def _write_pack(self, name, objects):
+        # Writes the passed [(hash, compressed bytes)] as a new pack
+        if not os.path.isdir(self.packs_dir):
+            os.makedirs(self.packs_dir)
+        pack = "{}-{}".format(name,binascii.hexlify(os.urandom(6)).decode())
+        index,offset = {},0
+        with open(os.path.join(self.packs_dir,pack+".pack"),"wb") as f:
+            for digest,data in objects:
+                f.write(data)
+                index[digest] = [offset,len(data)]
+                offset += len(data)
+        path = os.path.join(self.packs_dir,pack+".idx")
+        with open(path+".tmp","w") as f:
+            json.dump(index,f)
+        os.rename(path+".tmp",path)
+        for digest,(offset,length) in index.items():
+            self.get_index().setdefault(digest,(pack,offset,length))
+
+    def _manifest_path(self, name):
+        if not name or os.sep in name or (os.altsep and os.altsep in name) or name.startswith("."):
+            raise ValueError("Invalid snapshot name: {}".format(name))
+        return os.path.join(self.snapshots_dir,name+".json")
+
+    def snapshots(self):
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(x[:-5] for x in os.listdir(self.snapshots_dir) if x.endswith(".json"))
+
+    def manifest(self, name):
+        with open(self._manifest_path(name)) as f:
+            return json.load(f)
+
+    def add(self, name, files):
+        # Adds a snapshot made of the passed {file name: bytes} - returns its
+        # manifest, with "stats" on how much of it was new
+        # Check the name before anything is written under it
+        path = self._manifest_path(name)
+        manifest = {"name":name,"created":datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),"files":{}}
+        stats = {"bytes":0,"chunks":0,"new_chunks":0,"new_bytes":0,"stored_bytes":0}
+        index = self.get_index(force=True)
+        new = {}
+        def put(data):
+            # Only keep what isn't already in the archive
+            digest = _hash(data)
+            stats["chunks"] += 1
+            if not digest in index and not digest in new:
+                new[digest] = self._compress(data)
+                stats["new_chunks"] += 1
+                stats["new_bytes"] += len(data)
+                stats["stored_bytes"] += len(new[digest])
+            return digest
+        for file_name,data in sorted(files.items()):
+            entry = {"size":len(data),"sha256":_hash(data)}
+            stats["bytes"] += len(data)
+            if is_ioreg(data):
+                states = []
+                def strip(m):
+                    states.append(m.group(2))
+                    return m.group(1)+b">"
+                stripped = CLASS_STATE.sub(strip,data)
+                entry["kind"] = "ioreg"
+                entry["chunks"] = [[put(chunk),prefix.decode("latin-1")] for prefix,chunk in split_ioreg(stripped,self.max_chunk)]
+                entry["states"] = put(b"\n".join(states))
+            else:
+                entry["kind"] = "blob"
+                entry["chunks"] = [[put(data),""]]
+            manifest["files"][file_name] = entry
+        if new:
+            self._write_pack(name,new.items())
+        if not os.path.isdir(self.snapshots_dir):
+            os.makedirs(self.snapshots_dir)
+        temp = "{}.{}.tmp".format(path,os.getpid())
+        with open(temp,"w") as f:
+            json.dump(manifest,f,indent=2,sort_keys=True)
+        os.rename(temp,path)
+        manifest["stats"] = stats
+        return manifest
+
+    def add_paths(self, name, paths):
+        # Adds a snapshot of the passed files, named by their base names
+        files = {}
+        for path in paths:
+            with open(path,"rb") as f:
+                files[os.path.basename(path)] = f.read()
+        return self.add(name,files)
+
+    def extract(self, name, file_name=None):
+        # Returns the original bytes of one file in the snapshot - by default
+        # its first ioreg capture
+        files = self.manifest(name)["files"]
+        if file_name is None:
+            file_name = next((x for x in sorted(files) if files[x]["kind"] == "ioreg"),None)
+        if not file_name in files:
+            raise KeyError(file_name)
+        entry = files[file_name]
+        # Repeated subtrees (identical ports, etc) are only read once
+        cache,packs = {},{}
+        def get(digest):
+            if not digest in cache:
+                cache[digest] = self.get(digest,packs)
+            return cache[digest]
+        try:
+            data = b"".join(_add_prefix(get(digest),prefix.encode("latin-1")) for digest,prefix in entry["chunks"])
+            if entry["kind"] == "ioreg":
+                states = iter(get(entry["states"]).split(b"\n"))
+                data = CLASS_BARE.sub(lambda m: m.group(1)+next(states)+b">",data)
+        finally:
+            for f in packs.values():
+                f.close()
+        return data
+
+    def load_ioreg(self, i, name, plane="IOService", file_name=None):
+        # Feeds a snapshot's ioreg capture straight to an IOReg instance
+        i.ioreg[plane] = ioquery.BufferLines(self.extract(name,file_name))
+        return i.ioreg[plane]
+
+def _gzip_compress(data):
+    # Python 2 has no gzip.compress()
+    import io
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out,mode="wb") as f:
+        f.write(data)
+    return out.getvalue()
+
+def _gzip_decompress(data):
+    import io
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+        return f.read()
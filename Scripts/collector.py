@@ -0,0 +1,166 @@
+import threading, time
+from . import ioreg, run, sources
+
+# How long (in seconds) each plane or source stays cached - None never
+# expires, and 0 recaptures on every call (concurrent callers still share
+# one capture).  Anything not listed uses DEFAULT_TTL.
+DEFAULT_TTLS = {
+    "IOService":30,
+    "IODeviceTree":300,
+    "IOACPIPlane":300,
+    "kexts":60,
+    "os_version":None,
+    "boot_args":300,
+    "audio_devices":30,
+    "pci_devices":3600
+}
+DEFAULT_TTL = 30
+_clock = getattr(time,"monotonic",time.time)
+
+class _Flight:
+    def __init__(self, generation):
+        # One fill in progress - anyone else asking for the same key waits
+        # on it instead of starting their own
+        self.event = threading.Event()
+        self.generation = generation
+        self.value = None
+        self.error = None
+
+class Collector:
+    def __init__(self, root=None, ttls=None, r=None):
+        # A thread safe front end for the collectors - each plane or source
+        # is captured once however many threads ask for it at the same time
+        # (single-flight), kept for its TTL, and can be invalidated
+        # explicitly.  Values handed out are shared, so treat them as read
+        # only.
+        self.r = r or run.Run()
+        self.sources = sources.DataSources(root=root, r=self.r)
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self._lock = threading.Lock()
+        self._cache = {}       # key: (value, when it expires or None)
+        self._flights = {}     # key: _Flight
+        self._generations = {} # source: bumped on each invalidate()
+
+    def _ttl(self, source):
+        return self.ttls.get(source,DEFAULT_TTL)
+
+    def get(self, source, fetch, key=None):
+        # Returns the cached value for (source, key) - or calls fetch() to
+        # fill it.  Only one caller fetches at a time per key, and the rest
+        # get its value (or its exception).
+        key = (source,key)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and (cached[1] is None or _clock() < cached[1]):
+                return cached[0]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(self._generations.get(source,0))
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        fetched = False
+        try:
+            flight.value = fetch()
+            fetched = True
+        except BaseException as e:
+            # KeyboardInterrupt/SystemExit too - waiters shouldn't take that
+            # for a None value
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                # Only cache what fetch() returned - and nothing invalidated
+                # while we were fetching
+                if fetched and self._generations.get(source,0) == flight.generation:
+                    ttl = self._ttl(source)
+                    self._cache[key] = (flight.value,None if ttl is None else _clock()+ttl)
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, *names):
+        # Drops the passed planes/sources (or everything) so the next call
+        # recaptures them - fills already in flight are handed to their
+        # waiters, but not cached
+        with self._lock:
+            for source in names or set(k[0] for k in list(self._cache)+list(self._flights)):
+                self._generations[source] = self._generations.get(source,0)+1
+                for key in [k for k in self._cache if k[0] == source]:
+                    del self._cache[key]
+
+    def put(self, source, value, key=None, ttl=None):
+        # Seeds the cache - e.g. with a saved capture.  It's kept until it's
+        # invalidated unless a ttl is passed.
+        with self._lock:
+            self._cache[(source,key)] = (value,None if ttl is None else _clock()+ttl)
+
+    ###                ###
+    # IORegistry Planes #
+    ###                ###
+
+    def _capture(self, plane):
+        i = ioreg.IOReg()
+        i.r = self.r
+        i.get_ioreg(plane=plane)
+        # Everything derived from this capture is worked out under its lock -
+        # IOReg caches it, so later callers just read the result
+        i.lock = threading.RLock()
+        return i
+
+    def ioreg(self, plane="IOService"):
+        # Returns an IOReg holding a capture of the plane no older than its
+        # TTL - hold its .lock while calling into it
+        return self.get(plane,lambda: self._capture(plane))
+
+    def load_ioreg(self, path, plane="IOService"):
+        # Uses a saved capture for the plane until it's invalidated
+        i = ioreg.IOReg()
+        i.r = self.r
+        i.load_ioreg(path,plane=plane)
+        i.lock = threading.RLock()
+        self.put(plane,i)
+        return i
+
+    def get_all_devices(self, plane="IOService"):
+        i = self.ioreg(plane)
+        with i.lock:
+            return i.get_all_devices(plane=plane)
+
+    def get_codecs(self, plane="IOService"):
+        i = self.ioreg(plane)
+        with i.lock:
+            return i.get_codecs(plane=plane)
+
+    def query(self, selector, plane="IOService"):
+        i = self.ioreg(plane)
+        with i.lock:
+            return i.query(selector,plane=plane)
+
+    ###      ###
+    # Sources #
+    ###      ###
+
+    def get_kexts(self):
+        # The loaded kexts keyed by lowercased bundle id and short name
+        return self.get("kexts",self.sources.get_loaded_kexts)
+
+    def get_os_version(self):
+        return self.get("os_version",self.sources.get_os_version)
+
+    def get_boot_args(self):
+        return self.get("boot_args",self.sources.get_boot_args)
+
+    def get_audio_devices(self):
+        return self.get("audio_devices",self.sources.get_audio_devices)
+
+    def get_pci_devices(self):
+        def fetch():
+            i = ioreg.IOReg()
+            i.r = self.r
+            return i.get_pci_devices()
+        return self.get("pci_devices",fetch)
@@ -0,0 +1,163 @@
+import json, hashlib
+from . import fleet
+
+# Report keys we compare, and the section name each one is shown under
+SECTIONS = (
+    ("codecs","codecs"),
+    ("kexts","kexts"),
+    ("os_version","os"),
+    ("boot_args","boot_args"),
+    ("devices","devices"),
+    ("io_devices","io")
+)
+
+def _hash(value):
+    # Hashes a section's canonical JSON - equal hashes mean there's nothing
+    # to walk
+    return hashlib.sha1(json.dumps(value,sort_keys=True,default=str).encode("utf-8")).hexdigest()
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path,"rb") as f:
+        for block in iter(lambda: f.read(1<<20),b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _flatten(value, prefix=""):
+    # Flattens nested dicts to {"decoded.layout-id":11} so changes can be
+    # listed field by field
+    if not isinstance(value,dict):
+        return {prefix:value}
+    out = {}
+    for k,v in value.items():
+        key = "{}.{}".format(prefix,k) if prefix else str(k)
+        if isinstance(v,dict) and v:
+            out.update(_flatten(v,key))
+        else:
+            out[key] = v
+    return out
+
+def _diff_fields(a, b):
+    # Returns {field: [old, new]} for every field that differs
+    a,b = _flatten(a),_flatten(b)
+    return dict((k,[a.get(k),b.get(k)]) for k in sorted(set(a)|set(b)) if a.get(k) != b.get(k))
+
+def _diff_keyed(a, b):
+    # Compares two {key: record} dicts - records with the same hash are
+    # skipped without walking their fields
+    out = {"added":[],"removed":[],"changed":[]}
+    for key in sorted(set(a)|set(b),key=str):
+        if not key in a:
+            out["added"].append({"key":key,"record":b[key]})
+        elif not key in b:
+            out["removed"].append({"key":key,"record":a[key]})
+        elif _hash(a[key]) != _hash(b[key]):
+            changes = _diff_fields(a[key],b[key])
+            # A key that's missing on one side and None on the other isn't
+            # a change
+            if changes:
+                out["changed"].append({"key":key,"changes":changes})
+    return out
+
+def _codecs(codecs):
+    # Codecs are matched by their controller's device path and address - so
+    # a different codec at the same spot shows as a change
+    return dict((
+        "{}#{}".format(c.get("device_path") or c.get("controller") or "?",c.get("address")),
+        c
+    ) for c in codecs or [])
+
+def _kexts(kexts):
+    return dict((name,dict(kext,loaded=True) if kext else {"loaded":False}) for name,kext in (kexts or {}).items())
+
+def _devices(devices):
+    # Devices are matched by device path, falling back on the ACPI path or
+    # name for any that couldn't be resolved
+    out = {}
+    for match,devs in (devices or {}).items():
+        for d in devs:
+            out[d.get("device_path") or d.get("acpi_path") or d.get("name")] = d
+    return out
+
+def _io_devices(io_devices):
+    return dict((d.get("name"),d) for d in io_devices or [])
+
+KEYED = {"codecs":_codecs,"kexts":_kexts,"devices":_devices,"io_devices":_io_devices}
+
+def diff_reports(a, b):
+    # Compares two report dicts section by section
+    sections = {}
+    for key,name in SECTIONS:
+        if not key in a and not key in b:
+            continue
+        if not key in a or not key in b:
+            sections[name] = {"status":"only in {}".format("b" if key in b else "a")}
+            continue
+        if _hash(a[key]) == _hash(b[key]):
+            sections[name] = {"status":"unchanged"}
+            continue
+        if key in KEYED:
+            result = _diff_keyed(KEYED[key](a[key]),KEYED[key](b[key]))
+        else:
+            result = {"old":a[key],"new":b[key]}
+            if key == "boot_args":
+                old,new = (a[key] or "").split(),(b[key] or "").split()
+                result["added"] = [x for x in new if not x in old]
+                result["removed"] = [x for x in old if not x in new]
+        if key in KEYED and not any(result[x] for x in ("added","removed","changed")):
+            # Only differed by keys set to None on one side
+            sections[name] = {"status":"unchanged"}
+            continue
+        result["status"] = "changed"
+        sections[name] = result
+    return {
+        "identical":all(s["status"] == "unchanged" for s in sections.values()),
+        "sections":sections
+    }
+
+def diff_paths(a, b, pci_devices=None):
+    # Compares two captures or reports (anything fleet.load_report() reads) -
+    # byte for byte identical files aren't loaded at all.  pci_devices names
+    # the devices in raw captures (see fleet.report_from_snapshot())
+    if _file_hash(a) == _file_hash(b):
+        result = {"identical":True,"sections":{}}
+    else:
+        result = diff_reports(fleet.load_report(a,pci_devices=pci_devices),fleet.load_report(b,pci_devices=pci_devices))
+    result.update({"a":a,"b":b})
+    return result
+
+def _describe(key, record):
+    name = record.get("name") if isinstance(record,dict) else None
+    return "{} ({})".format(key,name) if name and name != key else str(key)
+
+def render(result):
+    # Returns a human readable summary of diff_paths()'s result
+    lines = ["Comparing {} -> {}".format(result.get("a","a"),result.get("b","b"))]
+    if result["identical"]:
+        lines.append(" - No differences")
+        return "\n".join(lines)
+    lines.append("")
+    for _,name in SECTIONS:
+        section = result["sections"].get(name)
+        if not section:
+            continue
+        if section["status"] != "changed":
+            lines.append("{}: {}".format(name,section["status"]))
+            continue
+        lines.append("{}:".format(name))
+        if "old" in section:
+            lines.append(" ~ {} -> {}".format(section["old"],section["new"]))
+            if section.get("added"):
+                lines.append(" --> added:   {}".format(" ".join(section["added"])))
+            if section.get("removed"):
+                lines.append(" --> removed: {}".format(" ".join(section["removed"])))
+            continue
+        for x in section["added"]:
+            lines.append(" + {}".format(_describe(x["key"],x["record"])))
+        for x in section["removed"]:
+            lines.append(" - {}".format(_describe(x["key"],x["record"])))
+        for x in section["changed"]:
+            lines.append(" ~ {}".format(x["key"]))
+            for field,(old,new) in sorted(x["changes"].items()):
+                lines.append(" --> {}: {} -> {}".format(field,old,new))
+    return "\n".join(lines)
@@ -0,0 +1,215 @@
+import os, json, multiprocessing
+from collections import Counter, defaultdict
+from . import archive, ioreg, plist
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport - analyze() runs serially
+    ProcessPoolExecutor = None
+
+# Structured reports as written by CheckAudio.py --format json/ndjson/plist,
+# and raw ioreg -lw0 captures of the IOService plane.  .txt and .log files
+# are only treated as captures if they look like one - anything else (like
+# an Audio.log report) is reported as unreadable rather than counted.
+REPORT_EXTENSIONS = (".json",".ndjson",".plist")
+SNAPSHOT_EXTENSIONS = (".txt",".ioreg",".log")
+# The kexts we track the version spread for
+VERSION_KEXTS = ("Lilu","AppleALC","WhateverGreen")
+# Below this many files, spawning worker processes costs more than it saves
+SERIAL_THRESHOLD = 64
+
+def find_captures(path):
+    # Walks the passed directory (or single file) for reports and snapshots
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root,dirs,files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(REPORT_EXTENSIONS+SNAPSHOT_EXTENSIONS):
+                found.append(os.path.join(root,name))
+    return found
+
+def _report_from_records(records):
+    # Rebuilds a report dict from NDJSON (kind, data) records
+    report = {"codecs":[],"kexts":{},"devices":{},"io_devices":[]}
+    for kind,data in records:
+        if kind == "meta":
+            report.update(data)
+        elif kind in ("os_version","boot_args"):
+            # As streamed to an NDJSON log alongside Audio.log
+            report[kind] = data.get("value")
+        elif kind == "codec":
+            report["codecs"].append(data)
+        elif kind == "kext":
+            data = dict(data)
+            name = data.pop("check",data.get("name"))
+            report["kexts"][name] = data if data.pop("loaded",True) else None
+        elif kind == "device":
+            data = dict(data)
+            report["devices"].setdefault(data.pop("match",data.get("name","").split("@")[0]),[]).append(data)
+        elif kind == "io_device":
+            report["io_devices"].append(data)
+    return report
+
+def report_from_snapshot(path, devices=("HDEF","HDAU"), properties=ioreg.DEVICE_PROPERTIES, pci_devices=None):
+    # Builds a partial report (codecs and devices) from a raw ioreg capture -
+    # raises a ValueError if it isn't one.  Devices are only named from
+    # pci.ids unless system_profiler's device list is passed, as the capture
+    # may well be from another machine.
+    with open(path,"rb") as f:
+        if not archive.is_ioreg(f.read(4096)):
+            raise ValueError("Not an ioreg -lw0 capture")
+    i = ioreg.IOReg()
+    i.load_ioreg(path,plane="IOService")
+    codecs = [dict((k,v) for k,v in c.items() if k != "controller_line") for c in i.get_codecs(plane="IOService")]
+    report = {"codecs":codecs,"kexts":{},"devices":dict((d,[]) for d in devices),"io_devices":[]}
+    pci_devices = [] if pci_devices is None else pci_devices
+    for dev in i.get_all_devices(plane="IOService").values():
+        if dev["name_no_addr"] in devices:
+            report["devices"][dev["name_no_addr"]].append(i.get_device_record(dev,properties=properties,pci_devices=pci_devices))
+    # AppleHDA's driver class shows up in the registry when it's loaded
+    report["kexts"]["AppleHDA"] = {"bundle_id":"com.apple.driver.AppleHDA","version":None} \
+        if i.query("class=AppleHDADriver",plane="IOService") else None
+    return report
+
+def _report_from_plist(report):
+    # Plist reports have no None values - kexts carry a loaded flag instead
+    kexts = report.get("kexts")
+    if isinstance(kexts,dict):
+        report["kexts"] = {}
+        for name,kext in kexts.items():
+            kext = dict(kext or {})
+            report["kexts"][name] = kext if kext.pop("loaded",True) else None
+    return report
+
+def load_report(path, pci_devices=None):
+    # Loads any supported capture as a report dict - pci_devices is passed on
+    # to report_from_snapshot() for raw captures
+    lower = path.lower()
+    if lower.endswith(".json"):
+        with open(path,"rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+    if lower.endswith(".ndjson"):
+        with open(path,"rb") as f:
+            records = (json.loads(l) for l in f.read().decode("utf-8").split("\n") if l.strip())
+            return _report_from_records((r.get("kind"),r.get("data",{})) for r in records)
+    if lower.endswith(".plist"):
+        with open(path,"rb") as f:
+            return _report_from_plist(plist.load(f))
+    return report_from_snapshot(path, pci_devices=pci_devices)
+
+def _get_layout(report, codec):
+    # Resolves the layout-id applied to the passed codec - AppleALC prefers
+    # the alcid boot-arg, then alc-layout-id, then layout-id
+    for arg in (report.get("boot_args") or "").split():
+        if arg.startswith("alcid="):
+            try:
+                return int(arg.split("=",1)[1],0)
+            except:
+                pass
+    for devs in report.get("devices",{}).values():
+        for dev in devs:
+            if codec.get("device_path") and dev.get("device_path") != codec["device_path"]:
+                continue
+            decoded = dev.get("decoded",{})
+            for key in ("alc-layout-id","layout-id"):
+                if decoded.get(key) is not None:
+                    return decoded[key]
+    return None
+
+def summarize(path):
+    # Reduces a capture to the few values analyze() aggregates - kept small
+    # so sending it back from a worker process is cheap
+    try:
+        report = load_report(path)
+    except Exception as e:
+        return {"path":path,"error":"{}: {}".format(type(e).__name__,e)}
+    codecs = []
+    for c in report.get("codecs",[]):
+        try:
+            key = "0x{:04x}:0x{:04x}".format(c["vendor_id"],c["device_id"])
+        except:
+            continue
+        if c.get("vendor_name"):
+            key += " ({})".format(c["vendor_name"])
+        codecs.append((key,_get_layout(report,c)))
+    kexts = report.get("kexts",{})
+    return {
+        "path":path,
+        "codecs":codecs,
+        "kexts":dict((k,(kexts[k] or {}).get("version") if kexts[k] else None) for k in VERSION_KEXTS if k in kexts),
+        "applehda":None if not "AppleHDA" in kexts else bool(kexts["AppleHDA"])
+    }
+
+def _summarize_chunk(paths):
+    return [summarize(p) for p in paths]
+
+def _iter_summaries(paths, workers=None):
+    if ProcessPoolExecutor is None or workers == 1 or len(paths) < SERIAL_THRESHOLD:
+        for p in paths:
+            yield summarize(p)
+        return
+    # Hand out paths in chunks so per-task overhead stays negligible
+    workers = workers or multiprocessing.cpu_count()
+    size = max(1,min(256,len(paths)//(workers*4)))
+    chunks = [paths[x:x+size] for x in range(0,len(paths),size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_summarize_chunk,chunks):
+            for s in chunk:
+                yield s
+
+def analyze(path, workers=None):
+    # Aggregates every capture found under path into a single dict
+    paths = find_captures(path)
+    codecs = Counter()
+    layouts = defaultdict(Counter)
+    versions = dict((k,Counter()) for k in VERSION_KEXTS)
+    missing_hda = []
+    errors = {}
+    for s in _iter_summaries(paths, workers=workers):
+        if "error" in s:
+            errors[s["path"]] = s["error"]
+            continue
+        for key,layout in s["codecs"]:
+            codecs[key] += 1
+            layouts[key]["unset" if layout is None else str(layout)] += 1
+        for k,v in s["kexts"].items():
+            versions[k][v or "not loaded"] += 1
+        if s["applehda"] is False:
+            missing_hda.append(s["path"])
+    return {
+        "captures":len(paths),
+        "errors":errors,
+        "codecs":dict(codecs),
+        "layouts":dict((k,dict(v)) for k,v in layouts.items()),
+        "kext_versions":dict((k,dict(v)) for k,v in versions.items()),
+        "missing_applehda":missing_hda
+    }
+
+def render(results):
+    # Returns a human readable summary of analyze()'s results
+    lines = ["Analyzed {:,} capture{}".format(results["captures"],"" if results["captures"]==1 else "s")]
+    if results["errors"]:
+        lines.append(" - {:,} failed to load".format(len(results["errors"])))
+    lines.append("")
+    lines.append("Codecs:")
+    for key,count in sorted(results["codecs"].items(),key=lambda x:(-x[1],x[0])) or [("None found",0)]:
+        lines.append(" - {}{}".format(key," x{:,}".format(count) if count else ""))
+        for layout,l_count in sorted(results["layouts"].get(key,{}).items(),key=lambda x:(-x[1],x[0])):
+            lines.append(" --> layout-id {}: {:,}".format(layout,l_count))
+    lines.append("")
+    lines.append("Kext versions:")
+    for kext in VERSION_KEXTS:
+        spread = results["kext_versions"].get(kext,{})
+        lines.append(" - {}".format(kext))
+        for vers,count in sorted(spread.items(),key=lambda x:(-x[1],x[0])) or [("No data",0)]:
+            lines.append(" --> {}{}".format(vers,": {:,}".format(count) if count else ""))
+    lines.append("")
+    lines.append("Missing AppleHDA: {:,}".format(len(results["missing_applehda"])))
+    for p in results["missing_applehda"]:
+        lines.append(" - {}".format(p))
+    for p,e in sorted(results["errors"].items()):
+        lines.append("Error loading {}: {}".format(p,e))
+    return "\n".join(lines)
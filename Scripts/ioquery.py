@@ -0,0 +1,444 @@
+import os, mmap, shlex
+from bisect import bisect_left
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # Python 2
+    from collections import Mapping
+
+# Axes that can sit between selector steps:
+# A > B   B is a child of A
+# A >> B  B is a descendant of A
+# A < B   B is the parent of A
+# A << B  B is an ancestor of A
+AXES = (">",">>","<","<<")
+
+def get_entry_id(line):
+    # Returns the registry entry id from a class line as an int - this is
+    # the same in every plane, so it's what we join planes on
+    try:
+        for part in line.split("<class ",1)[1].split(","):
+            part = part.strip()
+            if part.startswith("id 0x"):
+                return int(part[3:],16)
+    except:
+        pass
+    return None
+
+def _add_node(nodes, _path, line, info):
+    # Appends a node for the passed class line - _path is the stack of
+    # [pad, node index] above it, and is updated in place.  Returns the node,
+    # or None if the line couldn't be parsed.
+    parts = line.split("+-o ")
+    pad = len(parts[0])
+    while len(_path) and _path[-1][0] >= pad:
+        # Drop anything nested equal to or further than us
+        del _path[-1]
+    try:
+        name = parts[1].split("  ")[0]
+        clss = parts[1].split("<class ")[1].split(",")[0].rstrip(">")
+    except:
+        return None
+    parent = _path[-1][1] if _path else None
+    # Paths follow IOKit's - relative to the plane's root, which is
+    # the entry just below the registry's Root
+    parent_path = None
+    if parent is not None and not (nodes[parent]["parent"] is None and nodes[parent]["class"] == "IORegistryEntry"):
+        parent_path = nodes[parent]["path"]
+    node = {
+        "index":len(nodes),
+        "name":name,
+        "name_no_addr":name.split("@")[0],
+        "addr":name.split("@")[-1] if "@" in name else None,
+        "class":clss,
+        "id":get_entry_id(line),
+        "path":"/" if parent_path is None else "{}/{}".format(parent_path.rstrip("/"),name),
+        "depth":len(_path),
+        "parent":parent,
+        "children":[],
+        "info":info,
+        "line":line,
+        "offset":None
+    }
+    if parent is not None:
+        nodes[parent]["children"].append(node["index"])
+    nodes.append(node)
+    _path.append([pad,node["index"]])
+    return node
+
+def _parse_property(line, info):
+    # Adds a "key" = value line to the passed dict
+    if not " = " in line:
+        return
+    try:
+        name,value = line.split(" = ",1)
+        info[name.split('"')[1]] = value
+    except:
+        pass
+
+def parse_nodes(lines):
+    # Walks ioreg -lw0 output once and returns a list of node dicts in
+    # document order.  Each node knows its parent and children by index, so
+    # the axes never need to go back to the raw lines.
+    if isinstance(lines, BufferLines):
+        return parse_buffer(lines)
+    if not isinstance(lines, list):
+        lines = list(lines)
+    nodes = []
+    _path = [] # Stack of [pad, node index]
+    # Properties are left as the span of lines between class lines until
+    # they're used
+    starts = [x for x,line in enumerate(lines) if "+-o " in line]
+    for n,x in enumerate(starts):
+        end = starts[n+1] if n+1 < len(starts) else len(lines)
+        _add_node(nodes, _path, lines[x], LazyLineInfo(lines, x+1, end))
+    return nodes
+
+def scan_class_lines(buf, size=None):
+    # Finds every class line in raw ioreg output with find() - nothing is
+    # decoded.  Returns (starts, depths, parents): the offset each line
+    # starts at, how many entries sit above it, and its parent's position in
+    # those lists (or None at the top).
+    size = len(buf) if size is None else size
+    starts,depths,parents = [],[],[]
+    stack = [] # [pad, position]
+    pos = buf.find(b"+-o ") if size else -1
+    while pos != -1:
+        start = buf.rfind(b"\n",0,pos)+1
+        pad = pos-start
+        while stack and stack[-1][0] >= pad:
+            stack.pop()
+        starts.append(start)
+        depths.append(len(stack))
+        parents.append(stack[-1][1] if stack else None)
+        stack.append([pad,len(starts)-1])
+        end = buf.find(b"\n",pos)
+        pos = -1 if end == -1 else buf.find(b"+-o ",end)
+    return starts,depths,parents
+
+def parse_buffer(lines):
+    # The same as parse_nodes() for a BufferLines capture - but we only
+    # visit the class lines, found by scan_class_lines().  Everything
+    # between two of them is left undecoded as a LazyInfo until its
+    # properties are used.
+    buf,size = lines.buf,lines.size
+    nodes = []
+    _path = []
+    starts = scan_class_lines(buf,size)[0]
+    for n,start in enumerate(starts):
+        end = buf.find(b"\n",start)
+        end = size if end == -1 else end
+        block_end = starts[n+1] if n+1 < len(starts) else size
+        line = buf[start:end].decode("utf-8","ignore").rstrip("\r")
+        node = _add_node(nodes, _path, line, LazyInfo(buf, end+1, block_end))
+        if node:
+            # Where the class line starts in the buffer
+            node["offset"] = start
+    return nodes
+
+class BufferLines:
+    def __init__(self, buf):
+        # Wraps raw ioreg output (bytes, or a map of a saved capture).
+        # Iterating yields each line decoded in turn, like a list of lines
+        # would - without ever holding them all.
+        self.buf = buf
+        self.size = len(buf)
+        self._len = None
+
+    def __iter__(self):
+        buf,pos = self.buf,0
+        while self.size:
+            end = buf.find(b"\n",pos)
+            if end == -1:
+                yield buf[pos:].decode("utf-8","ignore").rstrip("\r")
+                break
+            yield buf[pos:end].decode("utf-8","ignore").rstrip("\r")
+            pos = end+1
+
+    def __len__(self):
+        # The line count - matching what split("\n") would return
+        if self._len is None:
+            if hasattr(self.buf,"count"):
+                self._len = self.buf.count(b"\n")+1 if self.size else 0
+            else:
+                # mmap has no count()
+                self._len,pos = 0,0
+                while pos != -1:
+                    self._len += 1
+                    pos = self.buf.find(b"\n",pos)
+                    pos = -1 if pos == -1 else pos+1
+                self._len = self._len if self.size else 0
+        return self._len
+
+    def __bool__(self):
+        return self.size > 0
+    __nonzero__ = __bool__
+
+class MappedLines(BufferLines):
+    def __init__(self, path):
+        # Memory maps a saved ioreg capture
+        self.path = path
+        self._file = open(path,"rb")
+        size = os.fstat(self._file.fileno()).st_size
+        BufferLines.__init__(self, mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ) if size else b"")
+
+    def close(self):
+        if self.size:
+            self.buf.close()
+        self._file.close()
+
+class LazyInfo(Mapping):
+    def __init__(self, buf, start, end):
+        # A node's properties as offsets into a BufferLines buffer.  Looking
+        # up a key finds and decodes just that property - anything that needs
+        # them all (iterating, len()) parses the whole block into a dict.
+        self._buf = buf
+        self._span = (start,end)
+        self._info = None
+        self._found = {}
+
+    def _load(self):
+        if self._info is None:
+            self._info = {}
+            start,end = self._span
+            if end > start:
+                for line in self._buf[start:end].decode("utf-8","ignore").split("\n"):
+                    _parse_property(line.rstrip("\r"), self._info)
+        return self._info
+
+    def _find(self, key):
+        # Returns the raw value for key, or None if it's not set
+        if self._info is not None:
+            return self._info.get(key)
+        if not key in self._found:
+            start,end = self._span
+            needle = '"{}" = '.format(key).encode("utf-8")
+            pos = self._buf.find(needle,start,end)
+            # Only match a key at the start of a property line
+            while pos != -1 and self._buf[pos-1:pos] != b" ":
+                pos = self._buf.find(needle,pos+1,end)
+            value = None
+            if pos != -1:
+                line_end = self._buf.find(b"\n",pos,end)
+                line_end = end if line_end == -1 else line_end
+                value = self._buf[pos+len(needle):line_end].decode("utf-8","ignore").rstrip("\r")
+            self._found[key] = value
+        return self._found[key]
+
+    def __getitem__(self, key):
+        value = self._find(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+class LazyLineInfo(LazyInfo):
+    # The same as LazyInfo over a list of lines - the span is line indexes
+    def _load(self):
+        if self._info is None:
+            self._info = {}
+            start,end = self._span
+            for line in self._buf[start:end]:
+                _parse_property(line, self._info)
+        return self._info
+
+    def _find(self, key):
+        if self._info is not None:
+            return self._info.get(key)
+        if not key in self._found:
+            start,end = self._span
+            needle = '"{}" = '.format(key)
+            value = None
+            for x in range(start,end):
+                if not needle in self._buf[x]:
+                    continue
+                found = {}
+                _parse_property(self._buf[x], found)
+                if key in found:
+                    value = found[key]
+                    break
+            self._found[key] = value
+        return self._found[key]
+
+def _normalize(value):
+    # Returns the key a property value is indexed under - strings ("0") and
+    # string data (<"PNP0A03">) are unwrapped to their text first, then
+    # ints (including little endian <0b000000> data) compare by value, and
+    # everything else as that text.  Selector values go through the same,
+    # so prop:_UID=0 and prop:_UID='"0"' both match "_UID" = "0"
+    value = value.strip()
+    if len(value) > 3 and value[:2]=='<"' and value[-2:]=='">':
+        value = value[2:-2]
+    elif len(value) > 1 and value[0]==value[-1]=='"':
+        value = value[1:-1]
+    elif len(value) > 2 and value[0]=="<" and value[-1]==">":
+        try:
+            val_hex = "0"*(len(value[1:-1])%2)+value[1:-1]
+            return int("".join([val_hex[i:i+2] for i in range(0,len(val_hex),2)][::-1]),16)
+        except:
+            pass
+    try:
+        return int(value,0)
+    except:
+        pass
+    return value
+
+def compile_selector(selector):
+    # Splits a selector into [(axis, [(field, key, value)])] steps - the
+    # first step's axis is None.  Raises a ValueError if it's malformed.
+    try:
+        tokens = shlex.split(selector)
+    except ValueError as e:
+        raise ValueError("Malformed selector: {}".format(e))
+    steps = []
+    axis = None
+    terms = []
+    for token in tokens:
+        if token in AXES:
+            if not terms:
+                raise ValueError("Axis '{}' needs a step on both sides".format(token))
+            steps.append((axis,terms))
+            axis,terms = token,[]
+            continue
+        if token == "*":
+            terms.append(("all",None,None))
+            continue
+        if not "=" in token:
+            if token.startswith("prop:") and len(token) > 5:
+                terms.append(("has",token[5:],None))
+                continue
+            raise ValueError("Expected key=value, got '{}'".format(token))
+        field,value = token.split("=",1)
+        if field in ("class","name","path"):
+            terms.append((field,None,value))
+        elif field == "id":
+            try:
+                terms.append((field,None,int(value,0)))
+            except ValueError:
+                raise ValueError("Expected an int for id, got '{}'".format(value))
+        elif field.startswith("prop:") and len(field) > 5:
+            terms.append(("prop",field[5:],_normalize(value)))
+        else:
+            raise ValueError("Unknown field '{}' (valid: class, name, id, path, prop:<key>)".format(field))
+    if not terms:
+        raise ValueError("Empty selector" if not steps else "Trailing axis '{}'".format(axis))
+    steps.append((axis,terms))
+    return steps
+
+class IOQuery:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.by_class = {}
+        self.by_name = {}
+        self.by_name_no_addr = {}
+        self.by_id = {}
+        for node in nodes:
+            if node["id"] is not None:
+                self.by_id[node["id"]] = node["index"]
+            self.by_class.setdefault(node["class"],set()).add(node["index"])
+            self.by_name.setdefault(node["name"],set()).add(node["index"])
+            self.by_name_no_addr.setdefault(node["name_no_addr"],set()).add(node["index"])
+        # Sorted so a path prefix is a bisect and a short forward walk - built
+        # on the first path query
+        self.paths = None
+        # Built the first time each property key is queried
+        self.by_prop = {}
+
+    def _prop_index(self, key):
+        if not key in self.by_prop:
+            index = {}
+            for node in self.nodes:
+                if key in node["info"]:
+                    index.setdefault(_normalize(node["info"][key]),set()).add(node["index"])
+            self.by_prop[key] = index
+        return self.by_prop[key]
+
+    def _path_prefix(self, prefix):
+        # Accept paths as ioreg prints them - IOService:/AppleACPIPlatformExpert
+        if ":/" in prefix:
+            prefix = prefix.split(":",1)[1]
+        prefix = "/"+prefix.strip("/") if prefix.strip("/") else "/"
+        if self.paths is None:
+            self.paths = sorted((node["path"],node["index"]) for node in self.nodes)
+        out = set()
+        for path,i in self.paths[bisect_left(self.paths,(prefix,-1)):]:
+            if not path.startswith(prefix):
+                break
+            # Only match whole path components
+            if prefix == "/" or len(path) == len(prefix) or path[len(prefix)] == "/":
+                out.add(i)
+        return out
+
+    def _candidates(self, field, key, value):
+        if field == "all":
+            return set(range(len(self.nodes)))
+        if field == "class":
+            return self.by_class.get(value,set())
+        if field == "name":
+            return (self.by_name if "@" in value else self.by_name_no_addr).get(value,set())
+        if field == "id":
+            return set([self.by_id[value]]) if value in self.by_id else set()
+        if field == "path":
+            return self._path_prefix(value)
+        if field == "has":
+            return set().union(*self._prop_index(key).values())
+        return self._prop_index(key).get(value,set())
+
+    def _match(self, terms):
+        # Intersects each term's index lookup - smallest set first
+        sets = sorted((self._candidates(*t) for t in terms),key=len)
+        out = set(sets[0])
+        for s in sets[1:]:
+            if not out:
+                break
+            out &= s
+        return out
+
+    def get(self, entry_id):
+        # Returns the node with the passed registry entry id, or None
+        i = self.by_id.get(entry_id)
+        return None if i is None else self.nodes[i]
+
+    def ancestors(self, node):
+        # Yields the passed node's ancestors - closest first
+        while node["parent"] is not None:
+            node = self.nodes[node["parent"]]
+            yield node
+
+    def parent(self, node):
+        return None if node["parent"] is None else self.nodes[node["parent"]]
+
+    def children(self, node):
+        return [self.nodes[i] for i in node["children"]]
+
+    def select(self, selector):
+        # Returns the nodes matched by the passed selector in document order
+        current = None
+        for axis,terms in compile_selector(selector):
+            matched = self._match(terms)
+            if axis == ">":
+                matched = set(i for i in matched if self.nodes[i]["parent"] in current)
+            elif axis == ">>":
+                matched = set(i for i in matched if any(a["index"] in current for a in self.ancestors(self.nodes[i])))
+            elif axis == "<":
+                matched &= set(self.nodes[i]["parent"] for i in current)
+            elif axis == "<<":
+                above = set()
+                for i in current:
+                    for a in self.ancestors(self.nodes[i]):
+                        if a["index"] in above:
+                            break # Already walked from here up
+                        above.add(a["index"])
+                matched &= above
+            current = matched
+            if not current:
+                break
+        return [self.nodes[i] for i in sorted(current)]
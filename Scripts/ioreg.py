@@ -1,9 +1,59 @@
-import os, sys, binascii, json, gzip
-from . import run
+import os, binascii, json, gzip, time
+from collections import Counter
+from . import run, ioquery, metrics
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport - get_all_devices() runs serially
+    ProcessPoolExecutor = None
+
+# The device properties get_device_record() reports by default
+DEVICE_PROPERTIES = ("built-in","alc-layout-id","layout-id","hda-gfx","no-controller-patch","acpi-path")
+
+def _shard_devices(path, subtrees, base_chains):
+    # Runs in a worker process - parses each subtree of a capture (either
+    # (start, end) offsets into the file at path, or (start, bytes) if path is
+    # None) and returns (offset, record) for each device found.  Properties
+    # are sent back as their span in the capture rather than parsed, so the
+    # caller can wrap them in a LazyInfo over its own copy.
+    i = IOReg()
+    mapped = ioquery.MappedLines(path) if path else None
+    out = []
+    try:
+        for (start,data),base in zip(subtrees,base_chains):
+            if mapped:
+                data = mapped.buf[start:data]
+            nodes = ioquery.parse_nodes(ioquery.BufferLines(data))
+            for node,chain in i._walk_devices(nodes,base_chains=[base]):
+                record = i._device_record(node,chain)
+                span = node["info"]._span
+                record["info"] = (start+span[0],start+span[1])
+                out.append((start+node["offset"],record))
+    finally:
+        if mapped:
+            mapped.close()
+    return out
 
 class IOReg:
     def __init__(self):
         self.ioreg = {}
+        self.indexes = {}
+        # get_all_devices() results per plane, with the index they came from
+        self.devices = {}
+        # Targeted ioreg -r captures keyed by (plane, flag, value), and the
+        # indexes built over combinations of them
+        self.targeted = {}
+        self.targeted_indexes = {}
+        # The most targeted captures we'll fork for one set of queries before
+        # a single full dump of the plane is the cheaper option
+        self.max_targeted = 4
+        # Captures at least this big are memory mapped by load_ioreg()
+        self.mmap_threshold = 32 << 20
+        # get_all_devices(workers=N) only shards captures at least this big
+        self.shard_threshold = 8 << 20
+        # Every plan query_many() carried out - with its timings
+        self.plan_log = []
         self.pci_devices = []
         self.r = run.Run()
         self.d = None # Placeholder
@@ -57,38 +107,229 @@ class IOReg:
     def _get_pcix_uid(self,item,allow_fallback=True,fallback_uid=0,plane="IOService",force=False):
         # Helper to look for the passed item's _UID
         # Expects a XXXX@Y style string
-        self.get_ioreg(plane=plane,force=force)
+        index = self.get_index(plane=plane,force=force)
         # Ensure our item ends with 2 spaces
         item = item.rstrip()+"  "
         item_uid = None
-        found_device = False
-        for line in self.ioreg[plane]:
-            if item in line:
-                found_device = True
-                continue
-            if not found_device:
-                continue # Haven't found it yet
-            # We have the device here - let's look for _UID or a closing
-            # curly bracket
-            if line.replace("|","").strip() == "}":
-                break # Bail on the loop
-            elif '"_UID" = "' in line:
-                # Got a _UID - let's rip it
-                try:
-                    item_uid = int(line.split('"_UID" = "')[1].split('"')[0])
-                except:
-                    # Some _UIDs are strings - but we won't accept that here
-                    # as we're ripping it specifically for PciRoot/Pci pathing
-                    break
+        node = next((n for n in index.nodes if item in n["line"]),None)
+        # Only the one property is decoded
+        _uid = node["info"].get("_UID") if node else None
+        if _uid and _uid.startswith('"'):
+            # Got a _UID - let's rip it
+            try:
+                item_uid = int(_uid[1:].split('"')[0])
+            except:
+                # Some _UIDs are strings - but we won't accept that here
+                # as we're ripping it specifically for PciRoot/Pci pathing
+                pass
         if item_uid is None and allow_fallback:
             return fallback_uid
         return item_uid
 
     def get_ioreg(self,plane="IOService",force=False):
         if force or not self.ioreg.get(plane,None):
-            self.ioreg[plane] = self.r.run({"args":["ioreg", "-lw0", "-p", plane]})[0].split("\n")
+            # Keep the output as bytes - only what gets parsed is decoded
+            self.ioreg[plane] = ioquery.BufferLines(self.r.run({"args":["ioreg", "-lw0", "-p", plane],"raw":True})[0])
+            metrics.inc("ioreg_capture_bytes_total",self.ioreg[plane].size,plane=plane,source="ioreg")
+        return self.ioreg[plane]
+
+    def load_ioreg(self,path,plane="IOService",use_mmap=None):
+        # Loads a saved ioreg -lw0 capture in place of running ioreg - this
+        # allows working with captures from other machines offline.  Large
+        # captures (or any, with use_mmap=True) are memory mapped and read
+        # a line at a time rather than split into a list up front.
+        if use_mmap is None:
+            use_mmap = os.path.getsize(path) >= self.mmap_threshold
+        if use_mmap:
+            self.ioreg[plane] = ioquery.MappedLines(path)
+        else:
+            with open(path,"rb") as f:
+                self.ioreg[plane] = ioquery.BufferLines(f.read())
+        metrics.inc("ioreg_capture_bytes_total",self.ioreg[plane].size,plane=plane,source="file")
         return self.ioreg[plane]
 
+    def get_index(self,plane="IOService",force=False):
+        # Parses the plane into nodes once and retains the IOQuery built on
+        # them - rebuilt whenever the plane is refetched or loaded
+        lines = self.get_ioreg(plane=plane,force=force)
+        cached = self.indexes.get(plane)
+        if not cached or cached[0] is not lines:
+            self.indexes[plane] = (lines,ioquery.IOQuery(self._parse_nodes(lines,plane)))
+        return self.indexes[plane][1]
+
+    def _parse_nodes(self,lines,plane):
+        # ioquery.parse_nodes() - reporting what it cost
+        with metrics.timer("ioreg_parse_seconds",plane=plane):
+            nodes = ioquery.parse_nodes(lines)
+        metrics.inc("ioreg_nodes_built_total",len(nodes),plane=plane)
+        if isinstance(lines,ioquery.MappedLines):
+            # Counting a map's lines means walking it in Python - bytes
+            # stand in for those
+            metrics.inc("ioreg_bytes_parsed_total",lines.size,plane=plane)
+        else:
+            metrics.inc("ioreg_lines_parsed_total",len(lines),plane=plane)
+            if isinstance(lines,ioquery.BufferLines):
+                metrics.inc("ioreg_bytes_parsed_total",lines.size,plane=plane)
+        return nodes
+
+    def query(self,selector,plane="IOService",force=False,paths=False):
+        # Returns the nodes matched by the passed selector, for example:
+        # class=IOPCIDevice prop:vendor-id=0x8086
+        # name=HDEF >> class=IOHDACodecDevice
+        # See Scripts/ioquery.py for the full syntax
+        return self.query_many([selector],plane=plane,force=force,paths=paths)[0]
+
+    def _get_target(self,selector):
+        # Returns the (flag, value) an ioreg -r capture can be narrowed to for
+        # the passed selector, or None if it needs the whole plane.  -r only
+        # prints the matched entries and what's below them - so ancestor axes
+        # and paths (which are relative to the plane's root) rule it out.
+        steps = ioquery.compile_selector(selector)
+        if any(axis in ("<","<<") for axis,terms in steps):
+            return None
+        if any(t[0] == "path" for axis,terms in steps for t in terms):
+            return None
+        for field,key,value in steps[0][1]:
+            if field == "class":
+                return ("-c",value)
+        for field,key,value in steps[0][1]:
+            if field == "name":
+                # -n matches the name without its @location
+                return ("-n",value.split("@")[0])
+        return None
+
+    def plan(self,selectors,plane="IOService",force=False,paths=False):
+        # Decides how to capture what the passed selectors need - either use
+        # what we already have, fork a few targeted ioreg -r captures, or do
+        # a full dump of the plane.  Targeted captures don't know where they
+        # sit in the plane - pass paths=True if the results' paths and depths
+        # are needed.
+        plan = {"plane":plane,"selectors":list(selectors),"targets":[],"commands":[]}
+        if self.ioreg.get(plane) and not force:
+            plan.update({"strategy":"cached","reason":"the plane is already captured"})
+            return plan
+        if paths:
+            plan.update({"strategy":"full","reason":"paths need the whole plane"})
+            return plan
+        targets = []
+        for selector in selectors:
+            target = self._get_target(selector)
+            if target is None:
+                plan.update({"strategy":"full","reason":"'{}' needs the whole plane".format(selector)})
+                return plan
+            if not target in targets:
+                targets.append(target)
+        if len(targets) > self.max_targeted:
+            plan.update({"strategy":"full","reason":"{} targeted captures is more than {}".format(len(targets),self.max_targeted)})
+            return plan
+        plan.update({"strategy":"targeted","targets":targets,"reason":"{} targeted capture{}".format(len(targets),"" if len(targets)==1 else "s")})
+        return plan
+
+    def _get_targeted_index(self,plan,force=False):
+        # Runs (or reuses) each capture in the plan and returns an IOQuery
+        # over all of them
+        captures = []
+        for flag,value in plan["targets"]:
+            key = (plan["plane"],flag,value)
+            if force or not key in self.targeted:
+                args = ["ioreg","-lw0","-r","-p",plan["plane"],flag,value]
+                start = time.time()
+                self.targeted[key] = self.r.run({"args":args,"raw":True})[0]
+                plan["commands"].append({"args":args,"seconds":time.time()-start,"bytes":len(self.targeted[key])})
+            captures.append(self.targeted[key])
+        key = (plan["plane"],)+tuple(plan["targets"])
+        if force or not key in self.targeted_indexes:
+            lines = ioquery.BufferLines(b"\n".join(captures))
+            nodes = self._parse_nodes(lines,plan["plane"])
+            # Each capture starts at its matched entry rather than the plane's
+            # root - so there's no path or depth to give
+            for node in nodes:
+                node["path"] = node["depth"] = None
+            self.targeted_indexes[key] = ioquery.IOQuery(nodes)
+        return self.targeted_indexes[key]
+
+    def query_many(self,selectors,plane="IOService",force=False,paths=False):
+        # Plans, captures, and runs the passed selectors - returning a list of
+        # results in the same order.  The plan and its timings are appended
+        # to self.plan_log.  Nodes from targeted captures have their path and
+        # depth set to None - paths=True always captures the whole plane.
+        plan = self.plan(selectors,plane=plane,force=force,paths=paths)
+        start = time.time()
+        if plan["strategy"] == "targeted":
+            index = self._get_targeted_index(plan,force=force)
+        else:
+            if plan["strategy"] == "full":
+                args = ["ioreg","-lw0","-p",plane]
+                cap_start = time.time()
+                self.get_ioreg(plane=plane,force=True)
+                plan["commands"].append({"args":args,"seconds":time.time()-cap_start,"bytes":self.ioreg[plane].size})
+            index = self.get_index(plane=plane)
+        results = []
+        for selector in selectors:
+            nodes = index.select(selector)
+            if plan["strategy"] == "targeted":
+                # Overlapping -r captures can print the same entry twice
+                seen = set()
+                nodes = [n for n in nodes if n["id"] is None or not (n["id"] in seen or seen.add(n["id"]))]
+            results.append(nodes)
+        plan["seconds"] = time.time()-start
+        self.plan_log.append(plan)
+        return results
+
+    def join(self,entry,plane="IOService",force=False):
+        # Returns the node for the same registry entry in the passed plane,
+        # or None.  Takes an entry id, or any node/device dict with an id.
+        if isinstance(entry,dict):
+            entry = entry.get("id")
+        if entry is None:
+            return None
+        return self.get_index(plane=plane,force=force).get(entry)
+
+    def get_drivers(self,entry,plane="IOService",force=False):
+        # Returns the nodes attached directly below the passed entry in the
+        # IOService plane, skipping any child devices - for HDEF that's the
+        # AppleHDAController instance if it's matched
+        node = self.join(entry,plane=plane,force=force)
+        if not node:
+            return []
+        index = self.get_index(plane=plane)
+        return [x for x in index.children(node) if not x["class"] in ("IOPCIDevice","IOACPIPlatformDevice")]
+
+    def get_device_record(self,device,properties=DEVICE_PROPERTIES,pci_devices=None,plane="IOService",force=False):
+        # Reduces a get_all_devices() entry to what reports show - both the
+        # live report and reports built from saved captures go through here.
+        # pci_devices is passed on to get_pci_device_name() for the name.
+        info = device.get("info",{})
+        props = dict((x,info[x]) for x in properties if x in info)
+        decoded = {}
+        for x,val in props.items():
+            val = self.decode_property(val)
+            if val is not None:
+                decoded[x] = val
+        return {
+            "name":device.get("name"),
+            "device_path":device.get("device_path"),
+            "acpi_path":device.get("acpi_path"),
+            "pci_name":self.get_pci_device_name(info,pci_devices=pci_devices,force=force,use_unknown=False),
+            "drivers":[x["class"] for x in self.get_drivers(device,plane=plane)],
+            "properties":props,
+            "decoded":decoded
+        }
+
+    def decode_property(self,value):
+        # Returns the int value of little endian hex data (i.e. <0b000000>),
+        # or None if the value doesn't look like that
+        if not isinstance(value,str) or len(value) < 3:
+            return None
+        if value[0]=="<" and value[-1]==">" and value[1]!='"':
+            try:
+                val_hex = list("0"*(len(value[1:-1])%2)+value[1:-1])
+                val_rev = "".join(["".join(val_hex[i:i+2]) for i in range(0,len(val_hex),2)][::-1])
+                return int(val_rev,16)
+            except Exception:
+                pass
+        return None
+
     def get_pci_devices(self, force=False):
         # Uses system_profiler to build a list of connected
         # PCI devices
@@ -260,6 +501,7 @@ class IOReg:
         pci_ids = self._get_pci_ids_dict()
         if not pci_ids:
             return info
+        metrics.inc("pci_ids_lookups_total")
         def normalize_id(_id):
             if not isinstance(_id,(int,str)):
                 return None
@@ -296,11 +538,14 @@ class IOReg:
             device_info["class"] = pci_ids.get("classes",{}).get(c,{}).get("name")
             device_info["subclass"] = pci_ids.get("classes",{}).get(c,{}).get(s,{}).get("name")
             device_info["programming_interface"] = pci_ids.get("classes",{}).get(c,{}).get(s,{}).get(p)
+        if device_info["device"]:
+            metrics.inc("pci_ids_hits_total")
         return device_info
 
     def get_pci_device_name(self, device_dict, pci_devices=None, force=False, use_unknown=True, use_pci_ids=True):
         device_name = "Unknown PCI Device" if use_unknown else None
-        if not device_dict or not isinstance(device_dict,dict):
+        # Device info is usually a LazyInfo - any mapping will do
+        if not device_dict or not isinstance(device_dict,ioquery.Mapping):
             return device_name
         if "info" in device_dict:
             # Expand the info
@@ -347,8 +592,92 @@ class IOReg:
                 break
         return device_name
 
-    def get_all_devices(self, plane=None, force=False):
-        # Let's build a device dict - and retain any info for each
+    def _walk_devices(self, nodes, base_chains=None, inherited=None):
+        # Yields (node, device path segments) for each IOPCIDevice and PciRoot
+        # in nodes, in order.  Each node's segments build on those of its
+        # closest IOPCIDevice/IOACPIPlatformDevice ancestor - base_chains
+        # supplies those for each top level node when nodes is only part of
+        # the registry.  inherited (if passed) is filled with the segments
+        # each node passes down to its children.
+        classes = ("IOPCIDevice","IOACPIPlatformDevice")
+        inherited = [] if inherited is None else inherited
+        tops = iter(base_chains or [])
+        for node in nodes:
+            above = (next(tops,None) or []) if node["parent"] is None else inherited[node["parent"]]
+            if not node["class"] in classes:
+                inherited.append(above)
+                continue
+            info = node["info"]
+            # PCI roots should use PNP0A03 or PNP0A08 in either
+            # name or compatible
+            if any(p in info.get("compatible","")+info.get("name","") for p in ("PNP0A03","PNP0A08")):
+                # Got one - we need to get the _UID
+                try:
+                    _uid = int(info.get("_UID","0").strip('"'))
+                except:
+                    _uid = 0 # Fall back on zero
+                # Roots always start a new path.  This can help prevent
+                # things like _SB taking priority in the IOACPIPlane
+                chain = ["PciRoot(0x{})".format(hex(_uid)[2:].upper())]
+                inherited.append(chain)
+            else:
+                # Get the decimal address in X,Y format
+                a = self._get_dec_addr(node["name"])
+                outs = a.split("@")[1].split(",")
+                d = outs[0].upper()
+                f = 0 if len(outs) == 1 else outs[1].upper()
+                chain = above+["Pci(0x{},0x{})".format(d,f)]
+                inherited.append(chain)
+                if node["class"] == "IOACPIPlatformDevice":
+                    # Got an ACPI device that's not a PciRoot - skip
+                    continue
+            yield node,chain
+
+    def _device_record(self, node, chain):
+        # The get_all_devices() entry for a node - acpi_path is filled in by
+        # _merge_devices() as it depends on the other devices
+        return {
+            "device_path":"/".join(chain),
+            "info":node["info"],
+            "segment":chain[-1],
+            "name":node["name"],
+            "name_no_addr":node["name_no_addr"],
+            "addr": "0" if not "@" in node["name"] else node["name"].split("@")[-1],
+            "type":node["class"],
+            "acpi_path":None,
+            "id":node["id"],
+            "line":node["line"]
+        }
+
+    def _merge_devices(self, records):
+        # Builds the device dict from records in registry order
+        path_list = {}
+        for record in records:
+            dev_path = record["device_path"]
+            # Add a new entry to our path list
+            if dev_path in path_list or not dev_path.startswith("PciRoot("):
+                # Skip - either a duplicate (shouldn't happen), or
+                # it lacks a PciRoot
+                continue
+            # Get our parent's acpi path + ours
+            if not "/" in dev_path:
+                # We're the PCI root - just save our path
+                # preceeded by /
+                record["acpi_path"] = "/{}".format(record["name"])
+            else:
+                # We should have a parent - get their dev path
+                parent_dev_path = "/".join(dev_path.split("/")[:-1])
+                parent_acpi_path = path_list.get(parent_dev_path,{}).get("acpi_path",None)
+                if parent_acpi_path is not None:
+                    # We got something - append our path
+                    record["acpi_path"] = "{}/{}".format(parent_acpi_path,record["name"])
+            path_list[dev_path] = record
+        return path_list
+
+    def get_all_devices(self, plane=None, force=False, workers=None):
+        # Let's build a device dict - and retain any info for each.  Passing
+        # workers > 1 parses big captures in shards across that many
+        # processes - the result is the same as a serial parse.
         if plane is None:
             # Try to use IODeviceTree if it's populated, or if
             # IOService is not populated
@@ -356,129 +685,129 @@ class IOReg:
                 plane = "IODeviceTree"
             else:
                 plane = "IOService"
-        self.get_ioreg(plane=plane,force=force)
-        # We're only interested in these two classes
-        class_match = (
-            "<class IOPCIDevice,",
-            "<class IOACPIPlatformDevice,"
-        )
-        # Set up some preliminary placeholders
-        path_list = {}
-        _path = []
-        dev_primed = False
-        curr_dev = {}
-        # Walk the ioreg lines and keep track of the last
-        # valid class, indentation, etc
-        for line in self.ioreg[plane]:
-            if not dev_primed:
-                # We're not looking within a device already
-                # Only prime on devices
-                if not "+-o " in line:
-                    continue # Not a class entry
-                # Ensure we're keeping track of scope
-                parts = line.split("+-o ")
-                pad = len(parts[0])
-                while len(_path):
-                    # Remove any path entries that are nested
-                    # equal to or further than our current set
-                    if _path[-1][-1] >= pad:
-                        del _path[-1]
-                    else:
-                        break
-                if class_match and not any(c in line for c in class_match):
-                    continue # Not the right class
-                # We found a device of our class - let's
-                # retain info about it
-                name = parts[1].split("  ")[0]
-                clss = parts[1].split("<class ")[1].split(",")[0]
-                # Get the decimal address in X,Y format
-                a = self._get_dec_addr(name)
-                outs = a.split("@")[1].split(",")
-                d = outs[0].upper()
-                f = 0 if len(outs) == 1 else outs[1].upper()
-                # Format as the device path
-                dev_path = "Pci(0x{},0x{})".format(d,f)
-                _path.append([
-                    dev_path,
-                    parts[1].split("  ")[0],
-                    parts[1].split("<class ")[1].split(",")[0],
-                    line,
-                    pad
-                ])
-                # Prime our device walker
-                dev_primed = True
-            else:
-                # We'd wait until we get a lone closing curly brace
-                # to denote the end of a device scope here
-                if line.replace("|","").strip() == "}":
-                    # Closed - check what kind of device we got
-                    dev_primed = False
-                    # Retain the curr_dev as a local var
-                    # and reset
-                    this_dev = curr_dev
-                    curr_dev = {}
-                    # PCI roots should use PNP0A03 or PNP0A08 in either
-                    # name or compatible
-                    if any(p in this_dev.get("compatible","")+this_dev.get("name","") for p in ("PNP0A03","PNP0A08")):
-                        # Got one - we need to change the type in the last _path entry
-                        # and we need to get the _UID
-                        try:
-                            _uid = int(this_dev.get("_UID","0").strip('"'))
-                        except:
-                            _uid = 0 # Fall back on zero
-                        # Update the device path
-                        _path[-1][0] = "PciRoot(0x{})".format(hex(_uid)[2:].upper())
-                        # Ensure this is top-level.  Reset if needed.
-                        # This can help prevent things like _SB taking priority
-                        # in the IOACPIPlane
-                        _path = [_path[-1]]
-                    elif _path[-1][2] == "IOACPIPlatformDevice":
-                        # Got an ACPI device that's not a PciRoot - skip
-                        continue
-                    elif len(_path) == 1:
-                        # Got a lone path that's not a PciRoot()
-                        # Skip it to avoid things like CPU objects being added
-                        continue
-                    # Get our full device path
-                    dev_path = "/".join([x[0] for x in _path])
-                    # Add a new entry to our path list
-                    if dev_path in path_list or not dev_path.startswith("PciRoot("):
-                        # Skip - either a duplicate (shouldn't happen), or
-                        # it lacks a PciRoot
-                        continue
-                    # Get our parent's acpi path + ours
-                    acpi_path = None
-                    if not "/" in dev_path:
-                        # We're the PCI root - just save our path
-                        # preceeded by /
-                        acpi_path = "/{}".format(_path[-1][1])
-                    else:
-                        # We should have a parent - get their dev path
-                        parent_dev_path = "/".join(dev_path.split("/")[:-1])
-                        parent_acpi_path = path_list.get(parent_dev_path,{}).get("acpi_path",None)
-                        if parent_acpi_path is not None:
-                            # We got something - append our path
-                            acpi_path = "{}/{}".format(parent_acpi_path,_path[-1][1])
-                    path_list[dev_path] = {
-                        "device_path":dev_path,
-                        "info":this_dev,
-                        "segment":_path[-1][0],
-                        "name":_path[-1][1],
-                        "name_no_addr":_path[-1][1].split("@")[0],
-                        "addr": "0" if not "@" in _path[-1][1] else _path[-1][1].split("@")[-1],
-                        "type":_path[-1][2],
-                        "acpi_path":acpi_path,
-                        "line":_path[-1][3]
-                    }
-                    continue
-                # We're walking scope here - try to retain info
-                try:
-                    name = line.split(" = ")[0].split('"')[1]
-                    curr_dev[name] = line.split(" = ")[1]
-                except Exception as e:
-                    pass
+        lines = self.get_ioreg(plane=plane,force=force)
+        cached = self.devices.get(plane)
+        if cached and cached[0] is lines:
+            return cached[1]
+        sharded = workers and workers > 1 and ProcessPoolExecutor is not None \
+            and isinstance(lines,ioquery.BufferLines) and lines.size >= self.shard_threshold
+        if sharded:
+            with metrics.timer("ioreg_devices_seconds",plane=plane,mode="sharded"):
+                path_list = self._get_devices_sharded(lines,workers)
+        else:
+            nodes = self.get_index(plane=plane).nodes
+            with metrics.timer("ioreg_devices_seconds",plane=plane,mode="serial"):
+                path_list = self._merge_devices(self._device_record(n,c) for n,c in self._walk_devices(nodes))
+        metrics.inc("ioreg_devices_built_total",len(path_list),plane=plane)
+        self.devices[plane] = (lines,path_list)
         return path_list
 
+    def _get_devices_sharded(self, lines, workers):
+        # Splits the capture into subtrees at the shallowest depth with enough
+        # of them to go around (usually the devices below a PciRoot), parses
+        # those in a process pool, and merges the results in registry order.
+        # Everything above that depth (the "spine") is parsed here so each
+        # subtree can be handed the device path leading down to it.
+        buf,size = lines.buf,lines.size
+        # Find each class line's offset, depth, and parent without decoding
+        starts,depths,parents = ioquery.scan_class_lines(buf,size)
+        if not starts:
+            return {}
+        counts = Counter(depths)
+        depth = next((d for d in sorted(counts) if counts[d] >= workers*4),None)
+        if depth is None:
+            depth = max(counts,key=lambda d:(counts[d],-d))
+        # Split out the spine and each subtree's byte range
+        spine,subtrees = [],[]
+        root = None
+        for x,d in enumerate(depths):
+            if d <= depth and root is not None:
+                subtrees.append((root,starts[root],starts[x]))
+                root = None
+            if d < depth:
+                spine.append(x)
+            elif d == depth:
+                root = x
+        if root is not None:
+            subtrees.append((root,starts[root],size))
+        # Parse the spine - keeping track of where each piece came from
+        pieces,local = [],0
+        local_to_global,spine_pos = {},{}
+        for n,x in enumerate(spine):
+            piece = buf[starts[x]:starts[x+1] if x+1 < len(starts) else size]
+            local_to_global[local] = starts[x]
+            spine_pos[x] = n
+            pieces.append(piece)
+            local += len(piece)
+        spine_nodes = ioquery.parse_nodes(ioquery.BufferLines(b"".join(pieces)))
+        inherited = []
+        records = []
+        for node,chain in self._walk_devices(spine_nodes,inherited=inherited):
+            records.append((local_to_global[node["offset"]],self._device_record(node,chain)))
+        # Map each spine node (by its global offset) to what it passes down
+        passed = dict((local_to_global[n["offset"]],inherited[n["index"]]) for n in spine_nodes)
+        # Group neighboring subtrees into tasks of roughly equal size
+        tasks = []
+        target = max(1,sum(e-s for _,s,e in subtrees)//(workers*4))
+        task,task_size = [],0
+        for root,start,end in subtrees:
+            task.append((root,start,end))
+            task_size += end-start
+            if task_size >= target:
+                tasks.append(task)
+                task,task_size = [],0
+        if task:
+            tasks.append(task)
+        path = lines.path if isinstance(lines,ioquery.MappedLines) else None
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for task in tasks:
+                bases = [passed.get(starts[parents[r]],[]) if parents[r] is not None else [] for r,_,_ in task]
+                subs = [(s,e if path else buf[s:e]) for _,s,e in task]
+                futures.append(executor.submit(_shard_devices,path,subs,bases))
+            for future in futures:
+                for offset,record in future.result():
+                    record["info"] = ioquery.LazyInfo(buf,*record["info"])
+                    records.append((offset,record))
+        records.sort(key=lambda x:x[0])
+        return self._merge_devices(r for _,r in records)
+
+    def get_codecs(self, plane="IOService", force=False):
+        # Returns a list of dicts for each IOHDACodecDevice with their numeric
+        # ids, codec address, and the IOPCIDevice (HDEF, HDAU, etc) they hang
+        # off of
+        index = self.get_index(plane=plane,force=force)
+        # Map each device's registry id to its entry so the parent controller
+        # resolves without another pass
+        dev_ids = dict((d["id"],d) for d in self.get_all_devices(plane=plane).values() if d["id"] is not None)
+        def get_int(value):
+            try:
+                return int(value.strip().strip('"'),0) & 0xFFFFFFFF
+            except:
+                return None
+        codecs = []
+        for node in index.select("class=IOHDACodecDevice"):
+            info = node["info"]
+            vendor_id = get_int(info.get("IOHDACodecVendorID",""))
+            if vendor_id is None:
+                continue
+            # The closest IOPCIDevice above us is the controller
+            controller = next((x for x in index.ancestors(node) if x["class"] == "IOPCIDevice"),None)
+            device = dev_ids.get(controller["id"],{}) if controller else {}
+            codecs.append({
+                "name":node["name"],
+                "controller":controller["name"] if controller else None,
+                "controller_line":controller["line"] if controller else None,
+                "codec_id":vendor_id,
+                "vendor_id":vendor_id >> 16,
+                "device_id":vendor_id & 0xFFFF,
+                "revision_id":get_int(info.get("IOHDACodecRevisionID","")),
+                "address":get_int(info.get("IOHDACodecAddress","")),
+                "device_path":device.get("device_path"),
+                "acpi_path":device.get("acpi_path")
+            })
+        return codecs
+
     def get_devices(self, dev_list=None, plane="IOService", force=False):
         # Iterate looking for our device(s)
         # returns a list of devices@addr
@@ -486,106 +815,51 @@ class IOReg:
             return []
         if not isinstance(dev_list, list):
             dev_list = [dev_list]
-        self.get_ioreg(plane=plane,force=force)
-        dev = []
-        for line in self.ioreg[plane]:
-            if any(x for x in dev_list if x in line) and "+-o" in line:
-                dev.append(line.split("+-o ")[1].split("  ")[0])
-        return dev
+        index = self.get_index(plane=plane,force=force)
+        return [n["name"] for n in index.nodes if any(x for x in dev_list if x in n["line"])]
 
     def get_device_info(self, dev_search=None, isclass=False, parent=None, plane="IOService", force=False):
         # Returns a list of all matched classes and their properties
         if not dev_search:
             return []
-        self.get_ioreg(plane=plane,force=force)
+        index = self.get_index(plane=plane,force=force)
         dev = []
-        primed = False
-        current = None
-        path = []
         search = dev_search if not isclass else "<class " + dev_search
-        for line in self.ioreg[plane]:
-            if "<class " in line:
-                # Add each class entry to our path
-                path.append(line)
-            if not primed and not search in line:
+        for node in index.nodes:
+            if not search in node["line"]:
                 continue
             # Should have a device - let's see if we need to check a parent
-            if parent and not parent in self._walk_path(path):
+            if parent and not parent in self._node_path(index,node):
                 # Need a parent, and we don't have it - keep going
                 continue
-            if not primed:
-                primed = True
-                current = {"name":dev_search,"parts":{}}
-                continue
-            # Primed, but not our device
-            if "+-o" in line:
-                # Past our prime - see if we have a current, save
-                # it to the list, and clear it
-                primed = False
-                if current:
-                    dev.append(current)
-                    current = None
-                continue
-            # Primed, not class, not next device - must be info
-            try:
-                name = line.split(" = ")[0].split('"')[1]
-                current["parts"][name] = line.split(" = ")[1]
-            except Exception as e:
-                pass
+            # Properties are only parsed once they're read
+            dev.append({"name":dev_search,"parts":node["info"]})
         return dev
 
-    def _walk_path(self,path,classes=("IOPCIDevice","IOACPIPlatformDevice")):
-        # Got a path - walk backward
-        out = []
-        prefix = None
-        class_match = []
-        if classes:
-            # Ensure all our classes start with <class
-            # and end with ,
-            for c in classes:
-                c = str(c).strip()
-                if not c.startswith("<class "):
-                    c = "<class "+c
-                if not c.endswith(","):
-                    c += ","
-                class_match.append(c)
-        # Work in reverse to find our path
-        for x in path[::-1]:
-            if not "+-o " in x:
-                continue # Not a class entry
-            if class_match and not any(c in x for c in class_match):
-                continue # Not the right class
-            parts = x.split("+-o ")
-            if prefix is None or len(parts[0]) < len(prefix):
-                # Path length changed, must be parent?
-                item = parts[1].split("  ")[0]
-                prefix = parts[0]
-                out.append(self._get_hex_addr(item))
-        # Reverse the path - ensure we use / as the root
-        out = [""]+out[::-1]
-        return "/".join(out)
+    def _node_path(self,index,node,classes=("IOPCIDevice","IOACPIPlatformDevice")):
+        # The path get_acpi_path() returns for a node in the index - the
+        # addresses of it and its ancestors of the passed classes, from the
+        # root down
+        out = [self._get_hex_addr(n["name"]) for n in [node]+list(index.ancestors(node)) if not classes or n["class"] in classes]
+        return "/".join([""]+out[::-1])
 
     def get_acpi_path(self, device, parent=None, plane="IOService", force=False):
         if not device:
             return ""
-        self.get_ioreg(plane=plane,force=force)
-        path = []
-        found = False
-        # First we find our device if it exists - and save each step
-        for x in self.ioreg[plane]:
-            if "<class " in x:
-                path.append(x)
-                if device in x:
-                    # Got our device - get the path walked
-                    test = self._walk_path(path)
-                    if parent:
-                        # Verify we have the parent in the path
-                        if parent in test:
-                            return test
-                        # Not in there - keep going
-                        continue
-                    # No parent check needed - return the test path
-                    return test
+        index = self.get_index(plane=plane,force=force)
+        # First we find our device if it exists
+        for node in index.nodes:
+            if device in node["line"]:
+                # Got our device - get the path walked
+                test = self._node_path(index,node)
+                if parent:
+                    # Verify we have the parent in the path
+                    if parent in test:
+                        return test
+                    # Not in there - keep going
+                    continue
+                # No parent check needed - return the test path
+                return test
         # Didn't find anything
         return ""
 
@@ -0,0 +1,62 @@
+import os, sys, json, atexit, datetime
+
+class Logger:
+    def __init__(self, echo = True, buffer_size = 1 << 16):
+        # Writes each line to the text log as it's produced - and optionally
+        # a structured NDJSON record stream alongside it.  Both handles are
+        # buffered and get flushed and closed on exit - even if we crash.
+        self.echo = echo
+        self.buffer_size = buffer_size
+        self.path = self.ndjson_path = None
+        self._log = self._ndjson = None
+        atexit.register(self.close)
+
+    def open(self, path = None, ndjson_path = None):
+        # Opens (truncating) the text log and/or NDJSON stream
+        self.close()
+        if path:
+            self.path = os.path.realpath(path)
+            self._log = self._open(self.path)
+        if ndjson_path:
+            self.ndjson_path = os.path.realpath(ndjson_path)
+            self._ndjson = self._open(self.ndjson_path)
+
+    def _open(self, path):
+        if sys.version_info >= (3,0):
+            return open(path, "w", buffering=self.buffer_size, encoding="utf-8", newline="\n")
+        return open(path, "w", self.buffer_size)
+
+    def _timestamp(self):
+        return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def lprint(self, message = ""):
+        # Prints the message and appends it to the text log
+        if self.echo:
+            print(message)
+        if self._log:
+            self._log.write(message + "\n")
+        if self._ndjson:
+            self.record("line", text=message)
+
+    def record(self, kind, **data):
+        # Writes a single structured record to the NDJSON stream, if open
+        if not self._ndjson:
+            return
+        entry = {"ts":self._timestamp(),"kind":kind,"data":data}
+        self._ndjson.write(json.dumps(entry, default=str, sort_keys=True) + "\n")
+
+    def flush(self):
+        for f in (self._log, self._ndjson):
+            if f:
+                f.flush()
+
+    def close(self):
+        for f in (self._log, self._ndjson):
+            if not f:
+                continue
+            try:
+                f.flush()
+                f.close()
+            except:
+                pass
+        self._log = self._ndjson = None
@@ -0,0 +1,127 @@
+import os, json, time, threading
+from bisect import bisect_left
+
+# Histogram buckets in seconds - from forking a tiny command up to parsing
+# a huge registry dump
+BUCKETS = (0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30)
+_clock = getattr(time,"perf_counter",time.time)
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = _clock()-self.start
+        self.metrics.observe(self.name,self.seconds,**self.labels)
+
+class Metrics:
+    def __init__(self):
+        # Counters and histograms for what the collector itself costs -
+        # commands spawned, bytes and lines parsed, nodes and devices built,
+        # lookups, and how long each phase takes.  Each is keyed by name and
+        # its labels, and everything is safe to update from any thread.
+        self._lock = threading.Lock()
+        self.counters = {}   # (name, labels): value
+        self.histograms = {} # (name, labels): [count per bucket (+Inf last), sum, count]
+
+    def _key(self, name, labels):
+        return (name,tuple(sorted((k,str(v)) for k,v in labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name,labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key,0)+value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name,labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0]*(len(BUCKETS)+1),0.0,0]
+            hist[0][bisect_left(BUCKETS,value)] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def timer(self, name, **labels):
+        # with metrics.timer("phase_seconds", phase="codecs"): ...
+        return _Timer(self,name,labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def get(self, name, **labels):
+        # Returns a counter's value - summed over any labels not passed
+        with self._lock:
+            return sum(v for (n,l),v in self.counters.items() if n == name and all((k,str(v)) in l for k,v in labels.items()))
+
+    def _derived(self):
+        # Ratios worth watching that are awkward to get from the raw counters
+        lookups = self.get("pci_ids_lookups_total")
+        return {"pci_ids_hit_ratio":self.get("pci_ids_hits_total")/float(lookups) if lookups else None}
+
+    def snapshot(self):
+        # Everything as a JSON friendly dict
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k,[list(v[0]),v[1],v[2]]) for k,v in self.histograms.items())
+        out = {"timestamp":time.time(),"counters":{},"histograms":{},"derived":self._derived()}
+        for (name,labels),value in counters:
+            out["counters"].setdefault(name,[]).append({"labels":dict(labels),"value":value})
+        for (name,labels),(buckets,total,count) in histograms:
+            cumulative,running = {},0
+            for le,n in zip([str(b) for b in BUCKETS]+["+Inf"],buckets):
+                running += n
+                cumulative[le] = running
+            out["histograms"].setdefault(name,[]).append({"labels":dict(labels),"count":count,"sum":total,"buckets":cumulative})
+        return out
+
+    def to_prometheus(self, prefix="checkaudio_"):
+        # Everything in the Prometheus text exposition format - as read by
+        # node_exporter's textfile collector
+        def fmt_labels(labels, extra=None):
+            labels = list(labels.items())+(extra or [])
+            if not labels:
+                return ""
+            return "{"+",".join('{}="{}"'.format(k,str(v).replace("\\","\\\\").replace('"','\\"').replace("\n","\\n")) for k,v in sorted(labels))+"}"
+        snap = self.snapshot()
+        lines = []
+        for name,values in sorted(snap["counters"].items()):
+            lines.append("# TYPE {}{} counter".format(prefix,name))
+            for v in values:
+                lines.append("{}{}{} {}".format(prefix,name,fmt_labels(v["labels"]),v["value"]))
+        for name,values in sorted(snap["histograms"].items()):
+            lines.append("# TYPE {}{} histogram".format(prefix,name))
+            for v in values:
+                for le in [str(b) for b in BUCKETS]+["+Inf"]:
+                    lines.append("{}{}_bucket{} {}".format(prefix,name,fmt_labels(v["labels"],[("le",le)]),v["buckets"][le]))
+                lines.append("{}{}_sum{} {}".format(prefix,name,fmt_labels(v["labels"]),repr(v["sum"])))
+                lines.append("{}{}_count{} {}".format(prefix,name,fmt_labels(v["labels"]),v["count"]))
+        for name,value in sorted(snap["derived"].items()):
+            if value is None:
+                continue
+            lines.append("# TYPE {}{} gauge".format(prefix,name))
+            lines.append("{}{} {}".format(prefix,name,repr(value)))
+        return "\n".join(lines)+"\n"
+
+    def write(self, path):
+        # Writes a JSON snapshot (for .json paths) or a Prometheus textfile -
+        # via a rename, so a scraper never reads half a file
+        data = json.dumps(self.snapshot(),indent=2,sort_keys=True)+"\n" if path.lower().endswith(".json") else self.to_prometheus()
+        temp = "{}.{}.tmp".format(path,os.getpid())
+        with open(temp,"w") as f:
+            f.write(data)
+        os.rename(temp,path)
+
+# The process wide registry everything reports to
+REGISTRY = Metrics()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
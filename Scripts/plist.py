@@ -2,9 +2,22 @@
 # Imports #
 ###     ###
 
-import datetime, os, plistlib, struct, sys, itertools, binascii
+import datetime, os, plistlib, struct, sys, itertools, binascii, re, time
+from collections import deque
 from io import BytesIO
 
+try:
+    from . import metrics
+except (ImportError, ValueError):
+    # Used on its own, outside of the Scripts package - nothing to report to
+    metrics = None
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport - load_many() runs serially
+    ProcessPoolExecutor = None
+
 if sys.version_info < (3,0):
     # Force use of StringIO instead of cStringIO as the latter
     # has issues with Unicode strings
@@ -19,6 +32,13 @@ except NameError:
     basestring = str  # Python 3
     unicode = str
 
+# Resolved once - everything below that differs between Python 2 and 3 is
+# bound at import time rather than checked per call or per object
+_PY3 = sys.version_info >= (3, 0)
+
+# plistlib.Data only exists prior to Python 3.9
+_Data = getattr(plistlib, "Data", None)
+
 try:
     FMT_XML = plistlib.FMT_XML
     FMT_BINARY = plistlib.FMT_BINARY
@@ -31,15 +51,33 @@ except AttributeError:
 ###            ###
 
 def wrap_data(value):
-    if not _check_py3(): return plistlib.Data(value)
+    if not _PY3: return plistlib.Data(value)
     return value
 
 def extract_data(value):
-    if not _check_py3() and isinstance(value,plistlib.Data): return value.data
+    if not _PY3 and isinstance(value,plistlib.Data): return value.data
     return value
 
 def _check_py3():
-    return sys.version_info >= (3, 0)
+    return _PY3
+
+# Strings longer than this are left alone when interning values - keys are
+# always interned as they are what repeats the most in system_profiler and
+# ioreg -a output
+_INTERN_MAX_LEN = 64
+
+def _get_interner(intern_strings=False):
+    # Returns a helper that maps each string to the first equal string seen
+    # during this parse - or None if interning is disabled.  The table only
+    # lives as long as the parse, so nothing is pinned in memory afterward.
+    if not intern_strings:
+        return None
+    table = {}
+    def _intern(value, force=False):
+        if not force and len(value) > _INTERN_MAX_LEN:
+            return value
+        return table.setdefault(value, value)
+    return _intern
 
 def _is_binary(fp):
     if isinstance(fp, basestring):
@@ -84,113 +122,208 @@ def writePlist(value, pathOrFile):
 # Remapped Functions #
 ###                ###
 
-def load(fp, fmt=None, use_builtin_types=None, dict_type=dict):
+def _record_load(fmt, fp, start, objects):
+    # Reports a decoded plist to the metrics registry
+    try:
+        pos = fp.tell()
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        fp.seek(pos)
+    except:
+        size = 0
+    metrics.inc("plist_loads_total", format=fmt)
+    metrics.inc("plist_bytes_total", size, format=fmt)
+    metrics.inc("plist_objects_decoded_total", objects, format=fmt)
+    metrics.observe("plist_load_seconds", time.time()-start, format=fmt)
+
+def load(fp, fmt=None, use_builtin_types=None, dict_type=dict, intern_strings=False):
+    _intern = _get_interner(intern_strings)
+    start = time.time()
     if _is_binary(fp):
         use_builtin_types = False if use_builtin_types is None else use_builtin_types
         try:
-            p = _BinaryPlistParser(use_builtin_types=use_builtin_types, dict_type=dict_type)
+            p = _BinaryParser(use_builtin_types=use_builtin_types, dict_type=dict_type, interner=_intern)
         except:
             # Python 3.9 removed use_builtin_types
-            p = _BinaryPlistParser(dict_type=dict_type)
-        return p.parse(fp)
-    elif _check_py3():
-        offset = _seek_past_whitespace(fp)
-        use_builtin_types = True if use_builtin_types is None else use_builtin_types
-        # We need to monkey patch this to allow for hex integers - code taken/modified from 
-        # https://github.com/python/cpython/blob/3.8/Lib/plistlib.py
-        if fmt is None:
-            header = fp.read(32)
-            fp.seek(offset)
-            for info in plistlib._FORMATS.values():
-                if info['detect'](header):
-                    P = info['parser']
-                    break
-            else:
-                raise plistlib.InvalidFileException()
+            p = _BinaryParser(dict_type=dict_type, interner=_intern)
+        value = p.parse(fp)
+        if metrics:
+            # The trailer already told us how many objects there are
+            _record_load("binary", fp, start, len(p._objects))
+        return value
+    count = [0]
+    value = _load_xml(fp, fmt, use_builtin_types, dict_type, _intern, count if metrics else None)
+    if metrics:
+        _record_load("xml", fp, start, count[0])
+    return value
+
+def _load_xml_py3(fp, fmt, use_builtin_types, dict_type, _intern, count=None):
+    offset = _seek_past_whitespace(fp)
+    use_builtin_types = True if use_builtin_types is None else use_builtin_types
+    # We need to monkey patch this to allow for hex integers - code taken/modified from 
+    # https://github.com/python/cpython/blob/3.8/Lib/plistlib.py
+    if fmt is None:
+        header = fp.read(32)
+        fp.seek(offset)
+        for info in plistlib._FORMATS.values():
+            if info['detect'](header):
+                P = info['parser']
+                break
         else:
-            P = plistlib._FORMATS[fmt]['parser']
-        try:
-            p = P(use_builtin_types=use_builtin_types, dict_type=dict_type)
-        except:
-            # Python 3.9 removed use_builtin_types
-            p = P(dict_type=dict_type)
-        if isinstance(p,plistlib._PlistParser):
-            # Monkey patch!
-            def end_integer():
-                d = p.get_data()
-                value = int(d,16) if d.lower().startswith("0x") else int(d)
-                if -1 << 63 <= value < 1 << 64:
-                    p.add_object(value)
-                else:
-                    raise OverflowError("Integer overflow at line {}".format(p.parser.CurrentLineNumber))
-            def end_data():
-                try:
-                    p.add_object(plistlib._decode_base64(p.get_data()))
-                except Exception as e:
-                    raise Exception("Data error at line {}: {}".format(p.parser.CurrentLineNumber,e))
-            p.end_integer = end_integer
-            p.end_data = end_data
-        return p.parse(fp)
+            raise plistlib.InvalidFileException()
     else:
-        offset = _seek_past_whitespace(fp)
-        # Is not binary - assume a string - and try to load
-        # We avoid using readPlistFromString() as that uses
-        # cStringIO and fails when Unicode strings are detected
-        # Don't subclass - keep the parser local
-        from xml.parsers.expat import ParserCreate
-        # Create a new PlistParser object - then we need to set up
-        # the values and parse.
-        p = plistlib.PlistParser()
-        parser = ParserCreate()
-        parser.StartElementHandler = p.handleBeginElement
-        parser.EndElementHandler = p.handleEndElement
-        parser.CharacterDataHandler = p.handleData
-        # We also need to monkey patch this to allow for other dict_types, hex int support
-        # proper line output for data errors, and for unicode string decoding
-        def begin_dict(attrs):
-            d = dict_type()
-            p.addObject(d)
-            p.stack.append(d)
+        P = plistlib._FORMATS[fmt]['parser']
+    try:
+        p = P(use_builtin_types=use_builtin_types, dict_type=dict_type)
+    except:
+        # Python 3.9 removed use_builtin_types
+        p = P(dict_type=dict_type)
+    if isinstance(p,plistlib._PlistParser):
+        # Monkey patch!
         def end_integer():
-            d = p.getData()
+            d = p.get_data()
             value = int(d,16) if d.lower().startswith("0x") else int(d)
             if -1 << 63 <= value < 1 << 64:
-                p.addObject(value)
+                p.add_object(value)
             else:
-                raise OverflowError("Integer overflow at line {}".format(parser.CurrentLineNumber))
+                raise OverflowError("Integer overflow at line {}".format(p.parser.CurrentLineNumber))
         def end_data():
             try:
-                p.addObject(plistlib.Data.fromBase64(p.getData()))
+                p.add_object(plistlib._decode_base64(p.get_data()))
             except Exception as e:
-                raise Exception("Data error at line {}: {}".format(parser.CurrentLineNumber,e))
-        def end_string():
-            d = p.getData()
-            if isinstance(d,unicode):
-                d = d.encode("utf-8")
-            p.addObject(d)
-        p.begin_dict = begin_dict
+                raise Exception("Data error at line {}: {}".format(p.parser.CurrentLineNumber,e))
         p.end_integer = end_integer
         p.end_data = end_data
-        p.end_string = end_string
-        if isinstance(fp, unicode):
-            # Encode unicode -> string; use utf-8 for safety
-            fp = fp.encode("utf-8")
-        if isinstance(fp, basestring):
-            # It's a string - let's wrap it up
-            fp = StringIO(fp)
-        # Parse it
-        parser.ParseFile(fp)
-        return p.root
-
-def loads(value, fmt=None, use_builtin_types=None, dict_type=dict):
-    if _check_py3() and isinstance(value, basestring):
+        if _intern:
+            # Share one object for each repeated key and short string
+            def end_key():
+                if p.current_key or not isinstance(p.stack[-1], type({})):
+                    raise ValueError("unexpected key at line {}".format(p.parser.CurrentLineNumber))
+                p.current_key = _intern(p.get_data(), force=True)
+            def end_string():
+                p.add_object(_intern(p.get_data()))
+            p.end_key = end_key
+            p.end_string = end_string
+        if count is not None:
+            # Tally each value as it's added
+            add_object = p.add_object
+            def counted_add_object(value):
+                count[0] += 1
+                add_object(value)
+            p.add_object = counted_add_object
+    return p.parse(fp)
+
+def _load_xml_py2(fp, fmt, use_builtin_types, dict_type, _intern, count=None):
+    offset = _seek_past_whitespace(fp)
+    # Is not binary - assume a string - and try to load
+    # We avoid using readPlistFromString() as that uses
+    # cStringIO and fails when Unicode strings are detected
+    # Don't subclass - keep the parser local
+    from xml.parsers.expat import ParserCreate
+    # Create a new PlistParser object - then we need to set up
+    # the values and parse.
+    p = plistlib.PlistParser()
+    parser = ParserCreate()
+    parser.StartElementHandler = p.handleBeginElement
+    parser.EndElementHandler = p.handleEndElement
+    parser.CharacterDataHandler = p.handleData
+    # We also need to monkey patch this to allow for other dict_types, hex int support
+    # proper line output for data errors, and for unicode string decoding
+    def begin_dict(attrs):
+        d = dict_type()
+        p.addObject(d)
+        p.stack.append(d)
+    def end_integer():
+        d = p.getData()
+        value = int(d,16) if d.lower().startswith("0x") else int(d)
+        if -1 << 63 <= value < 1 << 64:
+            p.addObject(value)
+        else:
+            raise OverflowError("Integer overflow at line {}".format(parser.CurrentLineNumber))
+    def end_data():
+        try:
+            p.addObject(plistlib.Data.fromBase64(p.getData()))
+        except Exception as e:
+            raise Exception("Data error at line {}: {}".format(parser.CurrentLineNumber,e))
+    def end_string():
+        d = p.getData()
+        if isinstance(d,unicode):
+            d = d.encode("utf-8")
+        if _intern:
+            d = _intern(d)
+        p.addObject(d)
+    def end_key():
+        d = p.getData()
+        p.currentKey = _intern(d, force=True) if _intern else d
+    p.begin_dict = begin_dict
+    p.end_integer = end_integer
+    p.end_data = end_data
+    p.end_string = end_string
+    p.end_key = end_key
+    if count is not None:
+        # Tally each value as it's added
+        add_object = p.addObject
+        def counted_add_object(value):
+            count[0] += 1
+            add_object(value)
+        p.addObject = counted_add_object
+    if isinstance(fp, unicode):
+        # Encode unicode -> string; use utf-8 for safety
+        fp = fp.encode("utf-8")
+    if isinstance(fp, basestring):
+        # It's a string - let's wrap it up
+        fp = StringIO(fp)
+    # Parse it
+    parser.ParseFile(fp)
+    return p.root
+
+_load_xml = _load_xml_py3 if _PY3 else _load_xml_py2
+
+def loads(value, fmt=None, use_builtin_types=None, dict_type=dict, intern_strings=False):
+    if _PY3 and isinstance(value, basestring):
         # If it's a string - encode it
         value = value.encode()
     try:
-        return load(BytesIO(value),fmt=fmt,use_builtin_types=use_builtin_types,dict_type=dict_type)
+        return load(BytesIO(value),fmt=fmt,use_builtin_types=use_builtin_types,dict_type=dict_type,intern_strings=intern_strings)
     except:
         # Python 3.9 removed use_builtin_types
-        return load(BytesIO(value),fmt=fmt,dict_type=dict_type)
+        return load(BytesIO(value),fmt=fmt,dict_type=dict_type,intern_strings=intern_strings)
+
+def _load_path(path, kwargs):
+    # Top-level so it can be pickled over to load_many()'s worker processes
+    with open(path, "rb") as f:
+        return load(f, **kwargs)
+
+def load_many(paths, workers=None, **kwargs):
+    # Decodes each path in a process pool and yields (path, value, error)
+    # tuples in input order - each as soon as it and everything before it
+    # is done.  A document that fails to load yields its exception as error
+    # (with value None) instead of aborting the batch.  Any extra keyword
+    # args are passed to load().
+    paths = iter(paths)
+    if workers == 1 or ProcessPoolExecutor is None:
+        for path in paths:
+            try:
+                yield path, _load_path(path, kwargs), None
+            except Exception as e:
+                yield path, None, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Only keep a few documents per worker in flight so results can be
+        # consumed as they arrive without holding the whole batch in memory
+        window = (workers or os.cpu_count() or 1) * 4
+        pending = deque()
+        for path in itertools.islice(paths, window):
+            pending.append((path, executor.submit(_load_path, path, kwargs)))
+        while pending:
+            path, future = pending.popleft()
+            try:
+                value, error = future.result(), None
+            except Exception as e:
+                value, error = None, e
+            for next_path in itertools.islice(paths, 1):
+                pending.append((next_path, executor.submit(_load_path, next_path, kwargs)))
+            yield path, value, error
 
 def dump(value, fp, fmt=FMT_XML, sort_keys=True, skipkeys=False):
     if fmt == FMT_BINARY:
@@ -198,44 +331,67 @@ def dump(value, fp, fmt=FMT_XML, sort_keys=True, skipkeys=False):
         writer = _BinaryPlistWriter(fp, sort_keys=sort_keys, skipkeys=skipkeys)
         writer.write(value)
     elif fmt == FMT_XML:
-        if _check_py3():
-            plistlib.dump(value, fp, fmt=fmt, sort_keys=sort_keys, skipkeys=skipkeys)
-        else:
-            # We need to monkey patch a bunch here too in order to avoid auto-sorting
-            # of keys
-            writer = plistlib.PlistWriter(fp)
-            def writeDict(d):
-                if d:
-                    writer.beginElement("dict")
-                    items = sorted(d.items()) if sort_keys else d.items()
-                    for key, value in items:
-                        if not isinstance(key, basestring):
-                            if skipkeys:
-                                continue
-                            raise TypeError("keys must be strings")
-                        writer.simpleElement("key", key)
-                        writer.writeValue(value)
-                    writer.endElement("dict")
-                else:
-                    writer.simpleElement("dict")
-            writer.writeDict = writeDict
-            writer.writeln("<plist version=\"1.0\">")
-            writer.writeValue(value)
-            writer.writeln("</plist>")
+        _dump_xml(value, fp, sort_keys, skipkeys)
     else:
         # Not a proper format
         raise ValueError("Unsupported format: {}".format(fmt))
-    
+
+def _dump_xml_py3(value, fp, sort_keys, skipkeys):
+    plistlib.dump(value, fp, fmt=FMT_XML, sort_keys=sort_keys, skipkeys=skipkeys)
+
+def _dump_xml_py2(value, fp, sort_keys, skipkeys):
+    # We need to monkey patch a bunch here too in order to avoid auto-sorting
+    # of keys
+    writer = plistlib.PlistWriter(fp)
+    def writeDict(d):
+        if d:
+            writer.beginElement("dict")
+            items = sorted(d.items()) if sort_keys else d.items()
+            for key, value in items:
+                if not isinstance(key, basestring):
+                    if skipkeys:
+                        continue
+                    raise TypeError("keys must be strings")
+                writer.simpleElement("key", key)
+                writer.writeValue(value)
+            writer.endElement("dict")
+        else:
+            writer.simpleElement("dict")
+    writer.writeDict = writeDict
+    writer.writeln("<plist version=\"1.0\">")
+    writer.writeValue(value)
+    writer.writeln("</plist>")
+
+_dump_xml = _dump_xml_py3 if _PY3 else _dump_xml_py2
+
 def dumps(value, fmt=FMT_XML, skipkeys=False, sort_keys=True):
     # We avoid using writePlistToString() as that uses
     # cStringIO and fails when Unicode strings are detected
-    f = BytesIO() if _check_py3() else StringIO()
+    f = BytesIO() if _PY3 else StringIO()
     dump(value, f, fmt=fmt, skipkeys=skipkeys, sort_keys=sort_keys)
     value = f.getvalue()
-    if _check_py3():
+    if _PY3 and fmt != FMT_BINARY:
+        # Binary plists stay as bytes
         value = value.decode("utf-8")
     return value
 
+def dump_iter(value, sort_keys=True, skipkeys=False):
+    # Yields an XML plist as utf-8 encoded chunks without building the whole
+    # document in memory.  Any non-container iterable (e.g. a generator of
+    # records) is written as an array, and is only consumed as it is written.
+    writer = _XMLPlistWriter(sort_keys=sort_keys, skipkeys=skipkeys)
+    return writer.iter_chunks(value)
+
+def dump_to_path(value, path, fmt=FMT_XML, sort_keys=True, skipkeys=False):
+    # Writes straight to the target file without building the whole
+    # document in memory first
+    with open(path, "wb") as f:
+        if fmt == FMT_XML:
+            for chunk in dump_iter(value, sort_keys=sort_keys, skipkeys=skipkeys):
+                f.write(chunk)
+        else:
+            dump(value, f, fmt=fmt, sort_keys=sort_keys, skipkeys=skipkeys)
+
 ###                        ###
 # Binary Plist Stuff For Py2 #
 ###                        ###
@@ -295,9 +451,10 @@ class _BinaryPlistParser:
     root object.
     see also: http://opensource.apple.com/source/CF/CF-744.18/CFBinaryPList.c
     """
-    def __init__(self, use_builtin_types, dict_type):
+    def __init__(self, use_builtin_types, dict_type, interner=None):
         self._use_builtin_types = use_builtin_types
         self._dict_type = dict_type
+        self._intern = interner
 
     def parse(self, fp):
         try:
@@ -328,7 +485,7 @@ class _BinaryPlistParser:
         """ return the size of the next object."""
         if tokenL == 0xF:
             m = self._fp.read(1)[0]
-            if not _check_py3():
+            if not _PY3:
                 m = ord(m)
             m = m & 0x3
             s = 1 << m
@@ -364,7 +521,7 @@ class _BinaryPlistParser:
         offset = self._object_offsets[ref]
         self._fp.seek(offset)
         token = self._fp.read(1)[0]
-        if not _check_py3():
+        if not _PY3:
             token = ord(token)
         tokenH, tokenL = token & 0xF0, token & 0x0F
 
@@ -411,11 +568,14 @@ class _BinaryPlistParser:
         elif tokenH == 0x50:  # ascii string
             s = self._get_size(tokenL)
             result =  self._fp.read(s).decode('ascii')
-            result = result
+            if self._intern:
+                result = self._intern(result)
 
         elif tokenH == 0x60:  # unicode string
             s = self._get_size(tokenL)
             result = self._fp.read(s * 2).decode('utf-16be')
+            if self._intern:
+                result = self._intern(result)
 
         elif tokenH == 0x80:  # UID
             # used by Key-Archiver plist files
@@ -444,14 +604,158 @@ class _BinaryPlistParser:
                 key = self._read_object(k)
                 if hasattr(plistlib, "Data") and isinstance(key, plistlib.Data):
                     key = key.data
+                if self._intern and isinstance(key, basestring):
+                    key = self._intern(key, force=True)
+                result[key] = self._read_object(o)
+
+        else:
+            raise InvalidFileException()
+
+        self._objects[ref] = result
+        return result
+
+class _BinaryPlistParserPy3 (_BinaryPlistParser):
+    """
+    Python 3 specialization of _BinaryPlistParser.  Reads the whole plist
+    once and indexes the bytes directly instead of seeking and reading the
+    file object a token at a time.
+    """
+    def parse(self, fp):
+        try:
+            fp.seek(0)
+            self._data = data = fp.read()
+            trailer = data[-32:]
+            if len(trailer) != 32:
+                raise InvalidFileException()
+            (
+                offset_size, self._ref_size, num_objects, top_object,
+                offset_table_offset
+            ) = struct.unpack('>6xBBQQQ', trailer)
+            self._object_offsets = self._read_ints(offset_table_offset, num_objects, offset_size)
+            self._objects = [_undefined] * num_objects
+            return self._read_object(top_object)
+
+        except (OSError, IndexError, struct.error, OverflowError,
+                UnicodeDecodeError):
+            raise InvalidFileException()
+        finally:
+            self._data = None
+
+    def _get_size(self, tokenL, offset):
+        """ return the size of the next object, and the offset past it."""
+        if tokenL == 0xF:
+            s = 1 << (self._data[offset] & 0x3)
+            f = '>' + _BINARY_FORMAT[s]
+            return struct.unpack_from(f, self._data, offset + 1)[0], offset + 1 + s
+
+        return tokenL, offset
+
+    def _read_ints(self, offset, n, size):
+        if size in _BINARY_FORMAT:
+            return struct.unpack_from('>' + _BINARY_FORMAT[size] * n, self._data, offset)
+        data = self._data[offset:offset + size * n]
+        if not size or len(data) != size * n:
+            raise InvalidFileException()
+        return tuple(int.from_bytes(data[i: i + size], 'big')
+                     for i in range(0, size * n, size))
+
+    def _read_object(self, ref):
+        """
+        read the object by reference.
+        May recursively read sub-objects (content of an array/dict/set)
+        """
+        result = self._objects[ref]
+        if result is not _undefined:
+            return result
+
+        data = self._data
+        offset = self._object_offsets[ref]
+        token = data[offset]
+        offset += 1
+        tokenH, tokenL = token & 0xF0, token & 0x0F
+
+        if tokenH == 0x50:  # ascii string - checked first as the most common
+            s, offset = self._get_size(tokenL, offset)
+            result = data[offset:offset + s].decode('ascii')
+            if self._intern:
+                result = self._intern(result)
+
+        elif tokenH == 0xD0:  # dict
+            s, offset = self._get_size(tokenL, offset)
+            key_refs = self._read_ints(offset, s, self._ref_size)
+            obj_refs = self._read_ints(offset + s * self._ref_size, s, self._ref_size)
+            result = self._dict_type()
+            self._objects[ref] = result
+            for k, o in zip(key_refs, obj_refs):
+                key = self._read_object(k)
+                if _Data is not None and isinstance(key, _Data):
+                    key = key.data
+                if self._intern and isinstance(key, str):
+                    key = self._intern(key, force=True)
                 result[key] = self._read_object(o)
 
+        elif tokenH == 0xA0:  # array
+            s, offset = self._get_size(tokenL, offset)
+            obj_refs = self._read_ints(offset, s, self._ref_size)
+            result = []
+            self._objects[ref] = result
+            result.extend(self._read_object(x) for x in obj_refs)
+
+        elif tokenH == 0x10:  # int
+            result = int.from_bytes(data[offset:offset + (1 << tokenL)], 'big')
+            if tokenL >= 3: # Signed - adjust
+                result = result-((result & 0x8000000000000000) << 1)
+
+        elif token == 0x00:
+            result = None
+
+        elif token == 0x08:
+            result = False
+
+        elif token == 0x09:
+            result = True
+
+        elif token == 0x0f:
+            result = b''
+
+        elif token == 0x22: # real
+            result = struct.unpack_from('>f', data, offset)[0]
+
+        elif token == 0x23: # real
+            result = struct.unpack_from('>d', data, offset)[0]
+
+        elif token == 0x33:  # date
+            f = struct.unpack_from('>d', data, offset)[0]
+            # timestamp 0 of binary plists corresponds to 1/1/2001
+            # (year of Mac OS X 10.0), instead of 1/1/1970.
+            result = (datetime.datetime(2001, 1, 1) +
+                      datetime.timedelta(seconds=f))
+
+        elif tokenH == 0x40:  # data
+            s, offset = self._get_size(tokenL, offset)
+            result = data[offset:offset + s]
+            if not self._use_builtin_types and _Data is not None:
+                result = _Data(result)
+
+        elif tokenH == 0x60:  # unicode string
+            s, offset = self._get_size(tokenL, offset)
+            result = data[offset:offset + s * 2].decode('utf-16be')
+            if self._intern:
+                result = self._intern(result)
+
+        elif tokenH == 0x80:  # UID
+            # used by Key-Archiver plist files
+            result = UID(int.from_bytes(data[offset:offset + 1 + tokenL], 'big'))
+
         else:
             raise InvalidFileException()
 
         self._objects[ref] = result
         return result
 
+# Bound once - load() never checks the running version per token
+_BinaryParser = _BinaryPlistParserPy3 if _PY3 else _BinaryPlistParser
+
 def _count_to_size(count):
     if count < 1 << 8:
         return 1
@@ -467,6 +771,22 @@ def _count_to_size(count):
 
 _scalars = (str, int, float, datetime.datetime, bytes)
 
+# Exact types that can skip the isinstance() chain when building objtable keys
+_fast_scalars = frozenset(_scalars+(bool,))
+_fast_containers = frozenset((dict, list, tuple))
+
+# Resolve the optional plistlib types once instead of per object
+_UID_types = (UID,) if not hasattr(plistlib, "UID") else (UID, plistlib.UID)
+# Values written as <data> - on Python 2, str is a string, so only Data counts
+_data_types = ((bytes, bytearray) if _PY3 else ()) + ((_Data,) if _Data is not None else ())
+_int_types = (int,) if _PY3 else (int, long)
+# The type that gets the string fast path in _write_object - unicode never
+# equals str on Python 2, so this only ever matches there if _PY3
+_str_type = str if _PY3 else None
+
+# Pending output is handed to the underlying file once it grows past this
+_WRITE_BUFFER_SIZE = 1 << 16
+
 class _BinaryPlistWriter (object):
     def __init__(self, fp, sort_keys, skipkeys):
         self._fp = fp
@@ -485,6 +805,10 @@ class _BinaryPlistWriter (object):
         self._objtable = {}
         self._objidtable = {}
 
+        # Filtered and sorted (keys, values) for each dict - keyed by id(dict)
+        # so _write_object doesn't need to sort everything a second time
+        self._dict_items = {}
+
         # Create list of all objects in the plist
         self._flatten(value)
 
@@ -496,8 +820,13 @@ class _BinaryPlistWriter (object):
 
         self._ref_format = _BINARY_FORMAT[self._ref_size]
 
+        # All output goes through a local buffer - offsets are tracked here
+        # rather than asking the file with tell() for every object
+        self._buf = bytearray()
+        self._flushed = 0
+
         # Write file header
-        self._fp.write(b'bplist00')
+        self._buf += b'bplist00'
 
         # Write object list
         for obj in self._objlist:
@@ -505,10 +834,10 @@ class _BinaryPlistWriter (object):
 
         # Write refnum->object offset table
         top_object = self._getrefnum(value)
-        offset_table_offset = self._fp.tell()
+        offset_table_offset = self._flushed + len(self._buf)
         offset_size = _count_to_size(offset_table_offset)
         offset_format = '>' + _BINARY_FORMAT[offset_size] * num_objects
-        self._fp.write(struct.pack(offset_format, *self._object_offsets))
+        self._buf += struct.pack(offset_format, *self._object_offsets)
 
         # Write trailer
         sort_version = 0
@@ -516,32 +845,50 @@ class _BinaryPlistWriter (object):
             sort_version, offset_size, self._ref_size, num_objects,
             top_object, offset_table_offset
         )
-        self._fp.write(struct.pack('>5xBBBQQQ', *trailer))
+        self._buf += struct.pack('>5xBBBQQQ', *trailer)
+        self._flush()
+        self._dict_items = {}
+
+    def _flush(self):
+        if self._buf:
+            self._fp.write(bytes(self._buf))
+            self._flushed += len(self._buf)
+            self._buf = bytearray()
+
+    def _scalar_key(self, value):
+        # Returns the objtable key for hashable scalars, or None for
+        # containers (and anything else tracked by id)
+        t = type(value)
+        if t in _fast_scalars or isinstance(value, _scalars):
+            return (t, value)
+        if _Data is not None and isinstance(value, _Data):
+            return (type(value.data), value.data)
+        return None
 
     def _flatten(self, value):
         # First check if the object is in the object table, not used for
         # containers to ensure that two subcontainers with the same contents
         # will be serialized as distinct values.
-        if isinstance(value, _scalars):
-            if (type(value), value) in self._objtable:
-                return
-
-        elif hasattr(plistlib, "Data") and isinstance(value, plistlib.Data):
-            if (type(value.data), value.data) in self._objtable:
+        t = type(value)
+        if t in _fast_scalars:
+            key = (t, value)
+        elif t in _fast_containers:
+            key = None
+        else:
+            key = self._scalar_key(value)
+        if key is not None:
+            if key in self._objtable:
                 return
-
         elif id(value) in self._objidtable:
             return
 
         # Add to objectreference map
         refnum = len(self._objlist)
         self._objlist.append(value)
-        if isinstance(value, _scalars):
-            self._objtable[(type(value), value)] = refnum
-        elif hasattr(plistlib, "Data") and isinstance(value, plistlib.Data):
-            self._objtable[(type(value.data), value.data)] = refnum
-        else:
-            self._objidtable[id(value)] = refnum
+        if key is not None:
+            self._objtable[key] = refnum
+            return
+        self._objidtable[id(value)] = refnum
 
         # And finally recurse into containers
         if isinstance(value, dict):
@@ -558,6 +905,7 @@ class _BinaryPlistWriter (object):
                     raise TypeError("keys must be strings")
                 keys.append(k)
                 values.append(v)
+            self._dict_items[id(value)] = (keys, values)
 
             for o in itertools.chain(keys, values):
                 self._flatten(o)
@@ -567,72 +915,89 @@ class _BinaryPlistWriter (object):
                 self._flatten(o)
 
     def _getrefnum(self, value):
-        if isinstance(value, _scalars):
-            return self._objtable[(type(value), value)]
-        elif hasattr(plistlib, "Data") and isinstance(value, plistlib.Data):
-            return self._objtable[(type(value.data), value.data)]
-        else:
-            return self._objidtable[id(value)]
+        t = type(value)
+        if t in _fast_scalars:
+            return self._objtable[(t, value)]
+        key = None if t in _fast_containers else self._scalar_key(value)
+        if key is not None:
+            return self._objtable[key]
+        return self._objidtable[id(value)]
 
     def _write_size(self, token, size):
         if size < 15:
-            self._fp.write(struct.pack('>B', token | size))
+            self._buf.append(token | size)
 
         elif size < 1 << 8:
-            self._fp.write(struct.pack('>BBB', token | 0xF, 0x10, size))
+            self._buf += struct.pack('>BBB', token | 0xF, 0x10, size)
 
         elif size < 1 << 16:
-            self._fp.write(struct.pack('>BBH', token | 0xF, 0x11, size))
+            self._buf += struct.pack('>BBH', token | 0xF, 0x11, size)
 
         elif size < 1 << 32:
-            self._fp.write(struct.pack('>BBL', token | 0xF, 0x12, size))
+            self._buf += struct.pack('>BBL', token | 0xF, 0x12, size)
 
         else:
-            self._fp.write(struct.pack('>BBQ', token | 0xF, 0x13, size))
+            self._buf += struct.pack('>BBQ', token | 0xF, 0x13, size)
+
+    def _write_refs(self, refs):
+        self._buf += struct.pack('>' + self._ref_format * len(refs), *refs)
 
     def _write_object(self, value):
         ref = self._getrefnum(value)
-        self._object_offsets[ref] = self._fp.tell()
-        if value is None:
-            self._fp.write(b'\x00')
+        if len(self._buf) >= _WRITE_BUFFER_SIZE:
+            self._flush()
+        self._object_offsets[ref] = self._flushed + len(self._buf)
+        buf = self._buf
+        if type(value) is _str_type:
+            # Strings make up the bulk of most plists - check them first
+            try:
+                t = value.encode('ascii')
+                self._write_size(0x50, len(value))
+            except UnicodeEncodeError:
+                t = value.encode('utf-16be')
+                self._write_size(0x60, len(t) // 2)
+            buf += t
+
+        elif value is None:
+            buf += b'\x00'
 
         elif value is False:
-            self._fp.write(b'\x08')
+            buf += b'\x08'
 
         elif value is True:
-            self._fp.write(b'\x09')
+            buf += b'\x09'
 
         elif isinstance(value, int):
             if value < 0:
                 try:
-                    self._fp.write(struct.pack('>Bq', 0x13, value))
+                    buf += struct.pack('>Bq', 0x13, value)
                 except struct.error:
                     raise OverflowError(value) # from None
             elif value < 1 << 8:
-                self._fp.write(struct.pack('>BB', 0x10, value))
+                buf += struct.pack('>BB', 0x10, value)
             elif value < 1 << 16:
-                self._fp.write(struct.pack('>BH', 0x11, value))
+                buf += struct.pack('>BH', 0x11, value)
             elif value < 1 << 32:
-                self._fp.write(struct.pack('>BL', 0x12, value))
+                buf += struct.pack('>BL', 0x12, value)
             elif value < 1 << 63:
-                self._fp.write(struct.pack('>BQ', 0x13, value))
+                buf += struct.pack('>BQ', 0x13, value)
             elif value < 1 << 64:
-                self._fp.write(b'\x14' + value.to_bytes(16, 'big', signed=True))
+                buf += b'\x14' + value.to_bytes(16, 'big', signed=True)
             else:
                 raise OverflowError(value)
 
         elif isinstance(value, float):
-            self._fp.write(struct.pack('>Bd', 0x23, value))
+            buf += struct.pack('>Bd', 0x23, value)
 
         elif isinstance(value, datetime.datetime):
             f = (value - datetime.datetime(2001, 1, 1)).total_seconds()
-            self._fp.write(struct.pack('>Bd', 0x33, f))
+            buf += struct.pack('>Bd', 0x33, f)
 
-        elif (_check_py3() and isinstance(value, (bytes, bytearray))) or (hasattr(plistlib, "Data") and isinstance(value, plistlib.Data)):
+        elif isinstance(value, _data_types):
             if not isinstance(value, (bytes, bytearray)):
                 value = value.data # Unpack it
             self._write_size(0x40, len(value))
-            self._fp.write(value)
+            buf += value
 
         elif isinstance(value, basestring):
             try:
@@ -641,48 +1006,165 @@ class _BinaryPlistWriter (object):
             except UnicodeEncodeError:
                 t = value.encode('utf-16be')
                 self._write_size(0x60, len(t) // 2)
-            self._fp.write(t)
+            buf += t
 
-        elif isinstance(value, UID) or (hasattr(plistlib,"UID") and isinstance(value, plistlib.UID)):
+        elif isinstance(value, _UID_types):
             if value.data < 0:
                 raise ValueError("UIDs must be positive")
             elif value.data < 1 << 8:
-                self._fp.write(struct.pack('>BB', 0x80, value))
+                buf += struct.pack('>BB', 0x80, value)
             elif value.data < 1 << 16:
-                self._fp.write(struct.pack('>BH', 0x81, value))
+                buf += struct.pack('>BH', 0x81, value)
             elif value.data < 1 << 32:
-                self._fp.write(struct.pack('>BL', 0x83, value))
+                buf += struct.pack('>BL', 0x83, value)
             # elif value.data < 1 << 64:
-            #    self._fp.write(struct.pack('>BQ', 0x87, value))
+            #    buf += struct.pack('>BQ', 0x87, value)
             else:
                 raise OverflowError(value)
 
         elif isinstance(value, (list, tuple)):
             refs = [self._getrefnum(o) for o in value]
-            s = len(refs)
-            self._write_size(0xA0, s)
-            self._fp.write(struct.pack('>' + self._ref_format * s, *refs))
+            self._write_size(0xA0, len(refs))
+            self._write_refs(refs)
 
         elif isinstance(value, dict):
-            keyRefs, valRefs = [], []
-
-            if self._sort_keys:
-                rootItems = sorted(value.items())
-            else:
-                rootItems = value.items()
-
-            for k, v in rootItems:
-                if not isinstance(k, basestring):
-                    if self._skipkeys:
-                        continue
-                    raise TypeError("keys must be strings")
-                keyRefs.append(self._getrefnum(k))
-                valRefs.append(self._getrefnum(v))
-
-            s = len(keyRefs)
-            self._write_size(0xD0, s)
-            self._fp.write(struct.pack('>' + self._ref_format * s, *keyRefs))
-            self._fp.write(struct.pack('>' + self._ref_format * s, *valRefs))
+            keys, values = self._dict_items[id(value)]
+            self._write_size(0xD0, len(keys))
+            self._write_refs([self._getrefnum(k) for k in keys])
+            self._write_refs([self._getrefnum(v) for v in values])
 
         else:
             raise TypeError(value)
+
+###                    ###
+# Streaming XML Writer #
+###                    ###
+
+# Mirrors the output of plistlib's _PlistWriter, but is driven by an explicit
+# stack so it can yield as it goes - and handle arbitrarily deep values
+
+_XML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n'
+    '<plist version="1.0">\n'
+)
+
+_control_chars = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _xml_escape(text):
+    if _control_chars.search(text) is not None:
+        raise ValueError("strings can't contain control characters; use bytes instead")
+    text = text.replace("\r\n", "\n")       # convert DOS line endings
+    text = text.replace("\r", "\n")         # convert Mac line endings
+    text = text.replace("&", "&amp;")       # escape '&'
+    text = text.replace("<", "&lt;")        # escape '<'
+    text = text.replace(">", "&gt;")        # escape '>'
+    return text
+
+class _XMLPlistWriter (object):
+    def __init__(self, sort_keys=True, skipkeys=False, chunk_size=None):
+        self._sort_keys = sort_keys
+        self._skipkeys = skipkeys
+        self._chunk_size = chunk_size or _WRITE_BUFFER_SIZE
+
+    def iter_chunks(self, value):
+        # Batches lines into roughly chunk_size pieces before encoding
+        pending = []
+        size = 0
+        for line in self._iter_lines(value):
+            pending.append(line)
+            size += len(line)
+            if size >= self._chunk_size:
+                yield "".join(pending).encode("utf-8")
+                pending = []
+                size = 0
+        if pending:
+            yield "".join(pending).encode("utf-8")
+
+    def _dict_items(self, d):
+        items = sorted(d.items()) if self._sort_keys else d.items()
+        for key, value in items:
+            if not isinstance(key, basestring):
+                if self._skipkeys:
+                    continue
+                raise TypeError("keys must be strings")
+            yield key, value
+
+    def _array_items(self, a):
+        for value in a:
+            yield None, value
+
+    def _iter_lines(self, value):
+        yield _XML_HEADER
+        # Each stack entry is an iterator of (key, value) pairs - with key
+        # being None for array members - and the element it closes
+        stack = [(self._array_items((value,)), None)]
+        indent = 0
+        while stack:
+            try:
+                key, value = next(stack[-1][0])
+            except StopIteration:
+                tag = stack.pop()[1]
+                if tag:
+                    indent -= 1
+                    yield "\t"*indent + "</{}>\n".format(tag)
+                continue
+            pad = "\t"*indent
+            if key is not None:
+                yield pad + "<key>" + _xml_escape(key) + "</key>\n"
+            if isinstance(value, _data_types):
+                if not isinstance(value, (bytes, bytearray)):
+                    value = value.data # Unpack it
+                maxlinelength = max(16, 76 - len(" "*8*indent))
+                maxbinsize = (maxlinelength//4)*3
+                yield pad + "<data>\n"
+                for i in range(0, len(value), maxbinsize):
+                    yield pad + binascii.b2a_base64(value[i:i+maxbinsize]).decode("ascii")
+                yield pad + "</data>\n"
+            elif isinstance(value, basestring):
+                yield pad + "<string>" + _xml_escape(value) + "</string>\n"
+            elif value is True:
+                yield pad + "<true/>\n"
+            elif value is False:
+                yield pad + "<false/>\n"
+            elif isinstance(value, _int_types):
+                if not -1 << 63 <= value < 1 << 64:
+                    raise OverflowError(value)
+                yield pad + "<integer>{}</integer>\n".format(int(value))
+            elif isinstance(value, float):
+                yield pad + "<real>{}</real>\n".format(repr(value))
+            elif isinstance(value, datetime.datetime):
+                yield pad + "<date>{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z</date>\n".format(
+                    value.year, value.month, value.day,
+                    value.hour, value.minute, value.second
+                )
+            elif isinstance(value, dict):
+                if not value:
+                    yield pad + "<dict/>\n"
+                    continue
+                yield pad + "<dict>\n"
+                indent += 1
+                stack.append((self._dict_items(value), "dict"))
+            elif isinstance(value, (list, tuple)):
+                if not value:
+                    yield pad + "<array/>\n"
+                    continue
+                yield pad + "<array>\n"
+                indent += 1
+                stack.append((self._array_items(value), "array"))
+            else:
+                # Anything else iterable is treated as a lazy array - peek at
+                # the first item so empty iterators still produce <array/>
+                try:
+                    items = iter(value)
+                except TypeError:
+                    raise TypeError("unsupported type: {}".format(type(value)))
+                try:
+                    first = next(items)
+                except StopIteration:
+                    yield pad + "<array/>\n"
+                    continue
+                yield pad + "<array>\n"
+                indent += 1
+                stack.append((self._array_items(itertools.chain((first,), items)), "array"))
+        yield "</plist>\n"
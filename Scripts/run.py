@@ -1,4 +1,5 @@
-import sys, subprocess, time, threading, shlex
+import sys, os, subprocess, time, threading, shlex
+from . import metrics
 try:
     from Queue import Queue, Empty
 except:
@@ -80,7 +81,7 @@ class Run:
             return value.decode(encoding,errors)
         return value
 
-    def _run_command(self, comm, shell = False):
+    def _run_command(self, comm, shell = False, raw = False):
         c = None
         try:
             if shell and type(comm) is list:
@@ -91,8 +92,23 @@ class Run:
             c = p.communicate()
         except:
             if c == None:
-                return ("", "Command not found!", 1)
-        return (self._decode(c[0]), self._decode(c[1]), p.returncode)
+                # Keep stdout's type the same as on success
+                return (b"" if raw else "", "Command not found!", 1)
+        # raw leaves stdout as bytes for callers that parse it themselves
+        return (c[0] if raw else self._decode(c[0]), self._decode(c[1]), p.returncode)
+
+    def _record(self, args, out, seconds):
+        # Reports a finished command to the metrics registry - by the name
+        # of what was run
+        try:
+            name = os.path.basename((shlex.split(args) if isinstance(args, str) else args)[0])
+        except:
+            name = "unknown"
+        metrics.inc("run_commands_total", command=name)
+        metrics.inc("run_stdout_bytes_total", len(out[0] or ""), command=name)
+        metrics.observe("run_command_seconds", seconds, command=name)
+        if out[2] != 0:
+            metrics.inc("run_command_failures_total", command=name)
 
     def run(self, command_list, leave_on_fail = False):
         # Command list should be an array of dicts
@@ -109,6 +125,7 @@ class Run:
             stderr = comm.get("stderr", False)
             mess   = comm.get("message", None)
             show   = comm.get("show",   False)
+            raw    = comm.get("raw",    False)
             
             if not mess == None:
                 print(mess)
@@ -129,12 +146,15 @@ class Run:
             if show:
                 print(" ".join(args))
 
+            start = time.time()
             if stream:
                 # Stream it!
                 out = self._stream_output(args, shell)
             else:
                 # Just run and gather output
-                out = self._run_command(args, shell)
+                out = self._run_command(args, shell, raw)
+            self._record(args, out, time.time()-start)
+            if not stream:
                 if stdout and len(out[0]):
                     print(out[0])
                 if stderr and len(out[1]):
@@ -0,0 +1,173 @@
+import os
+from . import plist, run
+
+class DataSources:
+    def __init__(self, root = None, r = None):
+        # Reads system info from files where macOS keeps it, and only forks
+        # when there's no file to read.  Passing a root (a directory laid
+        # out like /) reads everything from there instead - which lets
+        # fixtures stand in for a live system, on any OS.
+        self.root = root or "/"
+        self.r = r or run.Run()
+
+    def is_live(self):
+        return os.path.realpath(self.root) == os.path.realpath("/")
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _load_plist(self, path):
+        try:
+            with open(path, "rb") as f:
+                return plist.load(f)
+        except:
+            return None
+
+    def get_system_version(self):
+        # Returns the SystemVersion.plist dict - falling back on a single
+        # sw_vers call if it can't be read on a live system
+        info = self._load_plist(self._path("System","Library","CoreServices","SystemVersion.plist"))
+        if isinstance(info, dict):
+            return info
+        if not self.is_live():
+            return {}
+        keys = {"ProductName":"ProductName","ProductVersion":"ProductVersion","BuildVersion":"ProductBuildVersion"}
+        info = {}
+        for line in self.r.run({"args":["sw_vers"]})[0].split("\n"):
+            if not ":" in line:
+                continue
+            key,val = line.split(":",1)
+            if key.strip() in keys:
+                info[keys[key.strip()]] = val.strip()
+        return info
+
+    def get_os_version(self):
+        # Returns the OS version as "macOS 13.4 (22F66)"
+        info = self.get_system_version()
+        prod_name  = info.get("ProductName","")
+        prod_vers  = info.get("ProductUserVisibleVersion") or info.get("ProductVersion","")
+        build_vers = info.get("ProductBuildVersion","")
+        if build_vers: build_vers = "({})".format(build_vers)
+        return " ".join([x for x in (prod_name,prod_vers,build_vers) if x])
+
+    def get_nvram(self, name):
+        # Returns the value of the passed NVRAM variable, or None if it's not
+        # set.  NVRAM has no file to read on a live system, so we ask nvram
+        # for just this variable as a plist - fixture roots keep the same
+        # plist at <root>/nvram.plist.
+        if self.is_live():
+            out = self.r.run({"args":["nvram","-x",name]})
+            if out[2] != 0:
+                return None
+            try:
+                values = plist.loads(out[0])
+            except:
+                return None
+        else:
+            values = self._load_plist(self._path("nvram.plist"))
+        if not isinstance(values, dict):
+            return None
+        # Some firmware reports the variable with its GUID prefixed
+        for key,val in values.items():
+            if key == name or key.endswith(":"+name):
+                if hasattr(val, "data"):
+                    val = val.data # plistlib.Data on python 2
+                if isinstance(val, bytes):
+                    val = val.decode("utf-8", errors="ignore")
+                return val.rstrip("\x00") if isinstance(val, str) else val
+        return None
+
+    def get_boot_args(self):
+        return self.get_nvram("boot-args")
+
+    def get_kextstat(self):
+        # Returns the loaded kext list - falling back on kmutil showloaded for
+        # newer macOS versions where kextstat may be unavailable.  Fixture
+        # roots keep the same output at <root>/kextstat.txt.
+        if not self.is_live():
+            try:
+                with open(self._path("kextstat.txt"),"rb") as f:
+                    return f.read().decode("utf-8", errors="ignore")
+            except:
+                return ""
+        kextstat = self.r.run({"args":"kextstat"})[0]
+        if not self.parse_loaded_kexts(kextstat):
+            kextstat = self.r.run({"args":["kmutil","showloaded"]})[0]
+        return kextstat
+
+    def parse_loaded_kexts(self, text):
+        # Parses kextstat or kmutil showloaded output - both share the format:
+        # Index Refs Address Size Wired Name (Version) UUID <Linked Against>
+        # and returns a dict keyed by both bundle id and short name (the last
+        # component of the bundle id), lowercased.
+        index = {}
+        for line in text.split("\n"):
+            if not "(" in line or not ")" in line:
+                continue # Header, warnings, or blank
+            try:
+                pre,post = line.split("(",1)
+                version,post = post.split(")",1)
+                parts = pre.split()
+                bundle_id = parts[-1]
+                int(parts[0]) # Index should be numeric
+            except:
+                continue
+            uuid = post.split()[0] if post.split() and not post.split()[0].startswith("<") else None
+            kext = {
+                "bundle_id":bundle_id,
+                "name":bundle_id.split(".")[-1],
+                "version":version.strip(),
+                "index":parts[0],
+                "refs":parts[1] if len(parts) > 1 else None,
+                "address":parts[2] if len(parts) > 2 else None,
+                "uuid":uuid
+            }
+            index[bundle_id.lower()] = kext
+            # Don't let a short name clobber an existing bundle id match
+            index.setdefault(kext["name"].lower(),kext)
+        return index
+
+    def get_loaded_kexts(self):
+        return self.parse_loaded_kexts(self.get_kextstat())
+
+    def get_audio_devices(self):
+        # Returns the inputs and outputs system_profiler SPAudioDataType
+        # lists - fixture roots keep its -xml output at
+        # <root>/SPAudioDataType.xml
+        if self.is_live():
+            devs = self.r.run({"args":["system_profiler","-xml","SPAudioDataType"]})[0]
+        else:
+            try:
+                with open(self._path("SPAudioDataType.xml"),"rb") as f:
+                    devs = f.read()
+            except:
+                devs = ""
+        try:
+            xml = plist.loads(devs)
+        except:
+            xml = []
+        if not len(xml):
+            return []
+        audio_devices = []
+        if not "_items" in xml[0] or not len(xml[0]["_items"]):
+            return []
+        for x in xml[0]["_items"]:
+            if not "_items" in x:
+                continue
+            audio_devices.extend(x["_items"])
+        # Walk the list
+        dev_list = []
+        for x in audio_devices:
+            try:
+                new_item = {
+                    "name": x.get("_name","Unknown"),
+                    "out_source": x.get("coreaudio_output_source",None),
+                    "out_count": x.get("coreaudio_device_output",None),
+                    "in_source": x.get("coreaudio_input_source",None),
+                    "in_count": x.get("coreaudio_device_input",None),
+                    "type": x.get("coreaudio_device_transport",None)
+                }
+                dev_list.append(new_item)
+            except:
+                continue
+        return dev_list
@@ -0,0 +1,55 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import archive, ioquery
+
+CAPTURE = b"""+-o Root  <class IORegistryEntry, id 0x100000100, retain 24>
+  +-o PC00@0  <class IOACPIPlatformDevice, id 0x100000120, registered, matched, active, busy 0 (20 ms), retain 30>
+  | | {
+  | |   "_UID" = "0"
+  | | }
+  | |
+  | +-o HDEF@1F,3  <class IOPCIDevice, id 0x100000130, registered, matched, active, busy 0 (5 ms), retain 15>
+  |     {
+  |       "layout-id" = <0b000000>
+  |     }
+  |
+  +-o PC01@0  <class IOACPIPlatformDevice, id 0x100000220, registered, matched, active, busy 0 (20 ms), retain 30>
+    +-o HDEF@1F,3  <class IOPCIDevice, id 0x100000230, registered, matched, active, busy 0 (5 ms), retain 15>
+        {
+          "layout-id" = <0b000000>
+        }
+"""
+
+class ScanTests(unittest.TestCase):
+    def test_scan_class_lines(self):
+        starts,depths,parents = ioquery.scan_class_lines(CAPTURE)
+        self.assertEqual(depths, [0, 1, 2, 1, 2])
+        self.assertEqual(parents, [None, 0, 1, 0, 3])
+        self.assertTrue(all(CAPTURE[s:].lstrip(b" |").startswith(b"+-o ") for s in starts))
+
+class SnapshotArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.arc = archive.SnapshotArchive(self.root, max_chunk=128)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        self.arc.add("a", {"ioreg.txt":CAPTURE, "Audio.log":b"Checking kexts:\n"})
+        self.assertEqual(self.arc.snapshots(), ["a"])
+        self.assertEqual(self.arc.extract("a"), CAPTURE)
+        self.assertEqual(self.arc.extract("a", "Audio.log"), b"Checking kexts:\n")
+        # Adding the same capture again stores nothing new
+        stats = self.arc.add("b", {"ioreg.txt":CAPTURE})["stats"]
+        self.assertEqual(stats["new_chunks"], 0)
+
+    def test_invalid_name_writes_nothing(self):
+        for name in ("", ".hidden", os.path.join("a", "b")):
+            with self.assertRaises(ValueError):
+                self.arc.add(name, {"ioreg.txt":CAPTURE})
+        self.assertEqual(os.listdir(self.root), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os, sys, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import collector
+
+class NoRun:
+    def run(self, args):
+        raise AssertionError("Unexpected command: {}".format(args))
+
+class CountingEvent:
+    # Stands in for a flight's event and counts the threads waiting on it -
+    # so a test can tell every waiter has joined before the fill finishes
+    def __init__(self):
+        self.event = threading.Event()
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def set(self):
+        self.event.set()
+
+    def wait(self, timeout=None):
+        with self.lock:
+            self.waiting += 1
+        return self.event.wait(timeout)
+
+class Fill:
+    # A fetch() that blocks until released, and counts its calls
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self.value
+
+class CollectorTests(unittest.TestCase):
+    def setUp(self):
+        self.c = collector.Collector(r=NoRun())
+
+    def _get_all(self, source, fill, waiters=7):
+        # Starts a leader, then waiters once it's fetching - and only
+        # releases the fill once every waiter is waiting on it
+        results = []
+        def get():
+            try:
+                results.append(self.c.get(source, fill))
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=get)]
+        threads[0].start()
+        self.assertTrue(fill.entered.wait(5))
+        event = self.c._flights[(source, None)].event = CountingEvent()
+        for _ in range(waiters):
+            threads.append(threading.Thread(target=get))
+            threads[-1].start()
+        deadline = time.time()+5
+        while event.waiting < waiters and time.time() < deadline:
+            time.sleep(0.001)
+        return threads, results
+
+    def _finish(self, fill, threads):
+        fill.release.set()
+        for t in threads:
+            t.join(5)
+
+    def test_single_flight(self):
+        fill = Fill(value={"lilu":{"version":"1.6.7"}})
+        threads,results = self._get_all("kexts", fill)
+        self._finish(fill, threads)
+        self.assertEqual(fill.calls, 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(r is fill.value for r in results))
+        # ...and it's cached
+        self.assertIs(self.c.get("kexts", Fill()), fill.value)
+
+    def test_errors_reach_waiters_and_are_not_cached(self):
+        fill = Fill(error=ValueError("kextstat failed"))
+        threads,results = self._get_all("kexts", fill)
+        self._finish(fill, threads)
+        self.assertEqual(fill.calls, 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(r is fill.error for r in results))
+        self.assertEqual(self.c.get("kexts", lambda: "refilled"), "refilled")
+
+    def test_interrupted_fill_is_not_cached(self):
+        # os_version never expires - a None cached here would stick
+        def fetch():
+            raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            self.c.get("os_version", fetch)
+        self.assertEqual(self.c.get("os_version", lambda: "macOS 14.2 (23C64)"), "macOS 14.2 (23C64)")
+
+    def test_invalidate_during_fill(self):
+        fill = Fill(value="stale")
+        threads,results = self._get_all("boot_args", fill, waiters=1)
+        self.c.invalidate("boot_args")
+        self._finish(fill, threads)
+        # Waiters still get the fill - but it isn't cached
+        self.assertEqual(results, ["stale", "stale"])
+        self.assertEqual(self.c.get("boot_args", lambda: "fresh"), "fresh")
+
+    def test_ttl(self):
+        self.c.ttls["boot_args"] = 0
+        self.assertEqual(self.c.get("boot_args", lambda: 1), 1)
+        self.assertEqual(self.c.get("boot_args", lambda: 2), 2)
+
+if __name__ == '__main__':
+    unittest.main()
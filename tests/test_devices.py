@@ -0,0 +1,73 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import diff, fleet, ioquery
+import CheckAudio
+
+CAPTURE = """+-o Root  <class IORegistryEntry, id 0x100000100, retain 24>
+  +-o MacPro7,1  <class IOPlatformExpertDevice, id 0x100000110, registered, matched, active, busy 0 (100 ms), retain 40>
+    +-o AppleACPIPlatformExpert  <class AppleACPIPlatformExpert, id 0x100000111, registered, matched, active, busy 0 (50 ms), retain 50>
+      +-o PC00@0  <class IOACPIPlatformDevice, id 0x100000120, registered, matched, active, busy 0 (20 ms), retain 30>
+        | {
+        |   "compatible" = <"PNP0A03">
+        |   "_UID" = "0"
+        |   "name" = <"PNP0A08">
+        | }
+        |
+        +-o AppleACPIPCI  <class AppleACPIPCI, id 0x100000121, registered, matched, active, busy 0 (10 ms), retain 20>
+          +-o HDEF@1F,3  <class IOPCIDevice, id 0x100000130, registered, matched, active, busy 0 (5 ms), retain 15>
+            | {
+            |   "vendor-id" = <86800000>
+            |   "device-id" = <c8a30000>
+            |   "layout-id" = <0b000000>
+            | }
+            |
+            +-o AppleHDAController@1F,3  <class AppleHDAController, id 0x100000131, registered, matched, active, busy 0 (1 ms), retain 9>
+"""
+
+# What system_profiler SPPCIDataType reports for HDEF
+PCI_DEVICES = [{"_name":"Cannon Lake PCH cAVS","sppci_vendor-id":"0x8086","sppci_device-id":"0xa3c8"}]
+
+class DeviceRecordTests(unittest.TestCase):
+    def setUp(self):
+        # An empty fixture root - so nothing is read from this machine
+        self.root = tempfile.mkdtemp()
+        self.c = CheckAudio.CheckAudio(log_path=os.path.join(self.root,"Audio.log"), root=self.root)
+        self.c.i.pci_devices = PCI_DEVICES
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _hdef(self):
+        report = self.c.gather(sections=["devices"])
+        self.assertEqual(len(report["devices"]["HDEF"]), 1)
+        return report["devices"]["HDEF"][0]
+
+    def test_pci_name_from_capture(self):
+        # Properties come back as a LazyInfo over the raw bytes
+        self.c.i.ioreg["IOService"] = ioquery.BufferLines(CAPTURE.encode("utf-8"))
+        hdef = self._hdef()
+        self.assertEqual(hdef["pci_name"], "Cannon Lake PCH cAVS")
+        self.assertEqual(hdef["decoded"]["layout-id"], 11)
+
+    def test_pci_name_from_lines(self):
+        # ...and as a LazyLineInfo over a list of lines
+        self.c.i.ioreg["IOService"] = CAPTURE.split("\n")
+        self.assertEqual(self._hdef()["pci_name"], "Cannon Lake PCH cAVS")
+
+    def test_capture_matches_live_report(self):
+        # A report built from a saved capture of the same registry has the
+        # same device records
+        self.c.i.ioreg["IOService"] = ioquery.BufferLines(CAPTURE.encode("utf-8"))
+        live = os.path.join(self.root,"live.json")
+        with open(live,"wb") as f:
+            f.write(self.c.serialize_report(self.c.gather(sections=["devices"])))
+        capture = os.path.join(self.root,"capture.ioreg")
+        with open(capture,"wb") as f:
+            f.write(CAPTURE.encode("utf-8"))
+        self.assertEqual(fleet.load_report(capture,pci_devices=PCI_DEVICES)["devices"], self.c.gather(sections=["devices"])["devices"])
+        result = diff.diff_paths(live, capture, pci_devices=PCI_DEVICES)
+        self.assertEqual(result["sections"]["devices"], {"status":"unchanged"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os, sys, copy, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import diff
+
+REPORT = {
+    "codecs":[{"controller":"HDEF", "device_path":"PciRoot(0x0)/Pci(0x1F,0x3)", "address":0, "codec_id":0x10ec0256, "vendor_id":0x10ec, "device_id":0x0256}],
+    "kexts":{"Lilu":{"bundle_id":"as.vit9696.Lilu", "version":"1.6.7"}, "AppleHDA":None},
+    "os_version":"macOS 14.2 (23C64)",
+    "boot_args":"-v alcid=11 keepsyms=1",
+    "devices":{
+        "HDEF":[{
+            "name":"HDEF@1F,3",
+            "device_path":"PciRoot(0x0)/Pci(0x1F,0x3)",
+            "acpi_path":"/PC00@0/HDEF@1F,3",
+            "pci_name":None,
+            "drivers":["AppleHDAController"],
+            "properties":{"layout-id":"<0b000000>"},
+            "decoded":{"layout-id":11}
+        }],
+        "HDAU":[]
+    },
+    "io_devices":[]
+}
+
+class DiffReportsTests(unittest.TestCase):
+    def setUp(self):
+        self.a = copy.deepcopy(REPORT)
+        self.b = copy.deepcopy(REPORT)
+
+    def test_identical(self):
+        result = diff.diff_reports(self.a, self.b)
+        self.assertTrue(result["identical"])
+        self.assertEqual(set(s["status"] for s in result["sections"].values()), set(["unchanged"]))
+
+    def test_unchanged_section(self):
+        self.b["os_version"] = "macOS 14.3 (23D56)"
+        result = diff.diff_reports(self.a, self.b)
+        self.assertFalse(result["identical"])
+        self.assertEqual(result["sections"]["devices"], {"status":"unchanged"})
+        self.assertEqual(result["sections"]["os"], {"status":"changed", "old":"macOS 14.2 (23C64)", "new":"macOS 14.3 (23D56)"})
+
+    def test_device_property(self):
+        dev = self.b["devices"]["HDEF"][0]
+        dev["properties"]["layout-id"] = "<1c000000>"
+        dev["decoded"]["layout-id"] = 28
+        section = diff.diff_reports(self.a, self.b)["sections"]["devices"]
+        self.assertEqual(section["status"], "changed")
+        self.assertEqual(section["added"], [])
+        self.assertEqual(section["removed"], [])
+        self.assertEqual(section["changed"], [{
+            "key":"PciRoot(0x0)/Pci(0x1F,0x3)",
+            "changes":{
+                "decoded.layout-id":[11, 28],
+                "properties.layout-id":["<0b000000>", "<1c000000>"]
+            }
+        }])
+
+    def test_boot_args(self):
+        self.b["boot_args"] = "-v alcid=28 debug=0x100"
+        section = diff.diff_reports(self.a, self.b)["sections"]["boot_args"]
+        self.assertEqual(section["status"], "changed")
+        self.assertEqual(section["added"], ["alcid=28", "debug=0x100"])
+        self.assertEqual(section["removed"], ["alcid=11", "keepsyms=1"])
+
+    def test_kext_unloaded(self):
+        self.b["kexts"]["Lilu"] = None
+        section = diff.diff_reports(self.a, self.b)["sections"]["kexts"]
+        self.assertEqual(section["changed"], [{"key":"Lilu", "changes":{
+            "bundle_id":["as.vit9696.Lilu", None],
+            "loaded":[True, False],
+            "version":["1.6.7", None]
+        }}])
+
+    def test_none_and_missing_are_unchanged(self):
+        # pci_name is None on one side and missing on the other
+        del self.b["devices"]["HDEF"][0]["pci_name"]
+        result = diff.diff_reports(self.a, self.b)
+        self.assertEqual(result["sections"]["devices"], {"status":"unchanged"})
+        self.assertTrue(result["identical"])
+
+    def test_only_in_one(self):
+        del self.b["io_devices"]
+        result = diff.diff_reports(self.a, self.b)
+        self.assertEqual(result["sections"]["io"], {"status":"only in a"})
+        self.assertFalse(result["identical"])
+
+if __name__ == '__main__':
+    unittest.main()
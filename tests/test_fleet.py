@@ -0,0 +1,89 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import fleet
+import CheckAudio
+
+CAPTURE = """+-o Root  <class IORegistryEntry, id 0x100000100, retain 24>
+  +-o PC00@0  <class IOACPIPlatformDevice, id 0x100000120, registered, matched, active, busy 0 (20 ms), retain 30>
+    | {
+    |   "_UID" = "0"
+    |   "name" = <"PNP0A08">
+    | }
+    |
+    +-o HDEF@1F,3  <class IOPCIDevice, id 0x100000130, registered, matched, active, busy 0 (5 ms), retain 15>
+      +-o AppleHDAController@1F,3  <class AppleHDAController, id 0x100000131, registered, matched, active, busy 0 (1 ms), retain 9>
+        +-o IOHDACodecDevice@0  <class IOHDACodecDevice, id 0x100000140, registered, matched, active, busy 0 (1 ms), retain 8>
+            {
+              "IOHDACodecVendorID" = 283902585
+              "IOHDACodecAddress" = 0
+            }
+"""
+
+class AnalyzeTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, name, text):
+        with open(os.path.join(self.root, name), "wb") as f:
+            f.write(text.encode("utf-8"))
+
+    def test_only_ioreg_text_counts(self):
+        self._write("machine.txt", CAPTURE)
+        self._write("Audio.log", "Locating codecs...\n - None found\n")
+        self._write("kextstat.txt", "Index Refs Address Size Wired Name (Version) UUID <Linked Against>\n")
+        results = fleet.analyze(self.root, workers=1)
+        self.assertEqual(results["captures"], 3)
+        self.assertEqual(sorted(os.path.basename(p) for p in results["errors"]), ["Audio.log", "kextstat.txt"])
+        self.assertEqual(results["codecs"], {"0x10ec:0x0279": 1})
+
+class ReportFormatTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.c = CheckAudio.CheckAudio(log_path=os.path.join(self.root, "Audio.log"), root=self.root)
+        self.report = {
+            "generated":"2024-01-01T00:00:00Z",
+            "sections":["kexts", "os"],
+            "kexts":{
+                "Lilu":{"bundle_id":"as.vit9696.Lilu", "version":"1.6.7"},
+                "AppleALC":None,
+                "WhateverGreen":None,
+                "AppleHDA":None
+            },
+            "os_version":None
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _summarize(self, fmt):
+        path = os.path.join(self.root, "report." + fmt)
+        with open(path, "wb") as f:
+            f.write(self.c.serialize_report(self.report, fmt=fmt))
+        s = fleet.summarize(path)
+        s.pop("path")
+        return s
+
+    def test_not_loaded_survives_every_format(self):
+        # Plists have no null - "not loaded" has to be spelled out
+        expected = {
+            "codecs":[],
+            "kexts":{"Lilu":"1.6.7", "AppleALC":None, "WhateverGreen":None},
+            "applehda":False
+        }
+        for fmt in ("json", "ndjson", "plist"):
+            self.assertEqual(self._summarize(fmt), expected, fmt)
+
+    def test_plist_round_trip(self):
+        path = os.path.join(self.root, "report.plist")
+        with open(path, "wb") as f:
+            f.write(self.c.serialize_report(self.report, fmt="plist"))
+        report = fleet.load_report(path)
+        self.assertIsNone(report["kexts"]["AppleHDA"])
+        self.assertEqual(report["kexts"]["Lilu"], self.report["kexts"]["Lilu"])
+
+if __name__ == '__main__':
+    unittest.main()
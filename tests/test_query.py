@@ -0,0 +1,131 @@
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import ioreg, run
+
+CAPTURE = """+-o Root  <class IORegistryEntry, id 0x100000100, retain 24>
+  +-o MacPro7,1  <class IOPlatformExpertDevice, id 0x100000110, registered, matched, active, busy 0 (100 ms), retain 40>
+    +-o AppleACPIPlatformExpert  <class AppleACPIPlatformExpert, id 0x100000111, registered, matched, active, busy 0 (50 ms), retain 50>
+      +-o PC00@0  <class IOACPIPlatformDevice, id 0x100000120, registered, matched, active, busy 0 (20 ms), retain 30>
+        | {
+        |   "compatible" = <"PNP0A03">
+        |   "_UID" = "0"
+        |   "_STA" = 15
+        | }
+        |
+        +-o AppleACPIPCI  <class AppleACPIPCI, id 0x100000121, registered, matched, active, busy 0 (10 ms), retain 20>
+          +-o HDEF@1F,3  <class IOPCIDevice, id 0x100000130, registered, matched, active, busy 0 (5 ms), retain 15>
+          | | {
+          | |   "vendor-id" = <86800000>
+          | |   "layout-id" = <0b000000>
+          | | }
+          | |
+          | +-o AppleHDAController@1F,3  <class AppleHDAController, id 0x100000131, registered, matched, active, busy 0 (1 ms), retain 9>
+          |   +-o IOHDACodecDevice@0  <class IOHDACodecDevice, id 0x100000140, registered, matched, active, busy 0 (1 ms), retain 8>
+          |       {
+          |         "IOHDACodecVendorID" = 283902585
+          |         "IOHDACodecAddress" = 0
+          |       }
+          |
+          +-o GFX0@2  <class IOPCIDevice, id 0x100000150, registered, matched, active, busy 0 (5 ms), retain 15>
+              {
+                "vendor-id" = <86800000>
+              }
+"""
+
+class FakeRun:
+    # Answers ioreg -lw0 (and ioreg -r -c/-n) from CAPTURE
+    def __init__(self):
+        self.commands = []
+
+    def run(self, args):
+        args = args["args"]
+        self.commands.append(args)
+        if not "-r" in args:
+            return (CAPTURE.encode("utf-8"),"",0)
+        flag,value = args[-2:]
+        lines = CAPTURE.split("\n")
+        out = []
+        x = 0
+        while x < len(lines):
+            line = lines[x]
+            entry = line.split("+-o ")[1] if "+-o " in line else None
+            if entry and ((flag == "-c" and "<class {},".format(value) in entry) or (flag == "-n" and entry.split("  ")[0].split("@")[0] == value)):
+                # The entry and everything below it - shifted to the left
+                pad = line.index("+-o ")
+                out.append(line[pad:])
+                x += 1
+                while x < len(lines) and not ("+-o " in lines[x] and lines[x].index("+-o ") <= pad):
+                    out.append(lines[x][pad:])
+                    x += 1
+                continue
+            x += 1
+        return ("\n".join(out).encode("utf-8"),"",0)
+
+def _query(selector, **kwargs):
+    i = ioreg.IOReg()
+    i.r = FakeRun()
+    return i, i.query(selector, **kwargs)
+
+class MissingRun(run.Run):
+    # As if ioreg isn't installed
+    def run(self, command_list, leave_on_fail=False):
+        args = command_list["args"]
+        return run.Run.run(self, dict(command_list, args=["/nonexistent/"+args[0]]+args[1:]))
+
+class TargetedQueryTests(unittest.TestCase):
+    def _compare(self, selector):
+        targeted_i,targeted = _query(selector)
+        full_i,full = _query(selector, paths=True)
+        self.assertEqual(targeted_i.plan_log[-1]["strategy"], "targeted")
+        self.assertEqual(full_i.plan_log[-1]["strategy"], "full")
+        key = lambda n: (n["id"], n["name"], n["class"], dict(n["info"]))
+        self.assertEqual([key(n) for n in targeted], [key(n) for n in full])
+        self.assertTrue(full)
+        return targeted,full
+
+    def test_class(self):
+        self._compare("class=IOPCIDevice prop:vendor-id=0x8086")
+
+    def test_descendants(self):
+        targeted,full = self._compare("name=HDEF >> class=IOHDACodecDevice")
+        # Paths are only known from the whole plane
+        self.assertEqual([n["path"] for n in targeted], [None])
+        self.assertEqual([n["depth"] for n in targeted], [None])
+        self.assertEqual([n["path"] for n in full], ["/AppleACPIPlatformExpert/PC00@0/AppleACPIPCI/HDEF@1F,3/AppleHDAController@1F,3/IOHDACodecDevice@0"])
+
+    def test_missing_ioreg(self):
+        i = ioreg.IOReg()
+        i.r = MissingRun()
+        self.assertEqual(i.query("class=IOPCIDevice"), [])
+        self.assertEqual(i.plan_log[-1]["strategy"], "targeted")
+
+    def test_ancestors_use_full_dump(self):
+        i,nodes = _query("class=IOHDACodecDevice << name=PC00")
+        self.assertEqual(i.plan_log[-1]["strategy"], "full")
+        self.assertEqual([n["name"] for n in nodes], ["PC00@0"])
+
+class PropertyMatchTests(unittest.TestCase):
+    def _names(self, selector):
+        return [n["name"] for n in _query(selector, paths=True)[1]]
+
+    def test_string(self):
+        self.assertEqual(self._names('prop:_UID="0"'), ["PC00@0"])
+
+    def test_quoted_int(self):
+        # "0" is matched by value - with or without the quotes
+        self.assertEqual(self._names("prop:_UID=0"), ["PC00@0"])
+        self.assertEqual(self._names("prop:_UID='\"0\"'"), ["PC00@0"])
+        self.assertEqual(self._names("prop:_UID=0x0"), ["PC00@0"])
+
+    def test_string_data(self):
+        self.assertEqual(self._names("prop:compatible=PNP0A03"), ["PC00@0"])
+        self.assertEqual(self._names("prop:compatible='<\"PNP0A03\">'"), ["PC00@0"])
+        self.assertEqual(self._names("prop:compatible=PNP0A08"), [])
+
+    def test_int_and_data(self):
+        self.assertEqual(self._names("prop:_STA=0xf"), ["PC00@0"])
+        self.assertEqual(self._names("prop:layout-id=11"), ["HDEF@1F,3"])
+
+if __name__ == '__main__':
+    unittest.main()
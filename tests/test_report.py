@@ -0,0 +1,34 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import CheckAudio
+
+class ReportLogTests(unittest.TestCase):
+    def setUp(self):
+        # An empty fixture root - so nothing is read from this machine
+        self.root = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.root, "Audio.log")
+        self.c = CheckAudio.CheckAudio(log_path=self.log_path, ndjson_path=os.path.join(self.root, "Audio.ndjson"), root=self.root)
+        self.c.log.echo = False
+
+    def tearDown(self):
+        self.c.log.close()
+        shutil.rmtree(self.root)
+
+    def test_log_written_before_a_crash(self):
+        # Sections gathered before the crash are already on disk
+        def crash():
+            raise RuntimeError("sw_vers went away")
+        self.c.get_os_version = crash
+        with self.assertRaises(RuntimeError):
+            self.c.main(sections=("kexts", "os", "boot_args"), interactive=False)
+        self.c.log.close()
+        with open(self.log_path) as f:
+            log = f.read()
+        self.assertIn("Locating AppleHDA...", log)
+        self.assertNotIn("Current boot-args", log)
+        with open(os.path.join(self.root, "Audio.ndjson")) as f:
+            self.assertIn('"check": "AppleHDA"', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import ioreg, ioquery
+
+def _entry(pad, name, cls, entry_id, props=None, last=False):
+    # A class line and its properties, drawn the way ioreg -lw0 does
+    lines = ["{}+-o {}  <class {}, id 0x{:x}, registered, matched, active, busy 0 (1 ms), retain 10>".format(pad, name, cls, entry_id)]
+    inner = pad+("  " if last else "| ")
+    if props:
+        lines.append(inner+"  {")
+        lines.extend(inner+'    "{}" = {}'.format(k, v) for k, v in props)
+        lines.append(inner+"  }")
+        lines.append(inner)
+    return lines
+
+def make_capture(roots=3, ports=4):
+    # PciRoots, each with bridges and devices below them - with non PCI
+    # entries in between, as in a real IOService plane
+    ids = iter(range(0x100000100, 0x100100000))
+    lines = _entry("", "Root", "IORegistryEntry", next(ids))
+    lines += _entry("  ", "AppleACPIPlatformExpert", "AppleACPIPlatformExpert", next(ids), last=True)
+    for r in range(roots):
+        last_root = r == roots-1
+        pad = "    "
+        lines += _entry(pad, "PC0{}@0".format(r), "IOACPIPlatformDevice", next(ids), [("name", '<"PNP0A08">'), ("_UID", '"{}"'.format(r))], last=last_root)
+        pad += "  " if last_root else "| "
+        lines += _entry(pad, "AppleACPIPCI", "AppleACPIPCI", next(ids), last=True)
+        pad += "  "
+        for p in range(ports):
+            last_port = p == ports-1
+            lines += _entry(pad, "RP0{}@1C,{}".format(p+1, p), "IOPCIDevice", next(ids), [("vendor-id", "<86800000>")], last=last_port)
+            child = pad+("  " if last_port else "| ")
+            lines += _entry(child, "IOPP", "IOPCI2PCIBridge", next(ids), last=True)
+            lines += _entry(child+"  ", "pci-bridge@0", "IOPCIDevice", next(ids), [("layout-id", "<0{}000000>".format(p))], last=True)
+        lines += _entry(pad, "HDEF@1F,3", "IOPCIDevice", next(ids), [("layout-id", "<0b000000>")], last=True)
+    return ("\n".join(lines)+"\n").encode("utf-8")
+
+def _plain(devices):
+    # Device dicts with their LazyInfo read out - so they compare by value
+    return dict((k, dict(v, info=dict(v["info"]))) for k, v in devices.items())
+
+class ShardedDevicesTests(unittest.TestCase):
+    def setUp(self):
+        self.capture = make_capture()
+        serial = ioreg.IOReg()
+        serial.ioreg["IOService"] = ioquery.BufferLines(self.capture)
+        self.serial = _plain(serial.get_all_devices(plane="IOService"))
+
+    def _sharded(self, lines):
+        i = ioreg.IOReg()
+        i.shard_threshold = 0
+        i.ioreg["IOService"] = lines
+        return _plain(i.get_all_devices(plane="IOService", workers=2))
+
+    def test_fixture(self):
+        self.assertEqual(len(self.serial), 3*(1+4*2+1))
+        self.assertEqual(self.serial["PciRoot(0x2)/Pci(0x1C,0x3)/Pci(0x0,0x0)"]["acpi_path"], "/PC02@0/RP04@1C,3/pci-bridge@0")
+
+    def test_bytes(self):
+        self.assertEqual(self._sharded(ioquery.BufferLines(self.capture)), self.serial)
+
+    def test_mmap(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, "ioreg.txt")
+            with open(path, "wb") as f:
+                f.write(self.capture)
+            lines = ioquery.MappedLines(path)
+            try:
+                self.assertEqual(self._sharded(lines), self.serial)
+            finally:
+                lines.close()
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import plist, sources
+
+class NoRun:
+    # Fixture roots should never fork anything
+    def run(self, args):
+        raise AssertionError("Unexpected command: {}".format(args))
+
+class DataSourcesTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.s = sources.DataSources(root=self.root, r=NoRun())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write_plist(self, value, *parts):
+        path = os.path.join(self.root, *parts)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            plist.dump(value, f)
+
+    def test_os_version(self):
+        self._write_plist({
+            "ProductName":"macOS",
+            "ProductVersion":"13.4",
+            "ProductBuildVersion":"22F66"
+        }, "System", "Library", "CoreServices", "SystemVersion.plist")
+        self.assertEqual(self.s.get_os_version(), "macOS 13.4 (22F66)")
+
+    def test_os_version_prefers_user_visible(self):
+        self._write_plist({
+            "ProductName":"Mac OS X",
+            "ProductVersion":"10.16",
+            "ProductUserVisibleVersion":"11.0",
+            "ProductBuildVersion":"20A5343i"
+        }, "System", "Library", "CoreServices", "SystemVersion.plist")
+        self.assertEqual(self.s.get_os_version(), "Mac OS X 11.0 (20A5343i)")
+
+    def test_boot_args(self):
+        # nvram -x reports the variable as data - with trailing nulls
+        self._write_plist({"boot-args":plist.wrap_data(b"-v alcid=11\x00")}, "nvram.plist")
+        self.assertEqual(self.s.get_boot_args(), "-v alcid=11")
+
+    def test_boot_args_with_guid(self):
+        self._write_plist({"7C436110-AB2A-4BBB-A880-FE41995C9F82:boot-args":"keepsyms=1"}, "nvram.plist")
+        self.assertEqual(self.s.get_boot_args(), "keepsyms=1")
+
+    def test_missing_files(self):
+        # Nothing to read - and no falling back on sw_vers/nvram either
+        self.assertEqual(self.s.get_system_version(), {})
+        self.assertEqual(self.s.get_os_version(), "")
+        self.assertIsNone(self.s.get_boot_args())
+
+    def test_unreadable_files(self):
+        with open(os.path.join(self.root, "nvram.plist"), "wb") as f:
+            f.write(b"not a plist")
+        self.assertIsNone(self.s.get_boot_args())
+
+if __name__ == '__main__':
+    unittest.main()